@@ -0,0 +1,209 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+In-process AWS access for the site-*-aws/conf.py scripts.
+
+Each stage gets one boto3 session (for the 'site-<stage>' AWS CLI profile), and each
+(stage, service) pair gets one client whose connection pool is reused by every call.
+That replaces a fork of bash and a full AWS CLI start for every single operation.
+
+Set SITE_AWS_ENDPOINT_URL (ex. http://localhost:5000 for a moto server) to talk to a
+local AWS stand-in instead of AWS. The credentials and region then come from the
+usual AWS_* environment variables instead of the profile.
+
+boto3 takes a while to import, so it is only imported once the first AWS call is made.
+'''
+import sys
+import os
+import re
+import importlib.util
+import threading
+import concurrent.futures
+
+import timeline
+
+# check for the AWS SDK (it is imported later, when needed)
+try:
+    for module in ('boto3', 'botocore'):
+        if importlib.util.find_spec(module) is None: raise ImportError("No module named '{0}'".format(module))
+except ImportError as e:
+    print ("FATAL: %s. Please follow the installation instructions at https://boto3.readthedocs.io/en/latest/guide/quickstart.html#installation" % (e))
+    sys.exit(1)
+
+boto3 = None
+botocore = None
+
+def sdk():
+    '''
+    Import the AWS SDK (boto3 and botocore), the first time it is needed
+    '''
+    global boto3, botocore
+    if boto3 is not None: return
+    import botocore.config
+    import botocore.exceptions
+    import boto3
+
+def __getattr__(name):
+    # what AWS reports for a failed operation; the AWS CLI printed exactly str(e)
+    if name == 'ClientError':
+        sdk()
+        return botocore.exceptions.ClientError
+    raise AttributeError("module '{0}' has no attribute '{1}'".format(__name__, name))
+
+# enough connections for several concurrent requests to the same service
+MAX_POOL_CONNECTIONS = 20
+
+# how many AWS requests a fan-out keeps in flight at once
+MAX_WORKERS = 8
+
+# do not print more than this much of any one argument (ex. a TemplateBody)
+MAX_PRINTED_ARG = 80
+
+# parameters whose values are never printed: the NoEcho ones of the templates (see hide_parameters),
+# and any that look like a secret
+SECRET_PARAMETER = re.compile('password|secret|salt|token', re.IGNORECASE)
+HIDDEN = '****'
+
+_lock = threading.Lock()
+_hidden_parameters = set()
+_sessions = dict()
+_clients = dict()
+
+def endpoint_url():
+    return os.environ.get('SITE_AWS_ENDPOINT_URL')
+
+def profile_name(stage):
+    return 'site-{0}'.format(stage)
+
+def _session(stage):
+    # boto3 sessions are not thread-safe, so only create them while holding _lock
+    s = _sessions.get(stage)
+    if s is None:
+        if endpoint_url() is None:
+            s = boto3.session.Session(profile_name=profile_name(stage))
+        else:
+            s = boto3.session.Session()
+        _sessions[stage] = s
+    return s
+
+def client(stage, service):
+    '''
+    The shared client for an AWS service (ex. 'ecs') in a stage (ex. 'dev').
+
+    Clients are thread-safe, so one client is shared by every thread.
+    '''
+    key = (stage, service)
+    with _lock:
+        c = _clients.get(key)
+        if c is None:
+            sdk()
+            config = botocore.config.Config(max_pool_connections=MAX_POOL_CONNECTIONS, retries={'max_attempts': 10, 'mode': 'standard'})
+            c = _session(stage).client(service, endpoint_url=endpoint_url(), config=config)
+            _clients[key] = c
+    return c
+
+def reset():
+    '''
+    Forget all sessions and clients (ex. after changing SITE_AWS_ENDPOINT_URL)
+    '''
+    with _lock:
+        _clients.clear()
+        _sessions.clear()
+
+def cli_name(name):
+    # list_stacks -> list-stacks
+    return name.replace('_', '-')
+
+def hide_parameters(keys):
+    '''
+    Never print the values of these stack parameters (ex. those with NoEcho in a template)
+    '''
+    with _lock:
+        _hidden_parameters.update(keys)
+
+def hidden(key):
+    return key in _hidden_parameters or SECRET_PARAMETER.search(key) is not None
+
+def mask(val):
+    '''
+    The argument with the values of the hidden stack parameters masked
+    '''
+    if isinstance(val, list): return [mask(v) for v in val]
+    if not isinstance(val, dict): return val
+    if 'ParameterKey' in val and 'ParameterValue' in val and hidden(val['ParameterKey']):
+        return dict(val, ParameterValue=HIDDEN)
+    return dict((k, mask(v)) for (k, v) in val.items())
+
+def describe_args(kwargs):
+    s = ''
+    for key, val in sorted(kwargs.items()):
+        val = str(mask(val))
+        if len(val) > MAX_PRINTED_ARG: val = val[:MAX_PRINTED_ARG] + '...'
+        s += ' --{0} {1}'.format(key, val)
+    return s
+
+def trace_args(stage, kwargs):
+    # what a trace shows about a call, besides its name
+    args = {'stage': stage}
+    if 'StackName' in kwargs: args['stack'] = kwargs['StackName']
+    return args
+
+def response_bytes(response):
+    # the size of the response body as AWS sent it, if it says
+    headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    try:
+        return int(headers.get('content-length'))
+    except (TypeError, ValueError):
+        return None
+
+def call(stage, service, operation, quiet=False, **kwargs):
+    '''
+    Run one AWS operation, like 'aws --profile site-<stage> <service> <operation>' would.
+
+    The operation is the boto3 name (ex. 'list_stacks'), and the keyword arguments are the
+    boto3 request parameters. The parsed response is returned; failures raise ClientError.
+    quiet does not print the command (ex. when polling).
+    '''
+    if not quiet: print('aws --profile {0} {1} {2}{3}'.format(profile_name(stage), service, cli_name(operation), describe_args(kwargs)))
+    with timeline.span('aws', '{0} {1}'.format(service, cli_name(operation)), **trace_args(stage, kwargs)) as s:
+        try:
+            response = getattr(client(stage, service), operation)(**kwargs)
+        except botocore.exceptions.ClientError as e:
+            s.args['error'] = e.response.get('Error', {}).get('Code')
+            raise
+        s.args['bytes'] = response_bytes(response)
+    return response
+
+def paginate(stage, service, operation, quiet=False, **kwargs):
+    '''
+    Like call(), but yield the responses one page at a time.
+
+    The next page is only fetched when the caller asks for it, so a caller that stops early
+    does not download the remaining pages. quiet does not print the command (ex. when polling).
+    '''
+    if not quiet: print('aws --profile {0} {1} {2}{3}'.format(profile_name(stage), service, cli_name(operation), describe_args(kwargs)))
+    pages = iter(client(stage, service).get_paginator(operation).paginate(**kwargs))
+    while True:
+        # only the fetching of each page is timed, not what the caller does with it
+        with timeline.span('aws', '{0} {1}'.format(service, cli_name(operation)), **trace_args(stage, kwargs)) as s:
+            page = next(pages, None)
+            if page is None:
+                # the end of the pages, not a request
+                s.skip = True
+            else:
+                s.args['bytes'] = response_bytes(page)
+        if page is None: return
+        yield page
+
+def fan_out(function, argslist, max_workers=MAX_WORKERS):
+    '''
+    Call function(*args) for every args in argslist, at most max_workers at a time.
+
+    The results come back in the same order as argslist, whichever call finishes first.
+    If calls raise, the exception of the earliest of them in argslist is re-raised once all the calls are done.
+    '''
+    argslist = list(argslist)
+    if len(argslist) <= 1:
+        return [function(*args) for args in argslist]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(argslist))) as executor:
+        futures = [executor.submit(function, *args) for args in argslist]
+    return [f.result() for f in futures]
@@ -0,0 +1,114 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+CloudFormation change sets: create, wait, show what they would change, execute.
+
+Waiting polls describe-change-set (less and less often while it is being created), and the
+response that says the change set is ready is also the first page of its changes, so a small
+change set is described without any more requests.
+
+A change set that would replace a resource (ex. an instance, a load balancer or a database)
+is highlighted, since a replacement usually means downtime.
+'''
+import time
+import collections
+
+import awsclient
+
+# how often a change set being created is polled
+MIN_POLL_SECS = 1
+MAX_POLL_SECS = 10
+BACKOFF = 1.5
+
+# what CloudFormation says when a change set would change nothing
+NO_CHANGES_REASONS = ["didn't contain changes", 'No updates are to be performed']
+
+# One resource change of a change set. replacement is 'True', 'False', 'Conditional' (or '' for Add and Remove).
+ResourceChange = collections.namedtuple('ResourceChange', ['action', 'resource', 'resourcetype', 'replacement', 'causes'])
+
+# What a change set would do, once created. status is CREATE_COMPLETE, FAILED or NO_CHANGES.
+ChangeSet = collections.namedtuple('ChangeSet', ['stack', 'name', 'status', 'reason', 'changes'])
+
+def create(stage, stack, name, **params):
+    '''
+    Start creating a change set (params are those of create-stack, like TemplateBody and Parameters)
+    '''
+    return awsclient.call(stage, 'cloudformation', 'create_change_set', StackName=stack, ChangeSetName=name, **params)
+
+def resource_change(change):
+    rc = change['ResourceChange']
+    # what makes the resource change (ex. the properties, or a parameter), without repeats
+    causes = []
+    for detail in rc.get('Details', []):
+        target = detail.get('Target', dict())
+        cause = target.get('Name') or target.get('Attribute') or detail.get('ChangeSource')
+        if cause is not None and cause not in causes: causes.append(cause)
+    return ResourceChange(rc['Action'], rc['LogicalResourceId'], rc['ResourceType'], rc.get('Replacement', ''), causes)
+
+def wait(stage, stack, name):
+    '''
+    Wait for a change set to be created, and return it (a ChangeSet) with all its changes
+    '''
+    print('Waiting for the change set {0} of {1} ...'.format(name, stack))
+    interval = MIN_POLL_SECS
+    while True:
+        output = awsclient.call(stage, 'cloudformation', 'describe_change_set', quiet=True, StackName=stack, ChangeSetName=name)
+        if output['Status'] in ['CREATE_COMPLETE', 'FAILED']: break
+        time.sleep(interval)
+        interval = min(MAX_POLL_SECS, interval * BACKOFF)
+
+    reason = output.get('StatusReason', '')
+    if output['Status'] == 'FAILED':
+        status = 'NO_CHANGES' if any(r in reason for r in NO_CHANGES_REASONS) else 'FAILED'
+        return ChangeSet(stack, name, status, reason, [])
+
+    # the last response was the first page of changes
+    changes = [resource_change(c) for c in output.get('Changes', [])]
+    while output.get('NextToken'):
+        output = awsclient.call(stage, 'cloudformation', 'describe_change_set', quiet=True, StackName=stack, ChangeSetName=name, NextToken=output['NextToken'])
+        changes.extend(resource_change(c) for c in output.get('Changes', []))
+    return ChangeSet(stack, name, output['Status'], reason, changes)
+
+def create_and_wait(stage, stack, name, **params):
+    '''
+    create() then wait(); a change set that cannot be created at all is a FAILED ChangeSet
+    '''
+    try:
+        create(stage, stack, name, **params)
+    except awsclient.ClientError as e:
+        return ChangeSet(stack, name, 'FAILED', str(e), [])
+    return wait(stage, stack, name)
+
+def replacements(changeset):
+    '''
+    The changes that replace (or may replace) a resource
+    '''
+    return [c for c in changeset.changes if c.action == 'Modify' and c.replacement in ['True', 'Conditional']]
+
+def render(changeset):
+    '''
+    The change set as lines of text: one line per resource, replacements first and marked with '!'
+    '''
+    if changeset.status != 'CREATE_COMPLETE':
+        return ['{0}: {1} {2}'.format(changeset.stack, changeset.status, changeset.reason)]
+
+    def mark(c):
+        if c.action == 'Add': return '+'
+        if c.action == 'Remove': return '-'
+        if c.replacement == 'True': return '!'
+        if c.replacement == 'Conditional': return '?'
+        return '~'
+    order = {'!': 0, '?': 1, '-': 2, '~': 3, '+': 4}
+    lines = []
+    counts = collections.Counter()
+    for c in sorted(changeset.changes, key=lambda c: (order[mark(c)], c.resource)):
+        m = mark(c)
+        counts[m] += 1
+        causes = ' ({0})'.format(', '.join(c.causes)) if len(c.causes) > 0 else ''
+        lines.append('  {0} {1:<40} {2:<40}{3}'.format(m, c.resource, c.resourcetype, causes))
+    summary = '{0}: {1} to add, {2} to modify, {3} to remove'.format(changeset.stack, counts['+'], counts['~'] + counts['!'] + counts['?'], counts['-'])
+    if counts['!'] + counts['?'] > 0:
+        summary += '; REPLACES {0} resource(s), {1} more maybe (! and ?) - expect downtime'.format(counts['!'], counts['?'])
+    return [summary] + lines
+
+def execute(stage, stack, name):
+    return awsclient.call(stage, 'cloudformation', 'execute_change_set', StackName=stack, ChangeSetName=name)
@@ -0,0 +1,571 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+The conf.py menu and command line, for every flavor.
+
+ConfigMenu creates, updates and promotes the stacks of one type of a flavor in a stage, from a
+text menu. Each site-*-aws/conf.py only says which flavor it deploys and what it does differently
+(ex. whether drush runs with a terminal, or more actions on a compute stack), and calls main().
+'''
+import sys
+import time
+import random
+import readline
+import traceback
+from datetime import datetime
+
+import awsclient
+import changesets
+import deployplan
+import flavors
+import inventory
+import jobs
+import menus
+import preflight
+import promote
+import rolling
+import stackconfig
+import stackevents
+import templates
+import timeline
+
+# import a text menu library
+try:
+    from cursesmenu import CursesMenu
+    from cursesmenu.items import FunctionItem, SubmenuItem, CommandItem, ExitItem
+except ImportError as e:
+    print ("FATAL: %s. Please follow the installation instructions at http://curses-menu.readthedocs.io/en/latest/installation.html" % (e))
+    sys.exit(1)
+
+# stop 'terminal messed up when the application dies without restoring the terminal to its previous state'
+import curses
+from curses import wrapper
+
+# import a file configuration library
+try:
+    import yaml
+except ImportError as e:
+    print ("FATAL: %s. Please follow the installation instructions at http://pyyaml.org/wiki/PyYAML#DownloadandInstallation" % (e))
+    sys.exit(1)
+
+autogen_params = stackconfig.AUTOGEN_PARAMS
+
+# We cannot update with the stacks in some states
+updatable_statuses = stackconfig.UPDATABLE_STATUSES
+
+USAGE = """usage: conf.py (dev|prod) network|database|compute [--refresh]
+       conf.py (dev|prod) deploy [--environments N] [--yes] [--refresh] [all | STACK ...]"""
+
+def rlinput(prompt, defaultval=''):
+   readline.set_startup_hook(lambda: readline.insert_text(defaultval))
+   try:
+      return input(prompt)
+   finally:
+      readline.set_startup_hook()
+
+class StacksSubmenuItem(SubmenuItem):
+    """
+    Opens the stacks menu, filling it (which needs the list of stacks from AWS) the first time
+    """
+
+    def __init__(self, text, submenu, fill):
+        super(StacksSubmenuItem, self).__init__(text, submenu)
+        self.fill = fill
+
+    def action(self):
+        if self.fill is not None:
+            # like a FunctionItem, show what is printed while fetching
+            curses.reset_shell_mode()
+            try:
+                self.fill(self.submenu)
+                self.fill = None
+            finally:
+                curses.reset_prog_mode()
+        self.submenu.start()
+
+class ConfigMenu(stackconfig.StackConfig):
+    """
+    Configuration menu
+    """
+
+    # whether drush runs with a terminal during a promote, so the operator can answer its questions
+    interactive = False
+
+    def __init__(self, flavor, preferencesfile, stage, stacktype, cloudparams, refresh=False, new_secrets=True):
+        super(ConfigMenu, self).__init__(flavor, stage, stacktype, stackconfig.load_preferences(preferencesfile), cloudparams, new_secrets=new_secrets)
+        self.inventory = inventory.StackInventory(self.awsstage, flavor.short, flavor.long)
+        if refresh: self.inventory.invalidate()
+        # stack creates and updates can run in the background, while the menu stays usable
+        self.jobs = jobs.JobManager('{0}.{1}'.format(flavor.long, self.awsstage))
+        self.jobs_ended = 0
+        self.background = False
+        self.preferencesfile = preferencesfile
+        self.parameters_menu = self.construct_parameters_menu(cloudparams)
+        self.stacks_menu = self.construct_stacks_menu(cloudparams)
+
+    def change_param(self, key):
+        if key in self.prefs['Parameters']: s = rlinput('--> %s: ' % (key,), self.prefs['Parameters'][key])
+        else: s = rlinput('--> %s: ' % (key,))
+        self.prefs['Parameters'][key] = s
+
+    def should_update(self, stack, stack_params):
+        '''
+        Whether to update a stack: yes if its template or parameters changed since it was deployed, else ask
+        '''
+        digest = self.stack_digest(stack_params)
+        if self.deployed_digests([stack])[stack] != digest: return True
+        print('')
+        print('The stack {0} was deployed from this same template and these same parameters (digest {1}).'.format(stack, digest))
+        print('Updating it would only change its ModificationTimestamp, which replaces its instances and tasks for nothing.')
+        print('')
+        return input('Type "yes" to update it anyway, or just press Enter to skip it ... ').strip() == 'yes'
+
+    def follow_stack(self, stack, after=None):
+        '''
+        Show the stack's events until it is done (or the operator stops following with Ctrl-C)
+        '''
+        print('')
+        status = stackevents.follow(self.awsstage, [stack], {stack: after})[stack]
+        print('')
+        if status is None:
+            print('The stack {0} is still in progress'.format(stack))
+        elif status in stackevents.SUCCESS_STATUSES:
+            print('The stack {0} is done: {1}'.format(stack, status))
+        else:
+            print('ERROR. The stack {0} ended with {1}'.format(stack, status))
+
+    def handle_menu_error(self):
+        #e = sys.exc_info()
+        traceback.print_exc(file = sys.stdout)
+        #print(e)
+        # since we are in Curses, we need to input() to see anything
+        input('Press Enter to continue ... ')
+
+    @timeline.traced
+    def create_stack(self, network, database):
+        try:
+            if self.stacktype == 'network':
+                prefix = ''
+            elif self.stacktype == 'database':
+                if network is None:
+                    print('No network found')
+                    input('Press Enter to continue ... ')
+                    return
+                prefix = '{0}-'.format(network)
+            elif self.stacktype == 'compute':
+                if network is None or database is None:
+                    print('No database (or network) found')
+                    input('Press Enter to continue ... ')
+                    return
+                prefix = '{0}-{1}-'.format(network, database)
+            else:
+                raise Exception('Unrecognized stacktype {0}'.format(self.stacktype))
+            # the ids are random, so make sure we do not pick the name of a stack we already have
+            topology = self.inventory.topology()
+            while True:
+                stackname = '{0}-{1}-{2}{3:05d}'.format(self.flavor.short, self.stacktype, prefix, random.randrange(0,100000))
+                if topology.get(stackname) is None: break
+            if self.background:
+                self.run_in_background(deployplan.Job(stackname, self.stacktype, network, database, 'create'))
+                return
+            try:
+                output = awsclient.call(self.awsstage, 'cloudformation', 'create_stack', StackName=stackname, **self.common_stack_params(network, database), **self.template_params())
+                print(output['StackId'])
+                self.follow_stack(stackname)
+                # show its new status in the menu
+                self.inventory.update_stacks([stackname])
+                self.fill_stacks_menu(self.stacks_menu)
+            except (awsclient.ClientError, preflight.PreflightError) as e:
+                print(e)
+            input('Press Enter to continue ... ')
+        except:
+            self.handle_menu_error()
+            raise
+
+
+    @timeline.traced
+    def create_changeset_stack(self, stack, network, database):
+        self.run_changesets([(stack, network, database)])
+
+    @timeline.traced
+    def create_changesets_all(self):
+        infos = self.inventory.topology().stacks_of_type(self.stacktype, updatable_statuses)
+        self.run_changesets([(info.name, info.network, info.database) for info in infos])
+
+    def run_changesets(self, targets):
+        '''
+        Create change sets for the (stack, network, database) targets, show them, and execute them if the operator agrees
+        '''
+        try:
+            changets = datetime.utcnow().isoformat('T').translate(str.maketrans('', '', ':-.'))
+            todo = []
+            if len(targets) == 1:
+                (stack, network, database) = targets[0]
+                stack_params = self.common_stack_params(network, database)
+                if not self.should_update(stack, stack_params): return
+                todo.append((stack, '{0}-{1}'.format(stack, changets), stack_params))
+            else:
+                digests = self.deployed_digests([stack for (stack, network, database) in targets])
+                for (stack, network, database) in targets:
+                    stack_params = self.common_stack_params(network, database)
+                    if digests[stack] == self.stack_digest(stack_params):
+                        print('Skipping {0}: it was deployed from this same template and these same parameters'.format(stack))
+                        continue
+                    todo.append((stack, '{0}-{1}'.format(stack, changets), stack_params))
+            if len(todo) == 0:
+                input('Press Enter to continue ... ')
+                return
+
+            # create all the change sets at once, and wait for them together
+            created = awsclient.fan_out(lambda stack, name, stack_params: changesets.create_and_wait(self.awsstage, stack, name, **stack_params, **self.template_params()), todo)
+            print('')
+            for changeset in created:
+                for line in changesets.render(changeset): print(line)
+                print('')
+            ready = [changeset for changeset in created if changeset.status == 'CREATE_COMPLETE']
+            if len(ready) == 0:
+                input('Nothing to execute. Press Enter to continue ... ')
+                return
+
+            stacks = [changeset.stack for changeset in ready]
+            answer = input('Type "yes" to execute the change set(s) of {0}, or just press Enter to leave them for later ... '.format(', '.join(stacks)))
+            if answer.strip() != 'yes': return
+
+            # only follow the events of the change sets
+            after = dict(zip(stacks, awsclient.fan_out(lambda stack: stackevents.latest_event_id(self.awsstage, stack), [(stack,) for stack in stacks])))
+            executed = []
+            for changeset in ready:
+                try:
+                    changesets.execute(self.awsstage, changeset.stack, changeset.name)
+                    executed.append(changeset.stack)
+                except awsclient.ClientError as e:
+                    print(e)
+            if len(executed) > 0:
+                print('')
+                statuses = stackevents.follow(self.awsstage, executed, after)
+                print('')
+                for (stack, status) in statuses.items():
+                    print('{0}: {1}'.format(stack, 'still in progress' if status is None else status))
+                # show their new statuses in the menu
+                self.inventory.update_stacks(executed)
+                self.fill_stacks_menu(self.stacks_menu)
+            input('Press Enter to continue ... ')
+        except preflight.PreflightError as e:
+            print(e)
+            input('Press Enter to continue ... ')
+        except:
+            self.handle_menu_error()
+            raise
+
+    @timeline.traced
+    def update_stack(self, stack, network, database):
+        if self.background:
+            self.run_in_background(deployplan.Job(stack, self.stacktype, network, database, 'update'))
+            return
+        try:
+            try:
+                stack_params = self.common_stack_params(network, database)
+                if not self.should_update(stack, stack_params): return
+                # only follow the events of this update
+                after = stackevents.latest_event_id(self.awsstage, stack)
+                output = awsclient.call(self.awsstage, 'cloudformation', 'update_stack', StackName=stack, **stack_params, **self.template_params())
+                print(output['StackId'])
+                self.follow_stack(stack, after)
+                # show its new status in the menu
+                self.inventory.update_stacks([stack])
+                self.fill_stacks_menu(self.stacks_menu)
+            except (awsclient.ClientError, preflight.PreflightError) as e:
+                print(e)
+            input('Press Enter to continue ... ')
+        except:
+            self.handle_menu_error()
+            raise
+
+    def run_in_background(self, job):
+        '''
+        Deploy the stack of a deployplan.Job as a background job
+        '''
+        def deploy():
+            status = self.deploy_job(job)
+            # the menu shows its new status once the job has ended
+            self.inventory.update_stacks([job.stack])
+            if status not in deployplan.OK_STATUSES: raise Exception('The stack {0} ended with {1}'.format(job.stack, status))
+            print('The stack {0} is done: {1}'.format(job.stack, status))
+            return status
+        self.jobs.submit('{0} {1}'.format(job.action, job.stack), deploy)
+
+    def toggle_background(self, item):
+        self.background = not self.background
+        item.text = 'Run stack creates and updates in the background: {0}'.format('yes' if self.background else 'no')
+
+    def view_job(self, job):
+        print('{0} ({1}, {2:.0f}s), from {3}:'.format(job.name, job.status, job.elapsed(), job.logfilename))
+        print('')
+        try:
+            with open(job.logfilename, 'r') as logfile:
+                lines = logfile.readlines()
+        except FileNotFoundError:
+            lines = []
+        # the end of it, which is what fits on the screen
+        for line in lines[-40:]: print(line, end='')
+        print('')
+        input('Press Enter to continue ... ')
+
+    def tick_jobs_menu(self, menu):
+        menu.subtitle = self.jobs.summary() or 'No background jobs yet'
+        items = [FunctionItem(menus.fit(job.describe(), menu), self.view_job, [job]) for job in self.jobs.jobs]
+        menus.set_items(menu, items)
+
+    def tick_stacks_menu(self, menu):
+        menu.note = self.jobs.summary()
+        if self.jobs.ended != self.jobs_ended:
+            # show the new status of the stacks of the jobs that ended
+            self.jobs_ended = self.jobs.ended
+            self.fill_stacks_menu(menu)
+
+    @timeline.traced
+    def promote_compute_stack(self, stack, network, database):
+        '''
+        Promote with maintenance (see promote.promote)
+        '''
+        try:
+            promote.promote(self.flavor, self.stage, self.inventory.topology(), stack, network, database, self.interactive)
+        except:
+            self.handle_menu_error()
+            raise
+
+    @timeline.traced
+    def shift_compute_stack(self, stack, network, database):
+        '''
+        Promote without maintenance, for a release without database or entity schema changes (see promote.shift)
+        '''
+        try:
+            promote.shift(self.flavor, self.stage, self.inventory.topology(), stack, network, database, self.interactive)
+        except:
+            self.handle_menu_error()
+            raise
+
+    @timeline.traced
+    def upgrade_compute_stack(self, stack, network, database):
+        '''
+        Follow the steps in UPGRADING-CLUSTER.md: replace the Drupal tasks of the stack with tasks of its new task definition (see rolling.upgrade)
+        '''
+        try:
+            rolling.upgrade(self.flavor, self.stage, stack, self.interactive)
+        except:
+            self.handle_menu_error()
+            raise
+
+    def compute_actions(self):
+        '''
+        The (text, method) of each action on a compute stack; the text is formatted with the stack type
+        '''
+        return [
+            ('Promote {0} stack', self.promote_compute_stack),
+            ('Promote {0} stack without maintenance (shifting traffic)', self.shift_compute_stack),
+            ('Upgrade {0} stack in place (replacing its Drupal tasks)', self.upgrade_compute_stack),
+        ]
+
+    def construct_parameters_menu(self, cloudparameters):
+        submenu = CursesMenu("AWS CloudFormation Parameters")
+        for key,val in sorted(cloudparameters.items()):
+            # Skip over autogenerated parameters
+            if key in autogen_params: continue
+            # Otherwise show the option
+            submenu.append_item(FunctionItem(key, self.change_param, [key]))
+        return submenu
+
+    def construct_stacks_menu(self, cloudparameters):
+        # filled in when first opened (see StacksSubmenuItem), so the menu shows without waiting for AWS
+        submenu = menus.PagedMenu("AWS CloudFormation Stacks", refill=self.fill_stacks_menu, tick=self.tick_stacks_menu)
+        return submenu
+
+    @timeline.traced
+    def refresh_stacks(self):
+        try:
+            self.inventory.refresh()
+            self.fill_stacks_menu(self.stacks_menu)
+        except:
+            self.handle_menu_error()
+            raise
+
+    def stack_actions_menu(self, info):
+        '''
+        The menu of what can be done with one stack
+        '''
+        stack = info.name
+        actions = CursesMenu(stack, '{0} created {1}'.format(info.status, info.ctime))
+        actions.append_item(FunctionItem('Create changeset for {0} stack'.format(self.stacktype), self.create_changeset_stack, [stack, info.network, info.database]))
+        actions.append_item(FunctionItem('Update {0} stack directly'.format(self.stacktype), self.update_stack, [stack, info.network, info.database]))
+        if self.stacktype == 'compute':
+            for (text, action) in self.compute_actions():
+                actions.append_item(FunctionItem(text.format(self.stacktype), action, [stack, info.network, info.database]))
+        return actions
+
+    def fill_stacks_menu(self, submenu):
+        items = []
+
+        if self.stacktype == 'network':
+            items.append(FunctionItem('Create new {0} stack'.format(self.stacktype), self.create_stack, [None, None]))
+
+        topology = self.inventory.topology()
+
+        # the stacks to create a child of, then the stacks of this type, that match the filter
+        entries = []
+        parenttype = {'database': 'network', 'compute': 'database'}.get(self.stacktype)
+        if parenttype is not None:
+            entries.extend(('parent', info) for info in topology.search(parenttype, submenu.query, updatable_statuses))
+        # We cannot update with the stacks in some states, so filter by status
+        entries.extend(('stack', info) for info in topology.search(self.stacktype, submenu.query, updatable_statuses))
+
+        # only the items of the page shown, however many stacks there are
+        for (kind, info) in submenu.page_of(entries):
+            descr = '{0} created {1}'.format(info.status, info.ctime)
+            if kind == 'parent':
+                items.append(FunctionItem('Create new {0} stack from: {1} ({2})'.format(self.stacktype, info.name, descr), self.create_stack, [info.network, info.database]))
+            else:
+                items.append(SubmenuItem('{0} stack: {1} ({2})'.format(self.stacktype.capitalize(), info.name, descr), self.stack_actions_menu(info), submenu))
+
+        if len(topology.stacks_of_type(self.stacktype, updatable_statuses)) > 1:
+            items.append(FunctionItem('Create changesets for all {0} stacks'.format(self.stacktype), self.create_changesets_all))
+        age = self.inventory.age()
+        items.append(FunctionItem('Refresh the list of stacks (fetched {0:.0f} seconds ago)'.format(age if age is not None else 0), self.refresh_stacks))
+        # start over (the menu may be showing already)
+        menus.set_items(submenu, items)
+
+    def item_save(self):
+        # go back to beginning of file
+        self.preferencesfile.seek(0)
+        # save the YAML
+        yaml.dump(self.prefs, self.preferencesfile, default_flow_style=False)
+        # make sure there is nothing left in the file after the YAML
+        self.preferencesfile.truncate()
+        self.preferencesfile.flush()
+
+    def show(self, started):
+        '''
+        Show the main menu; started is when conf.py started (time.monotonic()), to report how long it took
+        '''
+        startup = 'Started in {0:.2f} seconds'.format(time.monotonic() - started)
+        def tick(menu):
+            menu.subtitle = startup if len(self.jobs.jobs) == 0 else 'Background jobs: {0}'.format(self.jobs.summary())
+        menu = menus.LiveMenu('{0} AWS CloudFormation Main'.format(self.flavor.title), show_exit_option = False, tick=tick)
+
+        parameters_menu_item = SubmenuItem("AWS CloudFormation Parameters", submenu=self.parameters_menu)
+        parameters_menu_item.set_menu(menu)
+
+        stacks_menu_item = StacksSubmenuItem("AWS CloudFormation Stacks", submenu=self.stacks_menu, fill=self.fill_stacks_menu)
+        stacks_menu_item.set_menu(menu)
+
+        jobs_menu = menus.LiveMenu("Background jobs", tick=self.tick_jobs_menu)
+        jobs_menu_item = SubmenuItem("Background jobs", submenu=jobs_menu)
+        jobs_menu_item.set_menu(menu)
+
+        background_item = FunctionItem('Run stack creates and updates in the background: no', self.toggle_background)
+        background_item.args = [background_item]
+
+        menu.append_item(parameters_menu_item)
+        menu.append_item(stacks_menu_item)
+        menu.append_item(background_item)
+        menu.append_item(jobs_menu_item)
+        menu.append_item(FunctionItem("Save", self.item_save))
+        menu.append_item(ExitItem("Exit without saving"))
+        menu.subtitle = startup
+        timeline.trace('conf.py', 'startup', started, time.monotonic())
+        menu.show()
+        # leaving would stop following the stacks of the running jobs
+        self.jobs.wait()
+
+def deploy(flavor, menuclass, preferencesfile, stage, refresh, environments, yes, stacks):
+    '''
+    Without the menu, create new environments and update existing stacks, in dependency order
+
+    menuclass is the flavor's ConfigMenu. Returns the exit status: 1 if a stack failed (or was
+    skipped because one it uses failed).
+    '''
+    configs = dict()
+    for t in deployplan.STACK_TYPES:
+        # each reads the preferences from the start
+        preferencesfile.seek(0)
+        # a new DrupalHashSalt would never be saved, so preflight reports it as missing instead
+        configs[t] = menuclass(flavor, preferencesfile, stage, t, templates.parameters(templates.template_filename(t)), refresh, new_secrets=False)
+    theinventory = configs['network'].inventory
+    topology = theinventory.topology()
+
+    # the stacks to update ('all' is every stack that can be updated), then the new environments
+    jobs = []
+    for name in stacks:
+        if name == 'all':
+            infos = [info for t in deployplan.STACK_TYPES for info in topology.stacks_of_type(t, updatable_statuses)]
+        else:
+            info = topology.get(name)
+            if info is None or info.status not in updatable_statuses:
+                print('There is no {0} stack {1} that can be updated'.format(flavor.long, name))
+                return 1
+            infos = [info]
+        for info in infos:
+            if info.name in [job.stack for job in jobs]: continue
+            jobs.append(deployplan.Job(info.name, info.stacktype, info.network, info.database, 'update'))
+    taken = set(topology.stacks)
+    for n in range(environments):
+        jobs.extend(deployplan.new_environment(flavor.short, taken))
+
+    # nothing is deployed unless every stack passes the preflight checks
+    problems = False
+    for job in jobs:
+        try:
+            configs[job.stacktype].check(job.network, job.database)
+        except preflight.PreflightError as e:
+            print('{0}: {1}'.format(job.stack, e))
+            problems = True
+    if problems: return 1
+
+    print('Deploying, each step once the one before is done:')
+    for (n, wave) in enumerate(deployplan.waves(flavor.short, jobs)):
+        print('  {0}. {1}'.format(n + 1, ', '.join('{0} {1}'.format(job.action, job.stack) for job in wave)))
+    if not yes and input('Type "yes" to deploy, or just press Enter to leave ... ').strip() != 'yes': return 1
+
+    results = deployplan.run(flavor.short, jobs, lambda job: configs[job.stacktype].deploy_job(job))
+    theinventory.update_stacks([job.stack for job in jobs])
+    print('')
+    deployplan.report(results)
+    return 1 if len(deployplan.failed(results)) > 0 else 0
+
+def main(flavor, menuclass, started, argv):
+    '''
+    conf.py of a flavor: the menu of a stage and stack type, or a deploy (see USAGE)
+
+    menuclass is the flavor's ConfigMenu, and started is when conf.py started (time.monotonic()).
+    '''
+    # Handle command line arguments
+    if len(argv) < 3:
+      print(USAGE)
+      sys.exit(1)
+    stage = argv[1]
+    stacktype = argv[2]
+    if stacktype not in ["network", "database", "compute", "deploy"]:
+      print(USAGE)
+      sys.exit(1)
+    # fetch the stacks from AWS even if they were cached recently
+    refresh = '--refresh' in argv[3:]
+
+    preferencesfilename = flavors.preferences_filename(flavor, stage)
+    with open(preferencesfilename, 'a'): # open for appending (so auto-create if necessary)
+      pass
+
+    if stacktype == 'deploy':
+        deployargs = deployplan.parse_args(argv[3:])
+        if deployargs is None:
+            print(USAGE)
+            sys.exit(1)
+        with open(preferencesfilename, 'r') as preferencesfile:
+          sys.exit(deploy(flavor, menuclass, preferencesfile, stage, refresh, *deployargs))
+
+    def show(stdscr):
+        # the Parameters are all we need from the template (and are cached by its content)
+        cloudparams = templates.parameters(templates.template_filename(stacktype))
+        with open(preferencesfilename, 'r+') as preferencesfile: # open for updating
+          config = menuclass(flavor, preferencesfile, stage, stacktype, cloudparams, refresh)
+          config.show(started)
+
+    # be safe with curses terminal
+    wrapper(show)
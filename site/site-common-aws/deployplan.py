@@ -0,0 +1,186 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Deploying (creating or updating) several stacks at once, in dependency order.
+
+A database stack uses its network stack (NetworkId), and a compute stack uses its database and
+network stacks (DatabaseId, NetworkIdFromDatabaseId). So a stack is only deployed once the stacks
+it uses that are deployed too have succeeded, and everything else is deployed at the same time:
+two new environments come up side by side, and a deployment takes as long as its longest chain of
+network, database and compute rather than the sum of all its stacks.
+'''
+import time
+import random
+import traceback
+import collections
+import concurrent.futures
+
+import stackevents
+
+STACK_TYPES = ['network', 'database', 'compute']
+
+# how many stacks are deployed at once
+MAX_WORKERS = 8
+
+# the status of a stack that was already deployed from the same template and parameters
+UNCHANGED = 'UNCHANGED'
+
+# the status of a stack not deployed because a stack it uses failed
+SKIPPED = 'SKIPPED'
+
+# the statuses that let the stacks using this one go ahead
+OK_STATUSES = stackevents.SUCCESS_STATUSES + [UNCHANGED]
+
+# One stack to deploy. action is 'create' or 'update'; network and database are the ids in its name.
+Job = collections.namedtuple('Job', ['stack', 'stacktype', 'network', 'database', 'action'])
+
+# How a job went. start and end are seconds since the deployment started (None if it was skipped).
+Result = collections.namedtuple('Result', ['stack', 'status', 'start', 'end'])
+
+def parse_args(args):
+    '''
+    (environments, yes, stacks) from the arguments after 'deploy' (see conf.py), or None if they make no sense
+    '''
+    environments = 0
+    yes = False
+    stacks = []
+    i = 0
+    while i < len(args):
+        if args[i] == '--environments' and i + 1 < len(args) and args[i + 1].isdigit():
+            environments = int(args[i + 1])
+            i += 1
+        elif args[i] == '--yes':
+            yes = True
+        elif args[i] == '--refresh':
+            pass
+        elif args[i].startswith('-'):
+            return None
+        else:
+            stacks.append(args[i])
+        i += 1
+    if environments == 0 and len(stacks) == 0: return None
+    return (environments, yes, stacks)
+
+def stack_name(flavorshort, stacktype, network, database, id):
+    '''
+    The name of a stack, like conf.py names them (ex. 'bb-compute-123-456-789')
+    '''
+    prefix = ''
+    if stacktype == 'database': prefix = '{0}-'.format(network)
+    if stacktype == 'compute': prefix = '{0}-{1}-'.format(network, database)
+    return '{0}-{1}-{2}{3}'.format(flavorshort, stacktype, prefix, id)
+
+def new_id(flavorshort, stacktype, network, database, taken):
+    '''
+    A random id for a new stack whose name is not in taken (the names of the existing and planned stacks)
+    '''
+    while True:
+        id = '{0:05d}'.format(random.randrange(0, 100000))
+        if stack_name(flavorshort, stacktype, network, database, id) not in taken: return id
+
+def new_environment(flavorshort, taken):
+    '''
+    The jobs creating a whole new environment: a network, a database on it, and a compute on both
+
+    The names of the new stacks are added to taken.
+    '''
+    network = new_id(flavorshort, 'network', None, None, taken)
+    taken.add(stack_name(flavorshort, 'network', None, None, network))
+    database = new_id(flavorshort, 'database', network, None, taken)
+    taken.add(stack_name(flavorshort, 'database', network, None, database))
+    compute = new_id(flavorshort, 'compute', network, database, taken)
+    taken.add(stack_name(flavorshort, 'compute', network, database, compute))
+    return [
+        Job(stack_name(flavorshort, 'network', None, None, network), 'network', network, None, 'create'),
+        Job(stack_name(flavorshort, 'database', network, None, database), 'database', network, database, 'create'),
+        Job(stack_name(flavorshort, 'compute', network, database, compute), 'compute', network, database, 'create'),
+    ]
+
+def dependencies(flavorshort, jobs):
+    '''
+    The stacks each job waits for: those it uses, if they are deployed too
+    '''
+    planned = set(job.stack for job in jobs)
+    deps = collections.OrderedDict()
+    for job in jobs:
+        uses = []
+        if job.stacktype in ['database', 'compute']:
+            uses.append('{0}-network-{1}'.format(flavorshort, job.network))
+        if job.stacktype == 'compute':
+            uses.append('{0}-database-{1}-{2}'.format(flavorshort, job.network, job.database))
+        deps[job.stack] = [stack for stack in uses if stack in planned]
+    return deps
+
+def waves(flavorshort, jobs):
+    '''
+    The jobs grouped by how many jobs they wait for in a row; the jobs of a wave can all run at once
+    '''
+    deps = dependencies(flavorshort, jobs)
+    depth = dict()
+    def depth_of(stack):
+        if stack not in depth:
+            depth[stack] = 1 + max([depth_of(dep) for dep in deps[stack]] + [-1])
+        return depth[stack]
+    grouped = collections.defaultdict(list)
+    for job in jobs:
+        grouped[depth_of(job.stack)].append(job)
+    return [grouped[d] for d in sorted(grouped)]
+
+def run(flavorshort, jobs, deploy, max_workers=MAX_WORKERS):
+    '''
+    Call deploy(job) for every job, at most max_workers at a time, each as soon as the stacks it waits for succeeded
+
+    deploy returns the final status of the stack (ex. CREATE_COMPLETE, or UNCHANGED). A job that
+    raises is reported and counts as failed. The Results come back in the order of the jobs.
+    '''
+    deps = dependencies(flavorshort, jobs)
+    results = collections.OrderedDict((job.stack, None) for job in jobs)
+    waiting = list(jobs)
+    running = dict()
+    origin = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(waiting) > 0 or len(running) > 0:
+            # start (or skip) every job whose stacks are all done; skipping one may settle others
+            settled = True
+            while settled:
+                settled = False
+                for job in list(waiting):
+                    done = [results[dep] for dep in deps[job.stack]]
+                    if None in done: continue
+                    waiting.remove(job)
+                    settled = True
+                    failed = [result.stack for result in done if result.status not in OK_STATUSES]
+                    if len(failed) > 0:
+                        print('Skipping {0}: {1} did not succeed'.format(job.stack, ', '.join(failed)))
+                        results[job.stack] = Result(job.stack, SKIPPED, None, None)
+                        continue
+                    running[executor.submit(deploy, job)] = (job, time.monotonic())
+            if len(running) == 0: continue
+
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                (job, start) = running.pop(future)
+                try:
+                    status = future.result()
+                except Exception:
+                    print('ERROR deploying {0}:'.format(job.stack))
+                    traceback.print_exc()
+                    status = 'ERROR'
+                results[job.stack] = Result(job.stack, status, start - origin, time.monotonic() - origin)
+    return results
+
+def report(results):
+    '''
+    Print how each stack went, and how long the deployment took compared to deploying one stack after the other
+    '''
+    print('Deployment:')
+    for result in results.values():
+        if result.start is None:
+            print('  {0:<40} {1}'.format(result.stack, result.status))
+        else:
+            print('  {0:<40} {1:<28} {2:7.1f}s {3:7.1f}s'.format(result.stack, result.status, result.start, result.end - result.start))
+    ran = [result for result in results.values() if result.start is not None]
+    if len(ran) == 0: return
+    print('Took {0:.1f}s; one stack after the other would have taken {1:.1f}s'.format(max(result.end for result in ran), sum(result.end - result.start for result in ran)))
+
+def failed(results):
+    return [result for result in results.values() if result.status not in OK_STATUSES]
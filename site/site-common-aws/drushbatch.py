@@ -0,0 +1,139 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Batched drush commands in a Drupal container.
+
+A batch runs an ordered list of drush commands (ex. updatedb, entity-updates, core-requirements)
+in one remote process: one ssh command, one docker exec and one runuser for the whole list,
+instead of one of each per command. The commands still run one after the other, and a failed
+command does not stop the ones after it (the operator verifies the output, like before).
+
+Each command's exit status and duration are reported once the batch is done.
+'''
+import os
+import re
+import sys
+import time
+import shlex
+import subprocess
+import collections
+
+import timeline
+
+DRUSH = '/home/drupaladmin/bin/drush'
+DRUSH_USER = 'drupaladmin'
+
+# printed by the remote script around each command; not shown to the operator
+MARKER = '##site-drush-step'
+MARKER_PATTERN = re.compile(r'^{0} ([0-9]+) (begin|end)(?: ([0-9]+))?\s*$'.format(re.escape(MARKER)))
+
+# One command of a batch. status and secs are None if the command never finished.
+StepResult = collections.namedtuple('StepResult', ['step', 'status', 'secs'])
+
+def script(steps, drush=DRUSH):
+    '''
+    The shell script that runs the drush steps (ex. 'sset system.maintenance_mode 1') in order
+    '''
+    lines = []
+    for (i, step) in enumerate(steps):
+        lines.append('echo "{0} {1} begin"'.format(MARKER, i))
+        lines.append('{0} {1}'.format(drush, step))
+        lines.append('echo "{0} {1} end $?"'.format(MARKER, i))
+    return '; '.join(lines)
+
+def remote_command(ssh, container, steps, interactive=False):
+    '''
+    The local shell command that runs the steps in a container, over ssh (ex. SshSession.ssh)
+
+    interactive (docker exec -it) lets the operator answer drush's questions; ssh must then
+    allocate a terminal too (ex. SshSession.ssh_interactive).
+    '''
+    remote = 'docker exec {0}{1} runuser -u {2} -- sh -c {3}'.format('-it ' if interactive else '', container, DRUSH_USER, shlex.quote(script(steps)))
+    # quoted once for the local shell; the remote shell then sees the script quoted once
+    return '{0} {1}'.format(ssh, shlex.quote(remote))
+
+def run_steps(where, ssh, container, steps, interactive=False):
+    '''
+    Run drush steps, in order, in one remote process in a container on the ECS host of ssh, and report how each went
+
+    where names the host for the operator (ex. '_new_').
+    '''
+    print('')
+    print('----')
+    cmd = remote_command(ssh, container, steps, interactive)
+    print('Running on the {0} ECS host:\n  {1}'.format(where, cmd))
+    results = run(cmd, steps)
+    print('')
+    report(results)
+    return results
+
+def run(cmd, steps, out=None):
+    '''
+    Run a batch command (see remote_command), showing its output as it comes, and return a StepResult per step
+    '''
+    if out is None: out = sys.stdout
+    status = [None] * len(steps)
+    secs = [None] * len(steps)
+    began = [None] * len(steps)
+
+    def handle(line):
+        m = MARKER_PATTERN.match(line.rstrip('\r\n'))
+        if m is None:
+            out.write(line)
+            out.flush()
+            return
+        i = int(m.group(1))
+        if i >= len(steps): return
+        if m.group(2) == 'begin':
+            began[i] = time.monotonic()
+        else:
+            status[i] = int(m.group(3))
+            if began[i] is not None:
+                ended = time.monotonic()
+                secs[i] = ended - began[i]
+                timeline.record('drush', 'drush {0}'.format(steps[i]), began[i], ended, exit_code=status[i])
+
+    p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    pending = ''
+    nbytes = 0
+    started = time.monotonic()
+    while True:
+        data = os.read(p.stdout.fileno(), 4096)
+        if not data: break
+        nbytes += len(data)
+        pending += data.decode('utf-8', 'replace')
+        lines = pending.splitlines(True)
+        pending = ''
+        for line in lines:
+            if line.endswith('\n'):
+                handle(line)
+            elif MARKER.startswith(line) or line.startswith(MARKER):
+                # maybe the start of a marker; wait for the rest of the line
+                pending = line
+            else:
+                # ex. a drush question waiting for an answer
+                out.write(line)
+                out.flush()
+    if pending: handle(pending)
+    p.stdout.close()
+    p.wait()
+    # the whole batch too, so the ssh and docker exec overhead around the steps shows in a trace
+    timeline.trace('ssh', 'drush batch', started, time.monotonic(), command=cmd, exit_code=p.returncode, bytes=nbytes)
+    return [StepResult(step, status[i], secs[i]) for (i, step) in enumerate(steps)]
+
+def report(results):
+    '''
+    Print the exit status and duration of each step
+    '''
+    print('drush steps:')
+    for r in results:
+        if r.status is None:
+            outcome = 'NOT FINISHED'
+        elif r.status == 0:
+            outcome = 'ok'
+        else:
+            outcome = 'FAILED ({0})'.format(r.status)
+        duration = '-' if r.secs is None else '{0:.1f}s'.format(r.secs)
+        print('  {0:>8}  {1:<12}  drush {2}'.format(duration, outcome, r.step))
+
+def failed(results):
+    return [r for r in results if r.status != 0]
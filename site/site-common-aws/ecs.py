@@ -0,0 +1,77 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+ECS lookups for promoting compute stacks.
+
+Every compute stack is its own ECS cluster (named after the stack), with a task family per
+service (ex. '<stack>-Drupal' and '<stack>-Redirect').
+'''
+import awsclient
+
+# ECS rejects a describe-container-instances with more container instances than this
+MAX_CONTAINER_INSTANCES_PER_REQUEST = 100
+
+def acquire_compute_bindings(stage, stack, family):
+    '''
+    Find the (containerInstanceArn, hostPort) bindings of the running tasks in a family.
+
+    Returns the set of bindings and the set of container instances the tasks run on.
+    '''
+    binds = set()
+    cis = set()
+
+    # find all the tasks for the Family
+    output = awsclient.call(stage, 'ecs', 'list_tasks', cluster=stack, family='{0}-{1}'.format(stack,family))
+    tasks = output['taskArns']
+    if tasks is None or len(tasks) == 0: return (binds, cis)
+
+    # find out the bindings for the tasks
+    output = awsclient.call(stage, 'ecs', 'describe_tasks', cluster=stack, tasks=tasks)
+    for t in output['tasks']:
+        ci = t['containerInstanceArn']
+        cis.add(ci)
+
+        for c in t['containers']:
+            for n in c['networkBindings']:
+                binds.add( (ci, n['hostPort']) )
+    return (binds, cis)
+
+def acquire_all_compute_bindings(stage, lookups, all_cis):
+    '''
+    acquire_compute_bindings() for every (stack, family) in lookups, concurrently.
+
+    Returns a dict of (stack, family) to its set of bindings, and records in the all_cis dict the
+    owning cluster (the stack) of every container instance found.
+    '''
+    lookups = list(lookups)
+    results = awsclient.fan_out(lambda stack, family: acquire_compute_bindings(stage, stack, family), lookups)
+    stack_family_binds = dict()
+    for (lookup, (binds, cis)) in zip(lookups, results):
+        stack_family_binds[lookup] = binds
+        for ci in cis: all_cis[ci] = lookup[0]
+    return stack_family_binds
+
+def resolve_container_instances(stage, all_cis):
+    '''
+    Find the EC2 instance of every container instance in all_cis (a dict of container instance to owning cluster).
+
+    The container instances are grouped by cluster and chunked to the ECS limit, and all the chunks
+    are described concurrently. Returns a dict of container instance to EC2 instance id, and a dict
+    of container instance to failure reason (ex. 'MISSING') for those ECS could not describe.
+    '''
+    by_cluster = dict()
+    for ci, cluster in sorted(all_cis.items()):
+        by_cluster.setdefault(cluster, []).append(ci)
+    chunks = []
+    for cluster, cis in sorted(by_cluster.items()):
+        for i in range(0, len(cis), MAX_CONTAINER_INSTANCES_PER_REQUEST):
+            chunks.append((cluster, cis[i:i + MAX_CONTAINER_INSTANCES_PER_REQUEST]))
+
+    outputs = awsclient.fan_out(lambda cluster, cis: awsclient.call(stage, 'ecs', 'describe_container_instances', cluster=cluster, containerInstances=cis), chunks)
+    ci_ec2instance_map = dict()
+    failures = dict()
+    for output in outputs:
+        for ci in output['containerInstances']:
+            ci_ec2instance_map[ci['containerInstanceArn']] = ci['ec2InstanceId']
+        for failure in output['failures']:
+            failures[failure['arn']] = failure['reason']
+    return (ci_ec2instance_map, failures)
@@ -0,0 +1,57 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+The site flavors, and what differs between them.
+
+Each flavor has its own site-<flavor>-aws directory (with its conf.py and its templates), its own
+preferences per stage, and its own stack names ('bb-network-123', 'pc-network-123'). Everything
+else is the same, and is shared by the modules in this directory.
+'''
+import os
+import collections
+from os.path import expanduser
+
+import sshpool
+import templates
+
+# the directory of the site-*-aws directories
+SITE_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+# short and long are in the stack names and tags. awsstage is the stage (AWS CLI profile
+# 'site-<stage>') of every AWS call, or None for the stage of the command line. container is the
+# name of the Drupal container in the ECS task definitions.
+Flavor = collections.namedtuple('Flavor', ['short', 'long', 'title', 'directory', 'awsstage', 'container'])
+
+BUILDBARBUDA = Flavor('bb', 'buildbarbuda', 'buildbarbuda.org', 'site-buildbarbuda-aws', None, 'site-buildbarbuda')
+# every AWS call goes through the site-dev profile, whatever the stage
+PLAINLYCHRIST = Flavor('pc', 'plainlychrist', 'plainlychrist.org', 'site-plainlychrist-aws', 'dev', 'site-web')
+
+FLAVORS = [BUILDBARBUDA, PLAINLYCHRIST]
+
+STAGES = ['dev', 'prod']
+
+def by_name(name):
+    '''
+    The flavor called name ('bb' or 'buildbarbuda'), or None
+    '''
+    for flavor in FLAVORS:
+        if name in [flavor.short, flavor.long]: return flavor
+    return None
+
+def aws_stage(flavor, stage):
+    return flavor.awsstage if flavor.awsstage is not None else stage
+
+def directory(flavor):
+    return os.path.join(SITE_DIR, flavor.directory)
+
+def template_filename(flavor, stacktype):
+    return os.path.join(directory(flavor), templates.template_filename(stacktype))
+
+def preferences_filename(flavor, stage):
+    return expanduser('~/.{0}.{1}.site-aws.yml'.format(flavor.long, stage))
+
+def login_identity(flavor, stage):
+    '''
+    The ECS private key for the ECS hosts of a flavor in a stage
+    '''
+    if flavor.awsstage is not None: return sshpool.ecs_login_identity()
+    return sshpool.ecs_login_identity(stage)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Running the same operation on the stacks of several flavors and stages at once.
+
+Each (flavor, stage) is a Target, with its own preferences, templates and AWS profile (see
+flavors.py), and every target runs at the same time: rolling a template change out to every site
+is one pass rather than one conf.py session after the other. What each target prints comes out
+a line at a time, with the target in front (ex. '[bb/prod] ').
+
+The operations:
+
+- inventory: the stacks of each target.
+- changesets: create change sets for the stacks whose template or parameters changed, and show them
+  (they are not executed).
+- update: update the stacks whose template or parameters changed, in dependency order.
+- promote-plan: what promoting the newest compute stack of each database would change, without
+  changing anything.
+
+The operations work on every stack that can be updated, or only on the stacks named.
+'''
+import os
+import sys
+import threading
+import traceback
+from datetime import datetime
+
+# the deployment modules shared by every site-*-aws flavor
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+import awsclient
+import changesets
+import deployplan
+import flavors
+import inventory
+import jobs
+import preflight
+import promote
+import stackconfig
+import templates
+
+usage = """usage: fleet.py [--flavors bb,pc] [--stages dev,prod] [--yes] [--refresh] inventory|changesets|update|promote-plan [all | STACK ...]"""
+
+OPERATIONS = ['inventory', 'changesets', 'update', 'promote-plan']
+
+class Target:
+    '''
+    The stacks of one flavor in one stage
+    '''
+
+    def __init__(self, flavor, stage, refresh=False):
+        self.flavor = flavor
+        self.stage = stage
+        self.awsstage = flavors.aws_stage(flavor, stage)
+        self.label = '{0}/{1}'.format(flavor.short, stage)
+        self.inventory = inventory.StackInventory(self.awsstage, flavor.short, flavor.long)
+        if refresh: self.inventory.invalidate()
+        self._configs = dict()
+
+    def config(self, stacktype):
+        '''
+        The StackConfig of a stack type, from the target's preferences (which are only read)
+        '''
+        if stacktype not in self._configs:
+            if os.path.exists(flavors.preferences_filename(self.flavor, self.stage)):
+                with open(flavors.preferences_filename(self.flavor, self.stage), 'r') as preferencesfile:
+                    prefs = stackconfig.load_preferences(preferencesfile)
+            else:
+                prefs = {'Parameters': dict(), 'Types': dict()}
+            cloudparams = templates.parameters(flavors.template_filename(self.flavor, stacktype))
+            # the preferences are not saved, so a new DrupalHashSalt would be different every time
+            self._configs[stacktype] = stackconfig.StackConfig(self.flavor, self.stage, stacktype, prefs, cloudparams, flavors.directory(self.flavor), new_secrets=False)
+        return self._configs[stacktype]
+
+    def stacks(self, names):
+        '''
+        The StackInfos of the stacks named that are this target's (all of them that can be updated for 'all')
+        '''
+        topology = self.inventory.topology()
+        infos = []
+        for name in names:
+            if name == 'all':
+                found = [info for t in deployplan.STACK_TYPES for info in topology.stacks_of_type(t, stackconfig.UPDATABLE_STATUSES)]
+            else:
+                found = [info for info in [topology.get(name)] if info is not None and info.status in stackconfig.UPDATABLE_STATUSES]
+            infos.extend(info for info in found if info not in infos)
+        return infos
+
+def targets(flavornames, stages, refresh=False):
+    '''
+    A Target for every flavor and stage, leaving out those whose stacks another target already has
+    '''
+    result = []
+    for flavorname in flavornames:
+        flavor = flavors.by_name(flavorname)
+        if flavor is None: raise Exception('Unrecognized flavor {0}'.format(flavorname))
+        for stage in stages:
+            if stage not in flavors.STAGES: raise Exception('Unrecognized stage {0}'.format(stage))
+            same = [target for target in result if target.flavor == flavor and target.awsstage == flavors.aws_stage(flavor, stage)]
+            if len(same) > 0:
+                print('Leaving out {0}/{1}: its stacks are those of {2}'.format(flavor.short, stage, same[0].label))
+                continue
+            result.append(Target(flavor, stage, refresh))
+    return result
+
+class Label:
+    '''
+    Writes what one thread prints to the real stdout a line at a time, with a label in front
+    '''
+
+    _lock = threading.Lock()
+
+    def __init__(self, label, stdout):
+        self.label = label
+        self.stdout = stdout
+        self._partial = ''
+
+    def write(self, text):
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        with Label._lock:
+            for line in lines: self.stdout.write('[{0}] {1}\n'.format(self.label, line))
+
+    def close(self):
+        if self._partial != '': self.write('\n')
+
+_output = None
+
+def labeled(label, function, *args):
+    '''
+    function(*args), with what it prints from this thread labeled
+    '''
+    global _output
+    if _output is None:
+        _output = jobs.ThreadOutput(sys.stdout)
+        sys.stdout = _output
+    ident = threading.get_ident()
+    previous = _output.jobs.get(ident)
+    _output.jobs[ident] = Label(label, _output.stdout)
+    try:
+        return function(*args)
+    finally:
+        _output.jobs[ident].close()
+        if previous is None: del _output.jobs[ident]
+        else: _output.jobs[ident] = previous
+
+def each_target(thetargets, function, *args):
+    '''
+    function(target, *args) for every target at the same time, each printing with its label
+
+    The results come back in the order of the targets; a target whose function raised gets None.
+    '''
+    def run(target):
+        # one target failing does not stop the others
+        try:
+            return function(target, *args)
+        except Exception:
+            traceback.print_exc(file=sys.stdout)
+            return None
+    return awsclient.fan_out(lambda target: labeled(target.label, run, target), [(target,) for target in thetargets])
+
+def show_inventory(target, names):
+    for stacktype in deployplan.STACK_TYPES:
+        infos = target.inventory.topology().stacks_of_type(stacktype)
+        print('{0} {1} stack(s)'.format(len(infos), stacktype))
+        for info in infos:
+            print('  {0:<40} {1:<28} {2}'.format(info.name, info.status, info.ctime))
+    return 0
+
+def changed_stacks(target, names):
+    '''
+    The (StackInfo, stack params) of the stacks named whose template or parameters changed since they were deployed
+    '''
+    infos = target.stacks(names)
+    if len(infos) == 0: return []
+    # the digests of every type of stack, in one pass over the stacks
+    digests = target.config('network').deployed_digests([info.name for info in infos])
+    changed = []
+    for info in infos:
+        stack_params = target.config(info.stacktype).common_stack_params(info.network, info.database)
+        if digests[info.name] == target.config(info.stacktype).stack_digest(stack_params):
+            print('{0} is up to date'.format(info.name))
+            continue
+        changed.append((info, stack_params))
+    return changed
+
+def create_changesets(target, names, changets):
+    try:
+        changed = changed_stacks(target, names)
+    except preflight.PreflightError as e:
+        print(e)
+        return 1
+    created = awsclient.fan_out(lambda info, stack_params: changesets.create_and_wait(target.awsstage, info.name, '{0}-{1}'.format(info.name, changets), **stack_params, **target.config(info.stacktype).template_params()), changed)
+    for changeset in created:
+        print('')
+        for line in changesets.render(changeset): print(line)
+    return 0 if all(changeset.status in ['CREATE_COMPLETE', 'NO_CHANGES'] for changeset in created) else 1
+
+def plan_update(target, names):
+    '''
+    The deployplan.Jobs updating the changed stacks named
+    '''
+    try:
+        changed = changed_stacks(target, names)
+    except preflight.PreflightError as e:
+        print(e)
+        return None
+    jobs = [deployplan.Job(info.name, info.stacktype, info.network, info.database, 'update') for (info, stack_params) in changed]
+    for (n, wave) in enumerate(deployplan.waves(target.flavor.short, jobs)):
+        print('  {0}. {1}'.format(n + 1, ', '.join('{0} {1}'.format(job.action, job.stack) for job in wave)))
+    return jobs
+
+def run_update(target, jobs):
+    if len(jobs) == 0: return 0
+    # the stacks are deployed from other threads, which print with the target's label too
+    results = deployplan.run(target.flavor.short, jobs, lambda job: labeled(target.label, target.config(job.stacktype).deploy_job, job))
+    target.inventory.update_stacks([job.stack for job in jobs])
+    print('')
+    deployplan.report(results)
+    return 1 if len(deployplan.failed(results)) > 0 else 0
+
+def show_promote_plan(target, names):
+    topology = target.inventory.topology()
+    if names == ['all']:
+        # the newest compute stack of each network and database
+        newest = dict()
+        for info in topology.stacks_of_type('compute', stackconfig.UPDATABLE_STATUSES):
+            key = (info.network, info.database)
+            if key not in newest or info.ctime > newest[key].ctime: newest[key] = info
+        infos = [newest[key] for key in sorted(newest)]
+    else:
+        infos = [info for info in target.stacks(names) if info.stacktype == 'compute']
+    for info in infos:
+        print('')
+        print('Promoting {0}:'.format(info.name))
+        theplan = promote.plan(target.awsstage, target.flavor.short, target.flavor.long, topology, info.name, info.network, info.database)
+        for line in promote.describe(theplan): print('  ' + line)
+    return 0
+
+def parse_args(args):
+    '''
+    (flavors, stages, yes, refresh, operation, stacks) from the command line arguments, or None if they make no sense
+    '''
+    flavornames = [flavor.short for flavor in flavors.FLAVORS]
+    stages = list(flavors.STAGES)
+    yes = False
+    refresh = False
+    rest = []
+    i = 0
+    while i < len(args):
+        if args[i] in ['--flavors', '--stages'] and i + 1 < len(args):
+            values = [value for value in args[i + 1].split(',') if value != '']
+            if args[i] == '--flavors': flavornames = values
+            else: stages = values
+            i += 1
+        elif args[i] == '--yes':
+            yes = True
+        elif args[i] == '--refresh':
+            refresh = True
+        elif args[i].startswith('-'):
+            return None
+        else:
+            rest.append(args[i])
+        i += 1
+    if len(rest) == 0 or rest[0] not in OPERATIONS: return None
+    return (flavornames, stages, yes, refresh, rest[0], rest[1:] or ['all'])
+
+def main(args):
+    parsed = parse_args(args)
+    if parsed is None:
+        print(usage)
+        return 1
+    (flavornames, stages, yes, refresh, operation, names) = parsed
+    try:
+        thetargets = targets(flavornames, stages, refresh)
+    except Exception as e:
+        print(e)
+        return 1
+
+    if operation == 'inventory':
+        statuses = each_target(thetargets, show_inventory, names)
+    elif operation == 'changesets':
+        changets = datetime.utcnow().isoformat('T').translate(str.maketrans('', '', ':-.'))
+        statuses = each_target(thetargets, create_changesets, names, changets)
+    elif operation == 'promote-plan':
+        statuses = each_target(thetargets, show_promote_plan, names)
+    else:
+        print('Updating, each step once the one before is done:')
+        plans = each_target(thetargets, plan_update, names)
+        if None in plans: return 1
+        if sum(len(jobs) for jobs in plans) == 0:
+            print('Everything is up to date')
+            return 0
+        if not yes and input('Type "yes" to update, or just press Enter to leave ... ').strip() != 'yes': return 1
+        statuses = awsclient.fan_out(lambda target, jobs: labeled(target.label, run_update, target, jobs), list(zip(thetargets, plans)))
+    return 1 if any(status != 0 for status in statuses) else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,237 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+A snapshot of one flavor's CloudFormation stacks in one stage.
+
+The stack list is fetched from AWS at most once per session, and is cached on disk (per stage
+and flavor) so that opening conf.py again within the TTL does not fetch it at all. Callers filter
+the snapshot by status themselves instead of asking AWS again.
+
+The snapshot is also indexed by network and database id (see StackTopology), so questions like
+"all the compute stacks on network N, database D" are dictionary lookups.
+
+The stack list is read a page at a time, and AWS is asked to leave out the deleted stacks (which
+CloudFormation lists for 90 days), so it stays quick and small in accounts with a long history.
+'''
+import os
+import re
+import json
+import time
+import threading
+import collections
+from os.path import expanduser
+
+import awsclient
+
+CACHE_DIR = expanduser('~/.cache/site-aws')
+
+# how many seconds a cached stack list is used before fetching it again
+DEFAULT_TTL_SECS = 300
+
+# every stack status except DELETE_COMPLETE
+LIVE_STATUSES = [
+    'CREATE_IN_PROGRESS', 'CREATE_FAILED', 'CREATE_COMPLETE',
+    'ROLLBACK_IN_PROGRESS', 'ROLLBACK_FAILED', 'ROLLBACK_COMPLETE',
+    'DELETE_IN_PROGRESS', 'DELETE_FAILED',
+    'UPDATE_IN_PROGRESS', 'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS', 'UPDATE_COMPLETE', 'UPDATE_FAILED',
+    'UPDATE_ROLLBACK_IN_PROGRESS', 'UPDATE_ROLLBACK_FAILED', 'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS', 'UPDATE_ROLLBACK_COMPLETE',
+    'REVIEW_IN_PROGRESS',
+    'IMPORT_IN_PROGRESS', 'IMPORT_COMPLETE', 'IMPORT_ROLLBACK_IN_PROGRESS', 'IMPORT_ROLLBACK_FAILED', 'IMPORT_ROLLBACK_COMPLETE',
+]
+
+def ttl_secs():
+    return int(os.environ.get('SITE_AWS_STACKS_TTL', DEFAULT_TTL_SECS))
+
+def iter_stack_summaries(stage, flavorshort, statuses=LIVE_STATUSES, names=None):
+    '''
+    Yield the (normalized) summaries of a flavor's stacks, a page of list-stacks at a time.
+
+    The status filtering is done by AWS. If names is given, only those stacks are yielded, and no
+    more pages are read once all of them have been seen.
+    '''
+    prefix = '{0}-'.format(flavorshort)
+    missing = None if names is None else set(names)
+    for page in awsclient.paginate(stage, 'cloudformation', 'list_stacks', StackStatusFilter=statuses):
+        for summ in page['StackSummaries']:
+            if not summ['StackName'].startswith(prefix): continue
+            if missing is not None:
+                if summ['StackName'] not in missing: continue
+                missing.discard(summ['StackName'])
+            yield normalize_summary(summ)
+            if missing is not None and len(missing) == 0: return
+
+# One stack of a flavor, with the network id and (if any) database id taken from its name
+StackInfo = collections.namedtuple('StackInfo', ['name', 'stacktype', 'network', 'database', 'status', 'ctime'])
+
+_stack_name_patterns = dict()
+
+def deconstruct_stack_name(flavorshort, stack):
+    '''
+    Split 'bb-compute-123-456-789' into ('compute', '123', '456'), or (None, None, None) for other flavors
+    '''
+    pattern = _stack_name_patterns.get(flavorshort)
+    if pattern is None:
+        pattern = re.compile('{0}-([a-z]+)-([0-9]+)(-([0-9]+))?'.format(re.escape(flavorshort)))
+        _stack_name_patterns[flavorshort] = pattern
+    m = pattern.match(stack)
+    if m is None: return (None, None, None)
+    return (m.group(1), m.group(2), m.group(4))
+
+class StackTopology:
+    '''
+    A flavor's stacks indexed by type, by network id and by (network id, database id).
+
+    Every list keeps the order of the stack summaries it was built from.
+    '''
+
+    def __init__(self, flavorshort, summaries):
+        self.stacks = collections.OrderedDict()
+        self.by_type = collections.defaultdict(list)
+        self.networks = dict()
+        self.databases = collections.defaultdict(list)
+        self.computes = collections.defaultdict(list)
+        # what search() looks in, per stack
+        self.search_keys = dict()
+        for summ in summaries:
+            (stacktype, network, database) = deconstruct_stack_name(flavorshort, summ['StackName'])
+            # skip other flavors' stacks
+            if stacktype is None: continue
+            info = StackInfo(summ['StackName'], stacktype, network, database, summ['StackStatus'], summ['CreationTime'])
+            self.stacks[info.name] = info
+            self.by_type[stacktype].append(info)
+            self.search_keys[info.name] = ' '.join([info.name, info.status, info.ctime]).lower()
+            if stacktype == 'network':
+                self.networks[network] = info
+            elif stacktype == 'database':
+                self.databases[network].append(info)
+            elif stacktype == 'compute':
+                self.computes[(network, database)].append(info)
+
+    def get(self, stack):
+        return self.stacks.get(stack)
+
+    def stacks_of_type(self, stacktype, statuses=None):
+        return [info for info in self.by_type.get(stacktype, []) if statuses is None or info.status in statuses]
+
+    def search(self, stacktype, query='', statuses=None):
+        '''
+        The stacks of a type whose name, status or creation time contain every word of query (ex. '123-45 rollback')
+        '''
+        words = query.lower().split()
+        return [info for info in self.stacks_of_type(stacktype, statuses) if all(word in self.search_keys[info.name] for word in words)]
+
+    def database_stacks(self, network, statuses=None):
+        '''
+        The database stacks on a network
+        '''
+        return [info for info in self.databases.get(network, []) if statuses is None or info.status in statuses]
+
+    def compute_stacks(self, network, database, statuses=None):
+        '''
+        The compute stacks on a network and database
+        '''
+        return [info for info in self.computes.get((network, database), []) if statuses is None or info.status in statuses]
+
+def normalize_summary(summ):
+    # keep only what conf.py uses, in the same (JSON) form the AWS CLI printed
+    ctime = summ['CreationTime']
+    if not isinstance(ctime, str): ctime = ctime.isoformat()
+    return {'StackName': summ['StackName'], 'StackStatus': summ['StackStatus'], 'CreationTime': ctime}
+
+class StackInventory:
+    '''
+    The stacks of one flavor (ex. 'bb') in one stage (ex. 'dev'), except those truly dead (DELETE_COMPLETE)
+    '''
+
+    def __init__(self, stage, flavorshort, flavorlong, ttl=None):
+        self.stage = stage
+        self.flavorshort = flavorshort
+        self.ttl = ttl_secs() if ttl is None else ttl
+        self.cachefilename = os.path.join(CACHE_DIR, '{0}.{1}.stacks.json'.format(flavorlong, stage))
+        self.fetched = None
+        self._summaries = None
+        self._topology = None
+        # background jobs update the snapshot while the menu reads it
+        self._lock = threading.RLock()
+
+    def summaries(self, statuses=None):
+        '''
+        The stack summaries, optionally only those with a StackStatus in statuses
+        '''
+        with self._lock:
+            if self._summaries is None and not self.load():
+                self.refresh()
+            if statuses is None: return list(self._summaries)
+            return [summ for summ in self._summaries if summ['StackStatus'] in statuses]
+
+    def topology(self):
+        '''
+        The stacks indexed by network and database id, built once per snapshot
+        '''
+        with self._lock:
+            if self._topology is None:
+                self._topology = StackTopology(self.flavorshort, self.summaries())
+            return self._topology
+
+    def refresh(self):
+        '''
+        Fetch the stacks from AWS, and cache them on disk
+        '''
+        with self._lock:
+            self._summaries = list(iter_stack_summaries(self.stage, self.flavorshort))
+            self._topology = None
+            self.fetched = time.time()
+            self.save()
+
+    def update_stacks(self, names):
+        '''
+        Fetch just some stacks (ex. one that was just created or updated) into the snapshot
+
+        A stack that is not found anymore (ex. it was deleted) is dropped from the snapshot.
+        '''
+        with self._lock:
+            if self._summaries is None and not self.load():
+                self.refresh()
+                return
+            names = set(names)
+            found = {summ['StackName']: summ for summ in iter_stack_summaries(self.stage, self.flavorshort, names=names)}
+            summaries = [found.pop(summ['StackName'], summ) for summ in self._summaries if summ['StackName'] not in names or summ['StackName'] in found]
+            # new stacks first, like list-stacks does
+            self._summaries = list(found.values()) + summaries
+            self._topology = None
+            self.save()
+
+    def invalidate(self):
+        '''
+        Forget the stacks (ex. after creating or updating one), so the next use fetches them again
+        '''
+        with self._lock:
+            self._summaries = None
+            self._topology = None
+            self.fetched = None
+            try:
+                os.remove(self.cachefilename)
+            except FileNotFoundError:
+                pass
+
+    def age(self):
+        return None if self.fetched is None else time.time() - self.fetched
+
+    def load(self):
+        try:
+            with open(self.cachefilename, 'r') as cachefile:
+                cached = json.load(cachefile)
+        except (OSError, ValueError):
+            return False
+        if time.time() - cached['fetched'] > self.ttl:
+            return False
+        self._summaries = cached['summaries']
+        self.fetched = cached['fetched']
+        return True
+
+    def save(self):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # write then rename, so a concurrent conf.py never reads half a file
+        tmpfilename = '{0}.{1}'.format(self.cachefilename, os.getpid())
+        with open(tmpfilename, 'w') as cachefile:
+            json.dump({'fetched': self.fetched, 'summaries': self._summaries}, cachefile)
+        os.replace(tmpfilename, self.cachefilename)
@@ -0,0 +1,150 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Background jobs: stack operations that run while the menu stays usable.
+
+Each job runs in its own thread. What a job prints (from its own thread) does not go to the
+terminal, where the menu is, but to the job's log file in ~/.local/share/site-aws/jobs; the menu
+shows the last line of it, and the whole log can be read once the menu is left for a moment.
+
+A job cannot ask the operator anything, so only operations that need no answers (ex. deploying
+a stack with deployplan.Job) can run in the background.
+'''
+import os
+import sys
+import time
+import threading
+import traceback
+from datetime import datetime
+from os.path import expanduser
+
+JOBS_DIR = expanduser('~/.local/share/site-aws/jobs')
+
+class Job:
+    '''
+    One background operation, and what it printed
+    '''
+
+    def __init__(self, name, logfilename):
+        self.name = name
+        self.logfilename = logfilename
+        # running, then done or failed
+        self.status = 'running'
+        self.result = None
+        self.started = time.monotonic()
+        self.ended = None
+        self.last_line = ''
+        self._partial = ''
+        self._log = None
+
+    def elapsed(self):
+        return (self.ended if self.ended is not None else time.monotonic()) - self.started
+
+    def write(self, text):
+        if self._log is None:
+            os.makedirs(os.path.dirname(self.logfilename), exist_ok=True)
+            # only the operator can read it, since it has the stacks' parameters
+            self._log = os.fdopen(os.open(self.logfilename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600), 'a', buffering=1)
+        self._log.write(text)
+        # remember the last complete line that is not empty
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            if line.strip() != '': self.last_line = line.strip()
+
+    def close(self):
+        if self._log is not None: self._log.close()
+
+    def describe(self):
+        return '{0:<40} {1:<8} {2:6.0f}s  {3}'.format(self.name, self.status, self.elapsed(), self.last_line)
+
+class ThreadOutput:
+    '''
+    Stands in for sys.stdout: what a job thread writes goes to its job, the rest to the real stdout
+    '''
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.jobs = dict()
+
+    def write(self, text):
+        job = self.jobs.get(threading.get_ident())
+        if job is None: return self.stdout.write(text)
+        job.write(text)
+        return len(text)
+
+    def flush(self):
+        self.stdout.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stdout, name)
+
+class JobManager:
+    '''
+    The background jobs of one conf.py session, oldest first
+    '''
+
+    def __init__(self, name):
+        # used in the log file names (ex. 'buildbarbuda.dev')
+        self.name = name
+        self.jobs = []
+        # how many jobs have ended, so the menu knows when to show their stacks' new status
+        self.ended = 0
+        self._lock = threading.Lock()
+        self._output = None
+
+    def submit(self, name, function, *args):
+        '''
+        Run function(*args) in the background as a job called name, and return the Job
+        '''
+        if self._output is None:
+            self._output = ThreadOutput(sys.stdout)
+            sys.stdout = self._output
+        timestamp = datetime.utcnow().isoformat('T').translate(str.maketrans('', '', ':-.'))
+        job = Job(name, os.path.join(JOBS_DIR, '{0}.{1}.{2}.log'.format(self.name, timestamp, name.replace(' ', '-'))))
+        with self._lock:
+            self.jobs.append(job)
+        thread = threading.Thread(target=self._run, args=(job, function, args), name='job {0}'.format(name))
+        thread.daemon = True
+        thread.start()
+        return job
+
+    def _run(self, job, function, args):
+        self._output.jobs[threading.get_ident()] = job
+        try:
+            job.result = function(*args)
+            job.status = 'done'
+        except:
+            traceback.print_exc(file=sys.stdout)
+            job.status = 'failed'
+        finally:
+            job.ended = time.monotonic()
+            del self._output.jobs[threading.get_ident()]
+            job.close()
+            with self._lock:
+                self.ended += 1
+
+    def running(self):
+        return [job for job in self.jobs if job.ended is None]
+
+    def summary(self):
+        '''
+        Ex. '2 running, 1 done, 1 failed', or '' without any jobs
+        '''
+        counts = [(len([job for job in self.jobs if job.status == status]), status) for status in ['running', 'done', 'failed']]
+        return ', '.join('{0} {1}'.format(count, status) for (count, status) in counts if count > 0)
+
+    def wait(self):
+        '''
+        Wait for the running jobs (ex. before conf.py exits, which would stop following them)
+
+        Ctrl-C stops waiting; the stack operations carry on in AWS.
+        '''
+        running = self.running()
+        if len(running) > 0:
+            print('Waiting for {0} background job(s) (Ctrl-C to leave them): {1}'.format(len(running), ', '.join(job.name for job in running)))
+        try:
+            while len(self.running()) > 0: time.sleep(1)
+        except KeyboardInterrupt:
+            print('Left {0} background job(s) running.'.format(len(self.running())))
+        for job in self.jobs:
+            print(job.describe())
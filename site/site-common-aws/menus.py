@@ -0,0 +1,164 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Text menus whose content changes while they are shown (ex. the list of background jobs).
+
+A curses-menu menu only redraws itself when a key is pressed. A LiveMenu waits for keys at most
+TICK_MSECS at a time, and in between lets the caller update its subtitle and items.
+
+A PagedMenu only has the items of one page of entries (ex. stacks), filtered as the operator
+types, so it is as quick to build and to move around whether there are ten entries or thousands.
+'''
+import sys
+import curses
+
+# import a text menu library
+try:
+    from cursesmenu import CursesMenu
+except ImportError as e:
+    print ("FATAL: %s. Please follow the installation instructions at http://curses-menu.readthedocs.io/en/latest/installation.html" % (e))
+    sys.exit(1)
+
+# how often a live menu is updated while no key is pressed
+TICK_MSECS = 1000
+
+# how many entries a paged menu shows at once
+PAGE_SIZE = 15
+
+# the keys that end typing a filter, and those that erase its last character
+END_KEYS = [ord('\n'), 27]
+ERASE_KEYS = [curses.KEY_BACKSPACE, 127, 8]
+
+class LiveMenu(CursesMenu):
+    '''
+    A menu that calls tick(menu) about every TICK_MSECS while it waits for a key, and then redraws
+    '''
+
+    def __init__(self, title=None, subtitle=None, show_exit_option=True, tick=None):
+        super(LiveMenu, self).__init__(title, subtitle, show_exit_option)
+        self.tick = tick
+
+    def get_input(self):
+        if self.tick is None: return super(LiveMenu, self).get_input()
+        CursesMenu.stdscr.timeout(TICK_MSECS)
+        try:
+            while True:
+                key = CursesMenu.stdscr.getch()
+                if key != -1: return key
+                self.tick(self)
+                # what was drawn before may be longer than what is drawn now
+                self.screen.erase()
+                self.draw()
+        finally:
+            # back to waiting for keys for ever (ex. for the other menus)
+            CursesMenu.stdscr.timeout(-1)
+
+class PagedMenu(LiveMenu):
+    '''
+    A live menu with the items of one page of entries at a time, and a filter
+
+    Type '/' and then the filter (Enter or Escape when done); PgDn and PgUp (or '>' and '<') change
+    the page. refill(menu) is called whenever the filter or the page changes, and builds the
+    items of the page from page_of() (ex. with set_items).
+    '''
+
+    def __init__(self, title=None, refill=None, tick=None, page_size=PAGE_SIZE):
+        super(PagedMenu, self).__init__(title, None, True, tick)
+        self.refill = refill
+        self.page_size = page_size
+        self.query = ''
+        self.filtering = False
+        self.page = 0
+        self.pages = 1
+        self.total = 0
+        # shown after the filter and page (ex. by tick)
+        self.note = ''
+        self._pending = None
+
+    def page_of(self, entries):
+        '''
+        The entries (a list, already filtered with query) on the current page
+        '''
+        self.total = len(entries)
+        self.pages = max(1, (len(entries) + self.page_size - 1) // self.page_size)
+        self.page = max(0, min(self.page, self.pages - 1))
+        return entries[self.page * self.page_size:(self.page + 1) * self.page_size]
+
+    def status(self):
+        if self.filtering: query = 'Filter: {0}_ (Enter when done)'.format(self.query)
+        elif self.query != '': query = 'Filter: {0} (/ to change)'.format(self.query)
+        else: query = '/ to filter'
+        page = 'page {0}/{1} of {2}, PgDn and PgUp for more'.format(self.page + 1, self.pages, self.total) if self.pages > 1 else '{0} in all'.format(self.total)
+        return '  '.join(text for text in [query, page, self.note] if text != '')
+
+    def draw(self):
+        self.subtitle = fit(self.status(), self)
+        super(PagedMenu, self).draw()
+
+    def get_input(self):
+        if self._pending is not None:
+            (key, self._pending) = (self._pending, None)
+            return key
+        return super(PagedMenu, self).get_input()
+
+    def process_user_input(self):
+        key = self.get_input()
+        page = self.page
+        changed = False
+        if self.filtering:
+            if key in END_KEYS:
+                self.filtering = False
+            elif key in ERASE_KEYS:
+                self.query = self.query[:-1]
+                (page, changed) = (0, True)
+            elif 32 <= key < 127:
+                self.query += chr(key)
+                (page, changed) = (0, True)
+            else:
+                # ex. the arrows still move around
+                self._pending = key
+                return super(PagedMenu, self).process_user_input()
+        elif key == ord('/'):
+            self.filtering = True
+        elif key in [curses.KEY_NPAGE, ord('>')]:
+            page = min(self.pages - 1, self.page + 1)
+        elif key in [curses.KEY_PPAGE, ord('<')]:
+            page = max(0, self.page - 1)
+        else:
+            self._pending = key
+            return super(PagedMenu, self).process_user_input()
+        if changed or page != self.page:
+            self.page = page
+            self.current_option = 0
+            if self.refill is not None: self.refill(self)
+        self.screen.erase()
+        self.draw()
+        return key
+
+def set_items(menu, items):
+    '''
+    Replace the items of a menu, keeping any exit item and (as far as possible) the highlighted item
+
+    The menu may be showing, or paused behind one of its items, so items are added without
+    redrawing it (unlike append_item()), and its screen is made big enough for them.
+    '''
+    had_exit = menu.remove_exit()
+    del menu.items[:]
+    for item in items:
+        # a submenu item also makes this menu the parent of its submenu
+        if hasattr(item, 'set_menu'): item.set_menu(menu)
+        else: item.menu = menu
+    menu.items.extend(items)
+    if had_exit: menu.add_exit()
+    menu.current_option = max(0, min(menu.current_option, len(menu.items) - 1))
+    if menu.screen is not None:
+        max_row, max_cols = menu.screen.getmaxyx()
+        if max_row < 6 + len(menu.items) + 1: menu.screen.resize(6 + len(menu.items) + 1, max_cols)
+
+def fit(text, menu):
+    '''
+    The text, cut so that it fits on one line of the menu's screen (if it is showing)
+    '''
+    if menu.screen is None: return text
+    max_row, max_cols = menu.screen.getmaxyx()
+    # leave room for the border, the indent and the item number
+    return text[:max(10, max_cols - 12)]
@@ -0,0 +1,165 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Checking a template and its parameter values before CloudFormation does.
+
+A mistake in a cloudformation-*.yaml template or in the preferences is otherwise only found once
+create-stack or update-stack has started, and rolled back minutes later. These checks take
+milliseconds:
+
+- check_template(): every Ref, Fn::GetAtt, Fn::Sub variable, condition, Fn::FindInMap map and
+  DependsOn names something the template has. The result is cached by the template's content hash
+  (see templates.cached), so an unchanged template is not checked again.
+- check_parameters(): every parameter value suits the Type and the constraints (AllowedValues,
+  AllowedPattern, MinLength, ...) of its parameter.
+'''
+import re
+import json
+
+import templates
+
+# what a Ref or ${} can name besides the parameters and resources
+PSEUDO_PARAMETERS = [
+    'AWS::AccountId', 'AWS::NotificationARNs', 'AWS::NoValue', 'AWS::Partition',
+    'AWS::Region', 'AWS::StackId', 'AWS::StackName', 'AWS::URLSuffix',
+]
+
+# the ${Name} of Fn::Sub; ${!Name} is written as is
+SUB_VARIABLE_PATTERN = re.compile(r'\$\{([^!}][^}]*)\}')
+
+class PreflightError(Exception):
+    '''
+    The problems found in a template or its parameter values, one per line
+    '''
+
+    def __init__(self, problems):
+        super(PreflightError, self).__init__('\n'.join(['Preflight found {0} problem(s); nothing was sent to CloudFormation:'.format(len(problems))] + ['  ' + problem for problem in problems]))
+        self.problems = problems
+
+def template_problems(template):
+    '''
+    The names a template uses that it does not have, as messages
+    '''
+    parameters = template.get('Parameters') or dict()
+    resources = template.get('Resources') or dict()
+    conditions = template.get('Conditions') or dict()
+    mappings = template.get('Mappings') or dict()
+    names = set(parameters) | set(resources) | set(PSEUDO_PARAMETERS)
+    problems = []
+
+    def check(kind, name, known, path):
+        if not isinstance(name, str) or name not in known:
+            problems.append('{0}: {1} {2} is not in the template'.format(path, kind, json.dumps(name)))
+
+    def walk(node, path):
+        if isinstance(node, list):
+            for (i, value) in enumerate(node): walk(value, '{0}[{1}]'.format(path, i))
+            return
+        if not isinstance(node, dict): return
+        for (key, value) in node.items():
+            where = '{0}.{1}'.format(path, key)
+            if key == 'Ref':
+                check('Ref to', value, names, path)
+            elif key == 'Fn::GetAtt':
+                # 'Resource.Attribute' or ['Resource', 'Attribute']
+                resource = value.split('.')[0] if isinstance(value, str) else value[0] if isinstance(value, list) and len(value) > 0 else value
+                check('Fn::GetAtt of resource', resource, resources, path)
+            elif key == 'Fn::Sub':
+                (text, variables) = (value, dict()) if isinstance(value, str) else (value[0], value[1]) if isinstance(value, list) and len(value) == 2 else (None, dict())
+                if isinstance(text, str):
+                    for variable in SUB_VARIABLE_PATTERN.findall(text):
+                        # ${Resource.Attribute} is a Fn::GetAtt
+                        name = variable if variable in variables else variable.split('.')[0]
+                        check('Fn::Sub variable', name, names | set(variables), path)
+            elif key == 'Fn::If':
+                if isinstance(value, list) and len(value) > 0: check('condition', value[0], conditions, path)
+            elif key == 'Condition' and isinstance(value, str):
+                # the Condition of a resource or output, or a condition used by another condition
+                check('condition', value, conditions, path)
+            elif key == 'Fn::FindInMap':
+                if isinstance(value, list) and len(value) > 0: check('mapping', value[0], mappings, path)
+            elif key == 'DependsOn':
+                for resource in ([value] if isinstance(value, str) else value):
+                    check('DependsOn resource', resource, resources, path)
+            walk(value, where)
+
+    for section in ['Conditions', 'Resources', 'Outputs']:
+        walk(template.get(section) or dict(), section)
+    return problems
+
+def check_template(body):
+    '''
+    Raise a PreflightError if the template uses names it does not have
+    '''
+    problems = templates.cached(templates.content_hash(body), 'preflight', lambda: template_problems(templates.parse(body)))
+    if len(problems) > 0: raise PreflightError(problems)
+
+def parameter_problems(key, definition, value):
+    '''
+    What is wrong with the value of one parameter, as messages
+    '''
+    problems = []
+    def problem(message):
+        problems.append('Parameter {0}: {1}'.format(key, message))
+        return problems
+
+    paramtype = definition.get('Type', 'String')
+    if paramtype == 'CommaDelimitedList' or paramtype.startswith('List<'):
+        # the AWS CLI shorthand needed '\,' between the values; they are passed as is now
+        if '\\,' in value: return problem("{0} is written for the AWS CLI shorthand; use ',' instead of '\\,'".format(json.dumps(value)))
+        values = value.split(',')
+    else:
+        values = [value]
+
+    for v in values:
+        if paramtype in ['Number', 'List<Number>']:
+            try:
+                number = float(v)
+            except ValueError:
+                return problem('{0} is not a number'.format(json.dumps(v)))
+            if 'MinValue' in definition and number < float(definition['MinValue']):
+                problem('{0} is less than {1}'.format(v, definition['MinValue']))
+            if 'MaxValue' in definition and number > float(definition['MaxValue']):
+                problem('{0} is more than {1}'.format(v, definition['MaxValue']))
+        elif paramtype.startswith('AWS::') or paramtype.startswith('List<AWS::'):
+            # ex. a key pair name, which only AWS can check
+            if v == '': problem('is empty')
+        if 'AllowedValues' in definition and v not in [str(allowed) for allowed in definition['AllowedValues']]:
+            problem('{0} is not one of {1}'.format(json.dumps(v), ', '.join(str(allowed) for allowed in definition['AllowedValues'])))
+
+    if paramtype == 'String':
+        if 'MinLength' in definition and len(value) < int(definition['MinLength']):
+            problem('is shorter than {0} characters'.format(definition['MinLength']))
+        if 'MaxLength' in definition and len(value) > int(definition['MaxLength']):
+            problem('is longer than {0} characters'.format(definition['MaxLength']))
+        if 'AllowedPattern' in definition and re.fullmatch(definition['AllowedPattern'], value) is None:
+            problem(definition.get('ConstraintDescription', 'does not match {0}'.format(definition['AllowedPattern'])))
+    return problems
+
+def check_parameters(definitions, params):
+    '''
+    Raise a PreflightError if a parameter value (params as in create-stack) does not suit its parameter
+
+    definitions is the Parameters section of the template.
+    '''
+    values = dict((param['ParameterKey'], param['ParameterValue']) for param in params)
+    problems = []
+    for (key, definition) in sorted(definitions.items()):
+        if key not in values:
+            if 'Default' not in definition: problems.append('Parameter {0}: has no value and no Default'.format(key))
+            continue
+        problems.extend(parameter_problems(key, definition, values[key]))
+    for key in sorted(set(values) - set(definitions)):
+        problems.append('Parameter {0}: is not in the template'.format(key))
+    if len(problems) > 0: raise PreflightError(problems)
+
+def check(body, params):
+    '''
+    check_template() and check_parameters() together, reporting the problems of both
+    '''
+    problems = []
+    for (function, args) in [(check_template, [body]), (check_parameters, [templates.body_parameters(body), params])]:
+        try:
+            function(*args)
+        except PreflightError as e:
+            problems.extend(e.problems)
+    if len(problems) > 0: raise PreflightError(problems)
@@ -0,0 +1,630 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Working out what promoting a compute stack would do, and promoting it without maintenance.
+
+A promote moves the load balancer's Redirect and Drupal target groups from the tasks of the
+other (old) compute stacks of a network and database to those of the new one. plan() looks up
+everything that needs: the target groups, the old and new ECS hosts, the bindings of the old and
+new tasks, and the EC2 instances behind them. promote() then does the promote from the plan, for
+the conf.py of every flavor, and fleet.py shows the plans of several flavors and stages at once.
+
+shift_traffic() is the promote without maintenance, for releases without database changes: the
+new targets are registered alongside the old ones, and the old ones are deregistered a batch at a
+time (SITE_AWS_SHIFT_STEPS batches, default 4), each batch once the one before has drained. Since
+the load balancer spreads requests over every registered target, each step moves a share of the
+traffic to the new tasks, and the site never returns a 503.
+
+shift() is that promote for the operator, from conf.py: it rebuilds the caches from a new Drupal
+container and warms up the new services before shifting the traffic to them.
+
+Either way, no old target is deregistered before the new ones pass their load balancer health
+checks (register_when_healthy). New targets still not healthy after SITE_AWS_HEALTHY_TIMEOUT
+seconds (default 600) are deregistered again, leaving the old ones to serve the site.
+'''
+import os
+import time
+import random
+import collections
+
+import awsclient
+import drushbatch
+import ecs
+import flavors
+import sshpool
+import timeline
+import updatecheck
+import warmup
+
+# in how many steps shift_traffic() takes the old targets out, unless SITE_AWS_SHIFT_STEPS says otherwise
+DEFAULT_SHIFT_STEPS = 4
+
+# how long new targets have to pass their health checks, unless SITE_AWS_HEALTHY_TIMEOUT says otherwise
+DEFAULT_HEALTHY_TIMEOUT = 600
+
+# how often draining targets, and targets not healthy yet, are polled
+MIN_POLL_SECS = 2
+MAX_POLL_SECS = 15
+BACKOFF = 1.5
+
+Plan = collections.namedtuple('Plan', [
+    'stack', 'old_stacks',
+    # the ARNs of the load balancer target groups
+    'redirect_targetgroup', 'drupal_targetgroup',
+    # the public DNS names of the running ECS hosts, outside and inside the new stack
+    'old_hostnames', 'new_hostnames',
+    # sets of (container instance, host port)
+    'old_redirect_binds', 'new_redirect_binds', 'old_drupal_binds', 'new_drupal_binds',
+    # every container instance found, and the cluster (stack) that owns it
+    'all_cis',
+    # container instance to EC2 instance id, and container instance to why ECS could not describe it (ex. 'MISSING')
+    'ci_ec2instance_map', 'failures',
+])
+
+def describe_instances(stage, flavorshort, flavorlong, network, database):
+    # take all EC2 instances that share the Drupal database
+    return awsclient.call(stage, 'ec2', 'describe_instances', Filters=[{'Name': 'tag:{0}:database-id'.format(flavorlong), 'Values': ['{0}-database-{1}-{2}'.format(flavorshort, network, database)]}])
+
+def target_groups(stage, flavorshort, network):
+    '''
+    The (Redirect, Drupal) load balancer target groups of a network stack
+    '''
+    output = awsclient.call(stage, 'cloudformation', 'describe_stacks', StackName='{0}-network-{1}'.format(flavorshort, network))
+    redirect_targetgroup = None
+    drupal_targetgroup = None
+    for s in output['Stacks']:
+        for o in s.get('Outputs', []):
+            if o['OutputKey'] == 'EcsLoadBalancerDrupalHttpsTargetGroup':
+                drupal_targetgroup = o['OutputValue']
+            if o['OutputKey'] == 'EcsLoadBalancerRedirectHttpTargetGroup':
+                redirect_targetgroup = o['OutputValue']
+    if redirect_targetgroup is None: raise Exception('No Redirect load balancer target group')
+    if drupal_targetgroup is None: raise Exception('No Drupal load balancer target group')
+    return (redirect_targetgroup, drupal_targetgroup)
+
+def hostnames(stage, flavorshort, flavorlong, stack, network, database):
+    '''
+    The (old, new) public DNS names of the running hosts of a database, split by whether they belong to the stack
+    '''
+    output = describe_instances(stage, flavorshort, flavorlong, network, database)
+    oldhostnames = []
+    newhostnames = []
+    for r in output["Reservations"]:
+        for i in r["Instances"]:
+            pbdns = i.get("PublicDnsName", "")
+            if len(pbdns) == 0: continue # Likely not running
+            new = [t for t in i.get("Tags", []) if t["Key"] == "aws:cloudformation:stack-name" and t["Value"] == stack]
+            if len(new) > 0:
+                newhostnames.append(pbdns)
+            else:
+                oldhostnames.append(pbdns)
+    return (oldhostnames, newhostnames)
+
+def bindings(stage, stack, old_stacks):
+    '''
+    The bindings of the Redirect and Drupal tasks of the new and old stacks, all looked up at once
+    '''
+    all_cis = dict()
+    lookups = [(stack, 'Redirect'), (stack, 'Drupal')]
+    for old_stack in sorted(old_stacks):
+        lookups.extend([(old_stack, 'Redirect'), (old_stack, 'Drupal')])
+    binds = ecs.acquire_all_compute_bindings(stage, lookups, all_cis)
+    old_redirect_binds = set()
+    old_drupal_binds = set()
+    for old_stack in old_stacks:
+        old_redirect_binds = old_redirect_binds | binds[(old_stack, 'Redirect')]
+        old_drupal_binds = old_drupal_binds | binds[(old_stack, 'Drupal')]
+    return (old_redirect_binds, binds[(stack, 'Redirect')], old_drupal_binds, binds[(stack, 'Drupal')], all_cis)
+
+def plan(stage, flavorshort, flavorlong, topology, stack, network, database):
+    '''
+    Everything promoting the compute stack needs, looked up concurrently
+    '''
+    # the old stacks are all other stacks that share the network+database _except_ 'stack' ... even those that are in the
+    # middle of being deleted. We must make sure everything is removed from the load balancer except the machines in the new stack
+    old_stacks = {info.name for info in topology.compute_stacks(network, database) if info.name != stack}
+
+    ((redirect_targetgroup, drupal_targetgroup), (oldhostnames, newhostnames), (old_redirect_binds, new_redirect_binds, old_drupal_binds, new_drupal_binds, all_cis)) = awsclient.fan_out(lambda lookup: lookup(), [
+        (lambda: target_groups(stage, flavorshort, network),),
+        (lambda: hostnames(stage, flavorshort, flavorlong, stack, network, database),),
+        (lambda: bindings(stage, stack, old_stacks),),
+    ])
+
+    # resolve all the container instances, asking each (new or old) stack only about its own
+    (ci_ec2instance_map, failures) = ecs.resolve_container_instances(stage, all_cis)
+
+    return Plan(stack, old_stacks, redirect_targetgroup, drupal_targetgroup, oldhostnames, newhostnames,
+        old_redirect_binds, new_redirect_binds, old_drupal_binds, new_drupal_binds, all_cis, ci_ec2instance_map, failures)
+
+def check_container_instances(plan):
+    '''
+    Raise unless ECS described every container instance of the plan, except those of old tasks that are MISSING
+    '''
+    new_cis = { b[0] for b in (plan.new_redirect_binds | plan.new_drupal_binds) }
+    # for old tasks (only) it is fine if their container instances are missing
+    old_missing_cis = set()
+    for (ci, reason) in sorted(plan.failures.items()):
+        if reason == 'MISSING':
+            if ci in new_cis:
+                raise Exception('Safety check failed. There is a new container instance {0} that is reported MISSING'.format(ci))
+            old_missing_cis.add(ci)
+    if (len(plan.ci_ec2instance_map) + len(old_missing_cis)) != len(plan.all_cis):
+        raise Exception('Safety check failed. Saw {0} reported and {1} old missing container instances, but we asked for {2} in total'.format(len(plan.ci_ec2instance_map), len(old_missing_cis), len(plan.all_cis)))
+
+def targets(binds, ci_ec2instance_map):
+    '''
+    The load balancer targets ({'Id': EC2 instance, 'Port': host port}) of bindings, leaving out those whose EC2 instance is unknown
+    '''
+    return [{'Id': ci_ec2instance_map[ci], 'Port': port} for (ci, port) in sorted(binds) if ci in ci_ec2instance_map]
+
+def describe(plan):
+    '''
+    What the plan would change, as lines to print
+    '''
+    return [
+        'Old stacks: {0}'.format(', '.join(sorted(plan.old_stacks)) or '(none)'),
+        'New stack: {0}'.format(plan.stack),
+        'Old hosts: {0}'.format(', '.join(plan.old_hostnames) or '(none)'),
+        'New hosts: {0}'.format(', '.join(plan.new_hostnames) or '(none)'),
+        '',
+        'Redirect target group {0}:'.format(plan.redirect_targetgroup),
+        '  register {0} new target(s), deregister {1} old target(s)'.format(len(targets(plan.new_redirect_binds, plan.ci_ec2instance_map)), len(targets(plan.old_redirect_binds, plan.ci_ec2instance_map))),
+        'Drupal target group {0}:'.format(plan.drupal_targetgroup),
+        '  register {0} new target(s), deregister {1} old target(s)'.format(len(targets(plan.new_drupal_binds, plan.ci_ec2instance_map)), len(targets(plan.old_drupal_binds, plan.ci_ec2instance_map))),
+    ] + ['Container instance {0} of {1}: {2}'.format(ci, plan.all_cis.get(ci), reason) for (ci, reason) in sorted(plan.failures.items())]
+
+class NotHealthy(Exception):
+    '''
+    New targets that did not pass their health checks in time, with their last health state
+    '''
+
+    def __init__(self, timeout, states):
+        lines = ['{0} new target(s) did not pass their health checks in {1}s; the new targets were deregistered again:'.format(len(states), timeout)]
+        lines.extend('  {0} {1}:{2} {3}'.format(group_name(targetgroup), instance, port, state) for ((targetgroup, instance, port), state) in sorted(states.items()))
+        super(NotHealthy, self).__init__('\n'.join(lines))
+        self.states = states
+
+def setting(name, default, description):
+    '''
+    The whole number in the environment variable name, or default
+    '''
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        raise Exception('{0} must be a number of {1}, not {2}'.format(name, description, os.environ[name]))
+
+def shift_steps():
+    return setting('SITE_AWS_SHIFT_STEPS', DEFAULT_SHIFT_STEPS, 'steps')
+
+def healthy_timeout():
+    return setting('SITE_AWS_HEALTHY_TIMEOUT', DEFAULT_HEALTHY_TIMEOUT, 'seconds')
+
+def group_name(targetgroup):
+    # arn:aws:elasticloadbalancing:<region>:<account>:targetgroup/<name>/<id>
+    return targetgroup.split(':')[-1].split('/')[1] if '/' in targetgroup else targetgroup
+
+def batches(items, steps):
+    '''
+    items split in order into steps batches, whose sizes differ by at most one (the last ones may be empty)
+    '''
+    items = list(items)
+    bounds = [(len(items) * n + steps - 1) // steps for n in range(steps + 1)]
+    return [items[bounds[n]:bounds[n + 1]] for n in range(steps)]
+
+def deregistration_delay(stage, targetgroup):
+    '''
+    How long (seconds) the load balancer lets a deregistered target of the target group drain, at most
+    '''
+    output = awsclient.call(stage, 'elbv2', 'describe_target_group_attributes', TargetGroupArn=targetgroup)
+    for attribute in output['Attributes']:
+        if attribute['Key'] == 'deregistration_delay.timeout_seconds': return int(attribute['Value'])
+    return None
+
+def target_states(stage, targetgroup, targets):
+    '''
+    The health state (ex. 'healthy', 'draining', 'unused') of each target, keyed by (Id, Port)
+    '''
+    output = awsclient.call(stage, 'elbv2', 'describe_target_health', quiet=True, TargetGroupArn=targetgroup, Targets=targets)
+    return {(d['Target']['Id'], d['Target']['Port']): d['TargetHealth']['State'] for d in output['TargetHealthDescriptions']}
+
+def ready(description, answering):
+    '''
+    Whether a target (of describe-target-health) is ready for traffic
+    '''
+    health = description['TargetHealth']
+    if health['State'] == 'healthy': return True
+    # with answering, a target failing its health checks only for the response code (ex. the 503 of a Drupal in maintenance) is ready too
+    return answering and health['State'] == 'unhealthy' and health.get('Reason') == 'Target.ResponseCodeMismatch'
+
+def wait_healthy(stage, groups, timeout):
+    '''
+    Wait for the targets of groups, a list of (target group, targets, answering), to be ready (see ready())
+
+    Every target group is polled at once, less and less often while no target changes state. Returns
+    the seconds each target took to be ready, keyed by (target group, Id, Port), with None for those
+    not ready after timeout seconds; and the last health state of every target.
+    '''
+    start = time.monotonic()
+    waiting = {(targetgroup, target['Id'], target['Port']): answering for (targetgroup, targets, answering) in groups for target in targets}
+    took = {key: None for key in waiting}
+    states = dict()
+    interval = MIN_POLL_SECS
+    while len(waiting) > 0:
+        polls = [(targetgroup, [{'Id': instance, 'Port': port} for (tg, instance, port) in sorted(waiting) if tg == targetgroup]) for targetgroup in sorted({key[0] for key in waiting})]
+        outputs = awsclient.fan_out(lambda targetgroup, targets: awsclient.call(stage, 'elbv2', 'describe_target_health', quiet=True, TargetGroupArn=targetgroup, Targets=targets), polls)
+        elapsed = time.monotonic() - start
+        changed = False
+        for ((targetgroup, targets), output) in zip(polls, outputs):
+            for description in output['TargetHealthDescriptions']:
+                key = (targetgroup, description['Target']['Id'], description['Target']['Port'])
+                if key not in waiting: continue
+                state = ' '.join([description['TargetHealth']['State']] + [description['TargetHealth'][k] for k in ['Reason'] if k in description['TargetHealth']])
+                if states.get(key) != state:
+                    changed = True
+                    states[key] = state
+                if ready(description, waiting[key]):
+                    del waiting[key]
+                    took[key] = elapsed
+                    print('  {0} {1}:{2} is ready ({3}) after {4:.0f}s'.format(group_name(targetgroup), key[1], key[2], state, elapsed))
+        if len(waiting) == 0 or elapsed >= timeout: break
+        # poll again soon while the targets are changing, less often while they are not
+        interval = MIN_POLL_SECS if changed else min(MAX_POLL_SECS, interval * BACKOFF)
+        time.sleep(min(interval, timeout - elapsed))
+    return (took, states)
+
+def register_when_healthy(stage, groups, timeout):
+    '''
+    Register the new targets of groups, a list of (target group, targets, answering), and wait for them to be ready
+
+    Returns the seconds each target took to be ready (see wait_healthy()). If any target is not ready
+    in time, every new target is deregistered again, and NotHealthy is raised.
+    '''
+    groups = [group for group in groups if len(group[1]) > 0]
+    awsclient.fan_out(lambda targetgroup, targets, answering: awsclient.call(stage, 'elbv2', 'register_targets', TargetGroupArn=targetgroup, Targets=targets), groups)
+    print('')
+    print('Waiting (at most {0}s) for the new targets to pass their health checks ...'.format(timeout))
+    with timeline.span('health', 'new targets healthy'):
+        (took, states) = wait_healthy(stage, groups, timeout)
+    print('')
+    print('Time to healthy:')
+    for ((targetgroup, instance, port), secs) in sorted(took.items()):
+        print('  {0:<32} {1}:{2:<8} {3}'.format(group_name(targetgroup), instance, port, 'NOT READY' if secs is None else '{0:.0f}s'.format(secs)))
+    late = {key: states.get(key, 'unknown') for (key, secs) in took.items() if secs is None}
+    if len(late) > 0:
+        # roll back: the old targets were never touched, so they keep serving
+        awsclient.fan_out(lambda targetgroup, targets, answering: awsclient.call(stage, 'elbv2', 'deregister_targets', TargetGroupArn=targetgroup, Targets=targets), groups)
+        raise NotHealthy(timeout, late)
+    return took
+
+def wait_drained(stage, targetgroup, targets):
+    '''
+    Wait until none of the (deregistered) targets is draining its connections any more
+    '''
+    interval = MIN_POLL_SECS
+    while len(targets) > 0 and 'draining' in target_states(stage, targetgroup, targets).values():
+        time.sleep(interval)
+        interval = min(MAX_POLL_SECS, interval * BACKOFF)
+
+def deregister_and_drain(stage, targetgroup, targets):
+    if len(targets) == 0: return
+    awsclient.call(stage, 'elbv2', 'deregister_targets', TargetGroupArn=targetgroup, Targets=targets)
+    wait_drained(stage, targetgroup, targets)
+
+def shift_traffic(stage, plan, steps, timeout):
+    '''
+    Move the Redirect and Drupal target groups from the old targets to the new ones without maintenance
+    '''
+    new_cis = {ci for (ci, port) in plan.new_redirect_binds | plan.new_drupal_binds}
+    for ci in sorted(new_cis):
+        if ci not in plan.ci_ec2instance_map:
+            raise Exception('Safety check failed. There is a new container instance {0} that is reported {1}'.format(ci, plan.failures.get(ci, 'MISSING')))
+
+    groups = [
+        ('Redirect', plan.redirect_targetgroup, targets(plan.new_redirect_binds, plan.ci_ec2instance_map), targets(plan.old_redirect_binds, plan.ci_ec2instance_map)),
+        ('Drupal', plan.drupal_targetgroup, targets(plan.new_drupal_binds, plan.ci_ec2instance_map), targets(plan.old_drupal_binds, plan.ci_ec2instance_map)),
+    ]
+    # taking every old target out of a group with no new ones would leave nothing serving it
+    for (name, targetgroup, new, old) in groups:
+        if len(old) > 0 and len(new) == 0:
+            raise Exception('Safety check failed. The {0} target group has {1} old target(s) and no new ones to take their place'.format(name, len(old)))
+
+    # new targets that fail to register, or are not healthy in time, stop the shift before any old target is taken out
+    register_when_healthy(stage, [(targetgroup, new, False) for (name, targetgroup, new, old) in groups], timeout)
+
+    # no more steps than there are old targets to take out
+    steps = max(1, min(steps, max(len(old) for (name, targetgroup, new, old) in groups)))
+    left = {name: len(old) for (name, targetgroup, new, old) in groups}
+    def shares(when):
+        print('')
+        print(when)
+        for (name, targetgroup, new, old) in groups:
+            share = 100.0 * len(new) / (len(new) + left[name]) if len(new) + left[name] > 0 else 0.0
+            print('  {0}: the new targets take {1:.0f}% of the requests ({2} new, {3} old)'.format(name, share, len(new), left[name]))
+    shares('The new targets are registered alongside the old ones.')
+
+    for n in range(steps):
+        print('')
+        print('Step {0}/{1}: deregistering old targets, and waiting for them to drain ...'.format(n + 1, steps))
+        step = [(targetgroup, batches(old, steps)[n]) for (name, targetgroup, new, old) in groups]
+        with timeline.span('shift', 'step {0}/{1}'.format(n + 1, steps)):
+            awsclient.fan_out(lambda targetgroup, batch: deregister_and_drain(stage, targetgroup, batch), step)
+        for ((name, targetgroup, new, old), (tg, batch)) in zip(groups, step):
+            left[name] -= len(batch)
+        shares('After step {0}/{1}:'.format(n + 1, steps))
+
+def find_container(ssh, container, where):
+    '''
+    The id of a random running Drupal container (container is its name in the task definitions, ex. 'site-web') on the ECS host of ssh
+    '''
+    print('')
+    print('----')
+    cmd = '{0} docker ps --filter status=running --filter label=com.amazonaws.ecs.container-name={1} --format {2} | sort --random-sort | head -n1'.format(ssh, container, '{{.ID}}')
+    print('Finding a random {0} container on the {1} ECS host:\n  {2}'.format(container, where, cmd))
+    return sshpool.output(cmd, 'find a container on the {0} host'.format(where.strip('_')))
+
+def rebuild_and_shift(stage, title, pool, plan, session, webid, steps, interactive=False):
+    '''
+    Rebuild the caches from the new Drupal container webid (on the host of an sshpool.SshSession), warm up every new Drupal, then shift_traffic()
+
+    title is the flavor's host name, for the warm-up URLs (see warmup.warm_up).
+    '''
+    drushbatch.run_steps('_new_', session.ssh_interactive if interactive else session.ssh, webid, ['cache-rebuild'], interactive)
+    warmup.warm_up(stage, pool, plan, title)
+    shift_traffic(stage, plan, steps, healthy_timeout())
+
+def shift(flavor, stage, topology, stack, network, database, interactive=False):
+    '''
+    Promote a compute stack of a flavors.Flavor without maintenance, asking the operator first
+
+    stage is the stage of the command line (see flavors.aws_stage). interactive runs drush with a
+    terminal, so the operator can answer its questions.
+    '''
+    awsstage = flavors.aws_stage(flavor, stage)
+    thetimeline = timeline.start('shift {0}'.format(stack))
+    # one SSH connection per ECS host for all the commands
+    pool = sshpool.SshPool(flavors.login_identity(flavor, stage))
+    try:
+        theplan = plan(awsstage, flavor.short, flavor.long, topology, stack, network, database)
+        if len(theplan.new_hostnames) == 0:
+            print('')
+            print('ERROR')
+            print('----')
+            print('')
+            print('We did not find a "new" host within the compute stack (we found {0})'.format(theplan.new_hostnames))
+            print('')
+            timeline.prompt('Press Enter to leave ... ')
+            return
+        newhostname = random.choice(theplan.new_hostnames)
+
+        print('')
+        for line in describe(theplan): print(line)
+        steps = shift_steps()
+        delay = deregistration_delay(awsstage, theplan.drupal_targetgroup)
+        print('')
+        print('WHAT WILL HAPPEN')
+        print('----')
+        print('')
+        print('The site will NOT be put into maintenance, and NO Drupal update steps (updatedb, entity-updates) will be performed.')
+        print('Only continue if the new release has no database or entity schema changes; otherwise use "Promote compute stack".')
+        print('')
+        print('THEN. The caches will be rebuilt from a new Drupal service (on {0})'.format(newhostname))
+        if warmup.enabled(): print('THEN. The new Drupal services will be warmed up with the URLs of {0}'.format(os.environ['SITE_AWS_WARMUP']))
+        print('THEN. The new Drupal and Redirect services will be added to ELB, alongside the old ones')
+        print('  * No old service is removed until the new ones pass their health checks (at most {0}s)'.format(healthy_timeout()))
+        print('THEN. The old Drupal and Redirect services will be removed from ELB in up to {0} step(s) (SITE_AWS_SHIFT_STEPS)'.format(steps))
+        print('  * Each step waits for the services it removes to finish their requests (at most {0}s, the deregistration delay)'.format(delay))
+        print('')
+        timeline.prompt('Press Enter to proceed ... ')
+
+        # the caches are rebuilt (and warmed up) before the new services get any traffic
+        newsession = pool.session(newhostname)
+        webid = find_container(newsession.ssh, flavor.container, '_new_')
+        rebuild_and_shift(awsstage, flavor.title, pool, theplan, newsession, webid, steps, interactive)
+
+        print('')
+        thetimeline.report()
+        thetimeline.save(timeline.history_filename(flavor.long, awsstage))
+        timeline.prompt('Press Enter to proceed ... ')
+    finally:
+        pool.close()
+        timeline.stop()
+
+def deregister(stage, targetgroup, targets):
+    '''
+    Deregister old targets without waiting for them to drain; like the AWS CLI, report a failure and keep going
+    '''
+    if len(targets) == 0: return
+    try:
+        awsclient.call(stage, 'elbv2', 'deregister_targets', TargetGroupArn=targetgroup, Targets=targets)
+    except awsclient.ClientError as e:
+        print(e)
+
+def promote(flavor, stage, topology, stack, network, database, interactive=False):
+    '''
+    Promote a compute stack of a flavors.Flavor, putting the site into maintenance while the new Drupal updates the database
+
+    Follows the steps in DESIGN-UPDATE.md of the flavor's Drupal site. Traffic is controlled by the
+    ElasticLoadBalancer, and needs a corresponding setting in the AutoScalingGroup when machines get
+    auto-replaced. A promote with nothing to apply to the database skips the maintenance (see
+    updatecheck). stage and interactive are like for shift().
+    '''
+    awsstage = flavors.aws_stage(flavor, stage)
+    identity = flavors.login_identity(flavor, stage)
+    # time every external call, to report how long the site is in maintenance
+    thetimeline = timeline.start('promote {0}'.format(stack))
+    # one SSH connection per ECS host for all the commands
+    pool = sshpool.SshPool(identity)
+    try:
+        # find the load balancer target groups, the old and new hosts, and the old and new tasks, all at once
+        theplan = plan(awsstage, flavor.short, flavor.long, topology, stack, network, database)
+        (oldhostnames, newhostnames) = (theplan.old_hostnames, theplan.new_hostnames)
+
+        if len(oldhostnames) == 0:
+            print('')
+            print('WARNING')
+            print('----')
+            print('')
+            print('We did not find an "old" host that is NOT IN the compute stack (we found {0})'.format(oldhostnames))
+            print('It may mean that you are doing a first-time installation.')
+            print('')
+            timeline.prompt('Press Enter to continue ... ')
+
+        if len(newhostnames) == 0:
+            print('')
+            print('ERROR')
+            print('----')
+            print('')
+            print('We did not find a "new" host within the compute stack (we found {0})'.format(newhostnames))
+            print('')
+            timeline.prompt('Press Enter to leave ... ')
+            return
+
+        oldhostname = random.choice(oldhostnames) if len(oldhostnames) > 0 else None
+        newhostname = random.choice(newhostnames)
+
+        print('')
+        print('Old stacks: ', theplan.old_stacks)
+        print('New stack: ', stack)
+        print('')
+        print('Old Redirect bindings: ', theplan.old_redirect_binds)
+        print('New Redirect bindings: ', theplan.new_redirect_binds)
+        print('')
+        print('Old Drupal bindings: ', theplan.old_drupal_binds)
+        print('New Drupal bindings: ', theplan.new_drupal_binds)
+        timeline.prompt('Press Enter to proceed ... ')
+
+        check_container_instances(theplan)
+
+        print('')
+        print('INSTRUCTIONS')
+        print('----')
+        print('1. You need the ECS private key in {0} for the following commands to work'.format(identity))
+        print('2. You need: chmod 600 {0}'.format(identity))
+        print('3. Your security group for the EC2 instances needs to allow access from this machine (try running: curl -s http://169.254.169.254/latest/meta-data/public-ipv4; echo) OR ssh will hang for a while')
+        print('')
+        if oldhostname is not None: print('We will be running commands on a random _old_ ECS host ({0})'.format(oldhostname))
+        print('We will be running commands on a random _new_ ECS host ({0})'.format(newhostname))
+        print('')
+        print('----')
+        newsession = pool.session(newhostname)
+        cmd = '{0} uptime'.format(newsession.ssh)
+        print('Running on the _new_ ECS host ... to get rid of any SSH unknown host warnings:\n  {0}'.format(cmd))
+        sshpool.call(cmd, 'uptime on the new host')
+
+        webid = find_container(newsession.ssh, flavor.container, '_new_')
+
+        print('')
+        print('----')
+        print('Found Docker container id {0} for new {1}'.format(webid, flavor.container))
+
+        # what the new software would apply to the database, checked before anything changes
+        pending = updatecheck.run(newsession.ssh, webid)
+        print('')
+        if updatecheck.nothing_to_apply(pending):
+            print('There is nothing to apply to the database, so the site will NOT be put into maintenance.')
+            print('')
+            print('WHAT WILL HAPPEN')
+            print('----')
+            print('')
+            print('THEN. The caches will be rebuilt from the new Drupal service')
+            if warmup.enabled(): print('THEN. The new Drupal services will be warmed up with the URLs of {0}'.format(os.environ['SITE_AWS_WARMUP']))
+            print('THEN. The new Drupal and Redirect services will be added to ELB')
+            print('  * The old services stay in ELB until the new ones pass their health checks (at most {0}s)'.format(healthy_timeout()))
+            if oldhostname is not None:
+                print('THEN. The old Drupal and Redirect services will be removed from ELB, once they have finished their requests')
+            print('')
+            timeline.prompt('Press Enter to proceed ... ')
+
+            # the promote without maintenance, in one step
+            rebuild_and_shift(awsstage, flavor.title, pool, theplan, newsession, webid, 1, interactive)
+
+            print('')
+            thetimeline.report()
+            thetimeline.save(timeline.history_filename(flavor.long, awsstage))
+            timeline.prompt('Press Enter to proceed ... ')
+            return
+        print(updatecheck.describe_estimate(timeline.history_filename(flavor.long, awsstage)))
+        print('')
+        print('WHAT WILL HAPPEN')
+        print('----')
+        print('')
+        if oldhostname is not None:
+            print('THEN. The Drupal site will be put into maintenance (from within the old Drupal services)')
+            print('  * _Any_ Drupal service (old or new) will return a Site Maintenance Page and HTTP 503. ')
+            print('  * Elastic Load Balancer (ELB) will put all HTTP 503 services (ex. Drupal, but not Redirect) into OutOfService')
+            print('  * When all services in an ELB target group go OutOfService, ELB will send the request to a random service')
+            print('  * The HTTP 503 is a signal to Google to stop indexing; https://webmasters.googleblog.com/2011/01/how-to-deal-with-planned-site-downtime.html')
+            print('')
+        print('THEN. Drupal update steps will be performed on the new Drupal services')
+        print('THEN. The new Drupal and Redirect services will be added to ELB')
+        print('  * The old services stay in ELB until the new ones pass their health checks (at most {0}s)'.format(healthy_timeout()))
+        if oldhostname is not None:
+            print('THEN. The old Drupal and Redirect services will be removed from ELB')
+        print('')
+        timeline.prompt('Press Enter to proceed ... ')
+
+        newssh = newsession.ssh_interactive if interactive else newsession.ssh
+        if oldhostname is not None:
+            print('')
+            print('----')
+            oldsession = pool.session(oldhostname)
+            cmd = '{0} uptime'.format(oldsession.ssh)
+            print('Running on the _old_ ECS host ... to get rid of any SSH unknown host warnings:\n  {0}'.format(cmd))
+            sshpool.call(cmd, 'uptime on the old host')
+
+            oldwebid = find_container(oldsession.ssh, flavor.container, '_old_')
+
+            print('')
+            print('----')
+            print('Found Docker container id {0} for old {1}'.format(oldwebid, flavor.container))
+            oldssh = oldsession.ssh_interactive if interactive else oldsession.ssh
+            drushbatch.run_steps('_old_', oldssh, oldwebid, ['sset system.maintenance_mode 1', 'cache-rebuild'], interactive)
+
+        drushbatch.run_steps('_new_', newssh, webid, ['updatedb', 'entity-updates', 'core-requirements'], interactive)
+
+        print('')
+        print('')
+        print(' ----------------------------------------- ')
+        print('')
+        print('')
+        timeline.prompt('*Verify* the above worked. Press Enter to proceed ... ')
+
+        # bind new Redirect and Drupal, and wait for them to pass their health checks before unbinding
+        # anything old (the new Drupal only has to answer, since it returns the 503 of the maintenance)
+        try:
+            register_when_healthy(awsstage, [
+                (theplan.redirect_targetgroup, targets(theplan.new_redirect_binds, theplan.ci_ec2instance_map), False),
+                (theplan.drupal_targetgroup, targets(theplan.new_drupal_binds, theplan.ci_ec2instance_map), True),
+            ], healthy_timeout())
+        except NotHealthy as e:
+            print('')
+            print('ERROR')
+            print('----')
+            print('')
+            print(e)
+            print('')
+            print('The old Drupal and Redirect services are still in ELB.')
+            if oldhostname is not None:
+                print('The Drupal site is still in maintenance: take it out of maintenance (drush sset system.maintenance_mode 0)')
+                print('once you know why the new services are not healthy, or promote again.')
+            print('')
+            timeline.prompt('Press Enter to leave ... ')
+            return
+
+        # unbind old Redirect and old Drupal
+        deregister(awsstage, theplan.redirect_targetgroup, targets(theplan.old_redirect_binds, theplan.ci_ec2instance_map))
+        deregister(awsstage, theplan.drupal_targetgroup, targets(theplan.old_drupal_binds, theplan.ci_ec2instance_map))
+
+        # Finish bringing up the site
+        # NOTE: The order (putting out of maintenance, and then cache-rebuild) seems backwards but
+        # let's follow the order in https://www.drupal.org/docs/8/update/update-procedure-in-drupal-8
+        # (perhaps cache-rebuild does more when out-of-maintenance)
+
+        drushbatch.run_steps('_new_', newssh, webid, ['sset system.maintenance_mode 0', 'cache-rebuild'], interactive)
+
+        print('')
+        thetimeline.report()
+        thetimeline.save(timeline.history_filename(flavor.long, awsstage))
+        timeline.prompt('Press Enter to proceed ... ')
+    finally:
+        pool.close()
+        timeline.stop()
@@ -0,0 +1,198 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Replacing the running tasks of a compute stack a few at a time, for a cluster upgrade (see UPGRADING-CLUSTER.md).
+
+Stopping a task makes its ECS service start a new one, from the service's current task definition.
+replace() stops the tasks a batch at a time (SITE_AWS_ROLLING_BATCH tasks, default 1), and only
+stops the next batch once the service has replaced the tasks stopped so far with RUNNING ones, so
+at most a batch of tasks is ever out. Waiting polls list-tasks and describe-tasks, often while the
+tasks are changing state and less and less often while they are not, up to
+SITE_AWS_ROLLING_TIMEOUT seconds (default 900) per batch.
+
+upgrade() is the whole cluster upgrade for the operator, from conf.py.
+'''
+import time
+
+import awsclient
+import drushbatch
+import ecs
+import flavors
+import promote
+import sshpool
+import timeline
+
+DEFAULT_BATCH = 1
+DEFAULT_TIMEOUT = 900
+
+# how often the tasks are polled while waiting for replacements
+MIN_POLL_SECS = 2
+MAX_POLL_SECS = 15
+BACKOFF = 1.5
+
+# ECS rejects a describe-tasks with more tasks than this
+MAX_TASKS_PER_REQUEST = 100
+
+# the drush steps after which the next Drupal container to start applies the remaining database updates
+# (the first container to create site_phase1 is the one that updates the database)
+DROP_PHASE_TABLES = ['sql-query "DROP TABLE site_phase2"', 'sql-query "DROP TABLE site_phase1"']
+
+def batch_size():
+    return promote.setting('SITE_AWS_ROLLING_BATCH', DEFAULT_BATCH, 'tasks')
+
+def timeout():
+    return promote.setting('SITE_AWS_ROLLING_TIMEOUT', DEFAULT_TIMEOUT, 'seconds')
+
+def running_tasks(stage, stack, family, quiet=False):
+    '''
+    The ARNs of the tasks of a family (ex. 'Drupal') that the cluster of the stack wants running
+    '''
+    pages = awsclient.paginate(stage, 'ecs', 'list_tasks', quiet=quiet, cluster=stack, family='{0}-{1}'.format(stack, family), desiredStatus='RUNNING')
+    return sorted(arn for page in pages for arn in page['taskArns'])
+
+def describe_tasks(stage, stack, tasks):
+    '''
+    The tasks described, chunked to the ECS limit and all described at once
+    '''
+    chunks = [(tasks[i:i + MAX_TASKS_PER_REQUEST],) for i in range(0, len(tasks), MAX_TASKS_PER_REQUEST)]
+    outputs = awsclient.fan_out(lambda chunk: awsclient.call(stage, 'ecs', 'describe_tasks', quiet=True, cluster=stack, tasks=chunk), chunks)
+    return [t for output in outputs for t in output['tasks']]
+
+def wait_replaced(stage, stack, family, old_tasks, count, deadline):
+    '''
+    Wait until count tasks of the family that are not among old_tasks are RUNNING, and return them
+    '''
+    interval = MIN_POLL_SECS
+    seen = None
+    while True:
+        new_tasks = [task for task in running_tasks(stage, stack, family, quiet=True) if task not in old_tasks]
+        statuses = {t['taskArn']: t['lastStatus'] for t in describe_tasks(stage, stack, new_tasks)}
+        running = sorted(task for (task, status) in statuses.items() if status == 'RUNNING')
+        if len(running) >= count: return running
+        now = time.monotonic()
+        if now >= deadline:
+            raise Exception('Only {0} of {1} new {2} task(s) of {3} were RUNNING in time; no more tasks were stopped'.format(len(running), count, family, stack))
+        # poll again soon while the tasks are changing, less often while they are not
+        interval = MIN_POLL_SECS if statuses != seen else min(MAX_POLL_SECS, interval * BACKOFF)
+        seen = statuses
+        time.sleep(min(interval, deadline - now))
+
+def replace(stage, stack, family, tasks, batch, secs):
+    '''
+    Stop the tasks (of a family of the stack) batch at a time, each batch once the tasks stopped before are replaced
+
+    Returns the new tasks RUNNING at the end.
+    '''
+    old_tasks = set(running_tasks(stage, stack, family))
+    batches = [tasks[i:i + batch] for i in range(0, len(tasks), batch)]
+    started = time.monotonic()
+    running = []
+    for (n, stopping) in enumerate(batches):
+        print('')
+        print('Batch {0}/{1}: stopping {2} {3} task(s) of {4}, and waiting for their replacements to be RUNNING ...'.format(n + 1, len(batches), len(stopping), family, stack))
+        batch_started = time.monotonic()
+        with timeline.span('rolling', 'batch {0}/{1}'.format(n + 1, len(batches))):
+            awsclient.fan_out(lambda task: awsclient.call(stage, 'ecs', 'stop_task', cluster=stack, task=task, reason='Rolling replacement by conf.py'), [(task,) for task in stopping])
+            running = wait_replaced(stage, stack, family, old_tasks, sum(len(b) for b in batches[:n + 1]), time.monotonic() + secs)
+        print('Batch {0}/{1}: replaced in {2:.0f}s ({3} old task(s) left to replace)'.format(n + 1, len(batches), time.monotonic() - batch_started, sum(len(b) for b in batches[n + 1:])))
+    if len(batches) > 0:
+        print('')
+        print('Replaced {0} {1} task(s) of {2} in {3:.0f}s, at most {4} at a time'.format(len(tasks), family, stack, time.monotonic() - started, batch))
+    return running
+
+def task_hostname(stage, stack, task):
+    '''
+    The public DNS name of the ECS host a task runs on
+    '''
+    (description,) = describe_tasks(stage, stack, [task])
+    (ci_ec2instance_map, failures) = ecs.resolve_container_instances(stage, {description['containerInstanceArn']: stack})
+    if description['containerInstanceArn'] not in ci_ec2instance_map:
+        raise Exception('The container instance of the task {0} is {1}'.format(task, failures.get(description['containerInstanceArn'], 'MISSING')))
+    output = awsclient.call(stage, 'ec2', 'describe_instances', InstanceIds=[ci_ec2instance_map[description['containerInstanceArn']]])
+    return output['Reservations'][0]['Instances'][0].get('PublicDnsName', '')
+
+def task_container(ssh, task, container):
+    '''
+    The id of the Drupal container (container is its name in the task definitions, ex. 'site-web') of a task, on the task's ECS host
+    '''
+    print('')
+    print('----')
+    cmd = '{0} docker ps --filter status=running --filter label=com.amazonaws.ecs.task-arn={1} --filter label=com.amazonaws.ecs.container-name={2} --format {3} | head -n1'.format(ssh, task, container, '{{.ID}}')
+    print('Finding the {0} container of the new task on its ECS host:\n  {1}'.format(container, cmd))
+    return sshpool.output(cmd, 'find the container of the new task')
+
+def upgrade(flavor, stage, stack, interactive=False):
+    '''
+    Follow the steps in UPGRADING-CLUSTER.md for a compute stack of a flavors.Flavor, asking the operator along the way
+
+    stage is the stage of the command line (see flavors.aws_stage). interactive runs drush with a
+    terminal, so the operator can answer its questions.
+    '''
+    awsstage = flavors.aws_stage(flavor, stage)
+    thetimeline = timeline.start('upgrade {0}'.format(stack))
+    # one SSH connection per ECS host for all the commands
+    pool = sshpool.SshPool(flavors.login_identity(flavor, stage))
+    try:
+        tasks = running_tasks(awsstage, stack, 'Drupal')
+        if len(tasks) == 0:
+            print('')
+            print('ERROR')
+            print('----')
+            print('')
+            print('We did not find a running Drupal task in the compute stack')
+            print('')
+            timeline.prompt('Press Enter to leave ... ')
+            return
+        batch = batch_size()
+        secs = timeout()
+
+        print('')
+        print('WHAT WILL HAPPEN')
+        print('----')
+        print('')
+        print('There are {0} Drupal task(s) in {1}. Each stopped task is replaced by its ECS service with a new one.'.format(len(tasks), stack))
+        print('')
+        print('THEN. One Drupal task will be stopped, and we will wait for its replacement to be RUNNING')
+        print('  * The new task runs the new Drupal software and configuration, but leaves the database alone while site_phase1 exists')
+        print('THEN. The caches will be rebuilt from the new task')
+        print('THEN. The other {0} Drupal task(s) will be stopped, {1} at a time (SITE_AWS_ROLLING_BATCH), each batch once the one before is replaced'.format(len(tasks) - 1, batch))
+        print('  * We stop if a batch is not replaced within {0}s (SITE_AWS_ROLLING_TIMEOUT)'.format(secs))
+        print('THEN. You check the site, and the database will be updated (drush updatedb) from the new task')
+        print('THEN. The site_phase2 and site_phase1 tables will be dropped, and one more Drupal task will be replaced to apply any remaining database updates')
+        print('')
+        timeline.prompt('Press Enter to proceed ... ')
+
+        # one task first, to clear the caches from a container with the new software
+        new_tasks = replace(awsstage, stack, 'Drupal', tasks[:1], 1, secs)
+        session = pool.session(task_hostname(awsstage, stack, new_tasks[0]))
+        drushssh = session.ssh_interactive if interactive else session.ssh
+        webid = task_container(session.ssh, new_tasks[0], flavor.container)
+        drushbatch.run_steps('_new_', drushssh, webid, ['cache-rebuild'], interactive)
+
+        replace(awsstage, stack, 'Drupal', tasks[1:], batch, secs)
+
+        print('')
+        print('')
+        print(' ----------------------------------------- ')
+        print('')
+        print('')
+        print('The whole cluster now runs the new Drupal software and configuration, with the database not updated yet.')
+        timeline.prompt('*Verify* the site works (ex. check its links). Press Enter to update the database ... ')
+
+        drushbatch.run_steps('_new_', drushssh, webid, ['updatedb'] + DROP_PHASE_TABLES, interactive)
+
+        cmd = '{0} docker exec {1} runuser -u drupaladmin /home/drupaladmin/bin/drush sql-query \'"SHOW TABLES"\' | grep -i ^site'.format(session.ssh, webid)
+        print('Running on the _new_ ECS host:\n  {0}'.format(cmd))
+        sshpool.call(cmd, 'show tables')
+        print('')
+        timeline.prompt('Verify that you do NOT see site_phase* tables above. Then press Enter to proceed ... ')
+
+        # the next Drupal container to start applies any remaining database updates
+        replace(awsstage, stack, 'Drupal', running_tasks(awsstage, stack, 'Drupal')[:1], 1, secs)
+
+        print('')
+        thetimeline.report()
+        thetimeline.save(timeline.history_filename(flavor.long, awsstage))
+        timeline.prompt('Press Enter to proceed ... ')
+    finally:
+        pool.close()
+        timeline.stop()
@@ -0,0 +1,138 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Multiplexed SSH sessions to the ECS hosts.
+
+The pool opens one OpenSSH master connection (ControlMaster) per host, and every command run on
+that host afterwards goes over it. Only the first command pays for the TCP connect and the key
+exchange. Closing the pool closes the master connections.
+'''
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from os.path import expanduser
+
+import timeline
+
+class SshSession:
+    '''
+    Commands on one host, over the pool's master connection to it
+    '''
+
+    def __init__(self, pool, hostname):
+        self.pool = pool
+        self.hostname = hostname
+        self.controlpath = os.path.join(pool.controldir, '%C')
+        # prefixes of a local shell command, like 'ssh -i ~/.ssh/ecs-login-dev-id_rsa -l ec2-user <hostname>'
+        self.ssh = self.ssh_command([])
+        self.ssh_interactive = self.ssh_command(['-t'])
+        self.opened = False
+
+    def ssh_command(self, flags):
+        args = ['ssh'] + flags + ['-o', 'ControlMaster=no', '-o', 'ControlPath={0}'.format(self.controlpath)] + self.pool.ssh_args()
+        return ' '.join(args + [self.hostname])
+
+    def open(self):
+        '''
+        Start the master connection in the background (ssh -f), once authenticated
+        '''
+        args = ['ssh', '-M', '-N', '-f', '-o', 'ControlPath={0}'.format(self.controlpath), '-o', 'ControlPersist=yes'] + self.pool.ssh_args() + [self.hostname]
+        print(' '.join(args))
+        # if this fails, every command just makes its own connection like before
+        with timeline.span('ssh', 'connect to {0}'.format(self.hostname), command=' '.join(args)) as s:
+            s.args['exit_code'] = subprocess.call(args, stdin=subprocess.DEVNULL)
+        self.opened = s.args['exit_code'] == 0
+
+    def close(self):
+        if not self.opened: return
+        subprocess.call(['ssh', '-o', 'ControlPath={0}'.format(self.controlpath), '-O', 'exit', self.hostname], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.opened = False
+
+    def call(self, remote, interactive=False):
+        '''
+        Run a command line on the host (the command is interpreted by the local shell, then by the remote shell)
+        '''
+        cmd = '{0} {1}'.format(self.ssh_interactive if interactive else self.ssh, remote)
+        return call(cmd, remote)
+
+    def output(self, remote):
+        '''
+        Run a command line on the host, and return its output without the trailing newline
+        '''
+        cmd = '{0} {1}'.format(self.ssh, remote)
+        return output(cmd, remote)
+
+class SshPool:
+    '''
+    One multiplexed SSH session per host, for the length of a workflow (ex. a promote)
+
+    Use it as a context manager, or call close() when done.
+    '''
+
+    def __init__(self, identity, user='ec2-user', port=None, options=None):
+        self.identity = identity
+        self.user = user
+        self.port = port
+        self.options = [] if options is None else list(options)
+        # socket paths are limited to ~100 characters, so keep the directory short
+        self.controldir = tempfile.mkdtemp(prefix='ssh-')
+        self.sessions = dict()
+        self._lock = threading.Lock()
+
+    def ssh_args(self):
+        args = ['-i', self.identity, '-l', self.user]
+        if self.port is not None: args.extend(['-p', str(self.port)])
+        for option in self.options: args.extend(['-o', option])
+        return args
+
+    def session(self, hostname):
+        '''
+        The session for a host, connecting to the host the first time it is asked for
+        '''
+        with self._lock:
+            s = self.sessions.get(hostname)
+            if s is None:
+                s = SshSession(self, hostname)
+                s.open()
+                self.sessions[hostname] = s
+        return s
+
+    def close(self):
+        with self._lock:
+            for s in self.sessions.values(): s.close()
+            self.sessions.clear()
+        shutil.rmtree(self.controldir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+def ecs_login_identity(stage=None):
+    '''
+    The ECS private key, ~/.ssh/ecs-login-<stage>-id_rsa (or ~/.ssh/ecs-login-id_rsa without a stage)
+    '''
+    if stage is None: return expanduser('~/.ssh/ecs-login-id_rsa')
+    return expanduser('~/.ssh/ecs-login-{0}-id_rsa'.format(stage))
+
+def call(cmd, label):
+    '''
+    Run a local shell command line that uses ssh (ex. '<session.ssh> uptime'), timed as label
+    '''
+    with timeline.span('ssh', label, command=cmd) as s:
+        s.args['exit_code'] = subprocess.call(cmd, shell=True)
+    return s.args['exit_code']
+
+def output(cmd, label):
+    '''
+    Like call(), but return the output without the trailing newline
+    '''
+    with timeline.span('ssh', label, command=cmd) as s:
+        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        out = p.stdout.read()
+        p.wait()
+        s.args['exit_code'] = p.returncode
+        s.args['bytes'] = len(out)
+    return out.rstrip()
@@ -0,0 +1,191 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+The parameters of the stacks of one flavor, stage and stack type, and deploying them.
+
+conf.py's ConfigMenu is a StackConfig with a menu on top, and fleet.py makes one for every
+flavor, stage and stack type it deploys to, so both deploy from the same preferences the same way.
+'''
+import os
+import sys
+import base64
+from datetime import datetime
+
+# import a file configuration library
+try:
+    import yaml
+except ImportError as e:
+    print ("FATAL: %s. Please follow the installation instructions at http://pyyaml.org/wiki/PyYAML#DownloadandInstallation" % (e))
+    sys.exit(1)
+
+import awsclient
+import deployplan
+import flavors
+import preflight
+import stackevents
+import staging
+import templates
+import timeline
+
+# the parameters conf.py works out itself, rather than taking them from the preferences
+AUTOGEN_PARAMS = ['NetworkIdFromDatabaseId', 'NetworkId', 'DatabaseId', 'ModificationTimestamp']
+
+# We cannot update with the stacks in some states
+UPDATABLE_STATUSES = ['CREATE_COMPLETE', 'UPDATE_COMPLETE', 'ROLLBACK_COMPLETE', 'UPDATE_ROLLBACK_COMPLETE']
+
+def digest_tag(flavor):
+    '''
+    The stack tag holding the digest of the template and parameters it was deployed with
+    '''
+    return '{0}:content-digest'.format(flavor.long)
+
+def load_preferences(preferencesfile):
+    '''
+    The preferences (Parameters and their Types) in a preferences file, which may be empty
+    '''
+    prefs = yaml.safe_load(preferencesfile)
+    if prefs is None:
+        prefs = {'Parameters': dict(), 'Types': dict()}
+    if 'Types' not in prefs:
+        prefs['Types'] = dict()
+    return prefs
+
+class StackConfig:
+    '''
+    The stacks of one type (network, database or compute) of a flavor in a stage
+    '''
+
+    def __init__(self, flavor, stage, stacktype, prefs, cloudparams, directory='', new_secrets=True):
+        self.flavor = flavor
+        self.stage = stage
+        # the stage of the AWS calls, which may not be the stage of the preferences
+        self.awsstage = flavors.aws_stage(flavor, stage)
+        self.stacktype = stacktype
+        # where the templates are ('' for the current directory, like conf.py)
+        self.directory = directory
+        self.prefs = prefs
+        self.templatekeys = []
+        for key,val in cloudparams.items():
+            self.templatekeys.append(key)
+            # what CloudFormation does not show, conf.py does not print either
+            if str(val.get('NoEcho', '')).lower() == 'true': awsclient.hide_parameters([key])
+            # Provide defaults for DrupalHashSalt (unless a secret nobody saved would be deployed)
+            if key not in self.prefs['Parameters'] and key == 'DrupalHashSalt' and new_secrets:
+                self.prefs['Parameters'][key] = base64.b64encode(os.urandom(64)).decode('utf-8')
+            # Skip over autogenerated parameters
+            if key in AUTOGEN_PARAMS:
+                # Clean up preference files containing autogen parameters, in case some are newly autogen
+                self.prefs['Parameters'].pop(key, None)
+                self.prefs['Types'].pop(key, None)
+                continue
+            # Provide defaults based on 'Default' in cloudformation-*.yaml
+            if key not in self.prefs['Parameters'] and 'Default' in val:
+                self.prefs['Parameters'][key] = val['Default']
+            if 'Type' in val:
+                self.prefs['Types'][key] = val['Type']
+
+    def form_params(self, network, database):
+        params = []
+        for key in self.prefs['Parameters']:
+            # Not all of our preferences are usable by this CloudFormation template
+            if key not in self.templatekeys: continue
+            # We'll do the autogenerated parameters below
+            if key in AUTOGEN_PARAMS: continue
+
+            # CommaDelimitedList values are passed through as-is; only the AWS CLI shorthand needed '\,'
+            params.append({'ParameterKey': key, 'ParameterValue': str(self.prefs['Parameters'][key])})
+
+        # Make ModificationTimestamp like 20170129T013016370623
+        modts = datetime.utcnow().isoformat('T').translate(str.maketrans('', '', ':-.'))
+        params.append({'ParameterKey': 'ModificationTimestamp', 'ParameterValue': modts})
+
+        # If we have DatabaseId=123-456, then produce NetworkIdFromDatabaseId=123
+        if self.stacktype == 'database':
+            params.append({'ParameterKey': 'NetworkId', 'ParameterValue': '{0}'.format(network)})
+        if self.stacktype == 'compute':
+            params.append({'ParameterKey': 'NetworkIdFromDatabaseId', 'ParameterValue': '{0}'.format(network)})
+            params.append({'ParameterKey': 'DatabaseId', 'ParameterValue': '{0}-{1}'.format(network, database)})
+        return params
+
+    def template_body(self):
+        with open(os.path.join(self.directory, templates.template_filename(self.stacktype)), 'r') as cloudfile:
+            return cloudfile.read()
+
+    def check(self, network, database):
+        '''
+        The parameters of a stack, once they pass the preflight checks (which make no AWS calls)
+        '''
+        params = self.form_params(network, database)
+        # a mistake in the template or the preferences fails here rather than in a rollback
+        preflight.check(self.template_body(), params)
+        return params
+
+    def common_stack_params(self, network, database):
+        templatebody = self.template_body()
+        params = self.check(network, database)
+        # what was deployed, except for the ModificationTimestamp which is new every time
+        digest = templates.deployment_digest(templatebody, params, ignore=['ModificationTimestamp'])
+        stack_params = {
+            'Parameters': params,
+            'Tags': [
+                {'Key': '{0}:stacktype'.format(self.flavor.long), 'Value': self.stacktype},
+                {'Key': digest_tag(self.flavor), 'Value': digest},
+            ],
+        }
+        return stack_params
+
+    def template_params(self):
+        '''
+        The create-stack parameters that give CloudFormation the template (see staging.template_params)
+
+        Only asked for by the requests that send the template, so a stack left unchanged stages nothing.
+        '''
+        # the template is uploaded once (by its content) and passed by URL, rather than in every request
+        return staging.template_params(self.awsstage, self.template_body())
+
+    def deployed_digests(self, stacks):
+        '''
+        The digest (digest_tag) each stack was deployed with, or None
+        '''
+        digests = {stack: None for stack in stacks}
+        if len(stacks) == 1:
+            pages = [awsclient.call(self.awsstage, 'cloudformation', 'describe_stacks', StackName=stacks[0])]
+        else:
+            # every stack of the account, a page at a time, rather than one request per stack
+            pages = awsclient.paginate(self.awsstage, 'cloudformation', 'describe_stacks')
+        missing = set(stacks)
+        for page in pages:
+            for s in page['Stacks']:
+                if s['StackName'] not in missing: continue
+                missing.discard(s['StackName'])
+                for tag in s.get('Tags', []):
+                    if tag['Key'] == digest_tag(self.flavor): digests[s['StackName']] = tag['Value']
+            if len(missing) == 0: break
+        return digests
+
+    def stack_digest(self, stack_params):
+        return [tag['Value'] for tag in stack_params['Tags'] if tag['Key'] == digest_tag(self.flavor)][0]
+
+    def deploy_job(self, job):
+        '''
+        Create or update the stack of a deployplan.Job without asking anything, and return its final status
+        '''
+        try:
+            stack_params = self.common_stack_params(job.network, job.database)
+        except preflight.PreflightError as e:
+            print('{0}: {1}'.format(job.stack, e))
+            return 'FAILED'
+        with timeline.span('deploy', '{0} {1}'.format(job.action, job.stack), stage=self.awsstage, stack=job.stack):
+            try:
+                if job.action == 'create':
+                    after = None
+                    awsclient.call(self.awsstage, 'cloudformation', 'create_stack', StackName=job.stack, **stack_params, **self.template_params())
+                else:
+                    if self.deployed_digests([job.stack])[job.stack] == self.stack_digest(stack_params):
+                        print('{0} is up to date'.format(job.stack))
+                        return deployplan.UNCHANGED
+                    after = stackevents.latest_event_id(self.awsstage, job.stack)
+                    awsclient.call(self.awsstage, 'cloudformation', 'update_stack', StackName=job.stack, **stack_params, **self.template_params())
+            except awsclient.ClientError as e:
+                print('{0}: {1}'.format(job.stack, e))
+                return 'FAILED'
+            return stackevents.wait(self.awsstage, job.stack, after)
@@ -0,0 +1,184 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Following the events of CloudFormation stacks while they are created or updated.
+
+Each poll of a stack only reads describe-stack-events until the last event already seen, so it is
+usually one small page. A stack whose events stop changing is polled less and less often (up to
+MAX_POLL_SECS apart), and one background thread polls every followed stack, so following several
+stacks at once does not multiply the requests.
+'''
+import time
+import threading
+import collections
+
+try:
+    import queue as Queue # python3
+except ImportError:
+    import Queue # python2
+
+import awsclient
+
+# how often a stack is polled: right after an event, then less and less often while nothing happens
+MIN_POLL_SECS = 2
+MAX_POLL_SECS = 30
+BACKOFF = 1.5
+
+# the stack statuses that end a create, update or delete
+FINAL_STATUSES = [
+    'CREATE_COMPLETE', 'CREATE_FAILED',
+    'ROLLBACK_COMPLETE', 'ROLLBACK_FAILED',
+    'UPDATE_COMPLETE', 'UPDATE_FAILED', 'UPDATE_ROLLBACK_COMPLETE', 'UPDATE_ROLLBACK_FAILED',
+    'DELETE_COMPLETE', 'DELETE_FAILED',
+    'IMPORT_COMPLETE', 'IMPORT_ROLLBACK_COMPLETE', 'IMPORT_ROLLBACK_FAILED',
+]
+
+# the final statuses that mean the operation worked
+SUCCESS_STATUSES = ['CREATE_COMPLETE', 'UPDATE_COMPLETE', 'DELETE_COMPLETE', 'IMPORT_COMPLETE']
+
+# One stack event, as printed to the operator
+StackEvent = collections.namedtuple('StackEvent', ['stack', 'timestamp', 'resource', 'status', 'reason', 'is_stack'])
+
+class StackTail:
+    '''
+    The new events of one stack, polled when due
+    '''
+
+    def __init__(self, stage, stack, after=None):
+        self.stage = stage
+        self.stack = stack
+        # only the events newer than this event id; None is all of them
+        self.last_event_id = after
+        self.final_status = None
+        self.interval = MIN_POLL_SECS
+        self.next_poll = 0
+
+    def poll(self):
+        '''
+        The events since the last poll, oldest first
+        '''
+        new = []
+        done = False
+        for page in awsclient.paginate(self.stage, 'cloudformation', 'describe_stack_events', quiet=True, StackName=self.stack):
+            # newest first, so stop at the first event already seen
+            for e in page['StackEvents']:
+                if e['EventId'] == self.last_event_id:
+                    done = True
+                    break
+                new.append(e)
+            if done: break
+        new.reverse()
+        if len(new) > 0: self.last_event_id = new[-1]['EventId']
+        events = []
+        for e in new:
+            is_stack = e['LogicalResourceId'] == self.stack and e.get('ResourceType') == 'AWS::CloudFormation::Stack'
+            events.append(StackEvent(self.stack, e['Timestamp'], e['LogicalResourceId'], e['ResourceStatus'], e.get('ResourceStatusReason', ''), is_stack))
+            if is_stack and e['ResourceStatus'] in FINAL_STATUSES:
+                self.final_status = e['ResourceStatus']
+        # poll again soon while things happen, and back off while they do not
+        if len(new) > 0:
+            self.interval = MIN_POLL_SECS
+        else:
+            self.interval = min(MAX_POLL_SECS, self.interval * BACKOFF)
+        self.next_poll = time.monotonic() + self.interval
+        return events
+
+class StackFollower:
+    '''
+    Follow several stacks in a background thread, until each reaches a final status (or stop() is called)
+
+    The events of all the stacks arrive, in order per stack, through the events queue; a None on
+    the queue means every stack is done.
+    '''
+
+    def __init__(self, stage, stacks, after=None):
+        if after is None: after = dict()
+        self.tails = [StackTail(stage, stack, after.get(stack)) for stack in stacks]
+        self.events = Queue.Queue()
+        self.errors = dict()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-events')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        try:
+            pending = list(self.tails)
+            while len(pending) > 0 and not self._stopped.is_set():
+                # poll whichever stacks are due, then sleep until the next one is
+                now = time.monotonic()
+                for tail in pending:
+                    if tail.next_poll > now: continue
+                    try:
+                        for event in tail.poll(): self.events.put(event)
+                    except awsclient.ClientError as e:
+                        # ex. the stack is gone
+                        self.errors[tail.stack] = str(e)
+                        tail.final_status = 'UNKNOWN'
+                pending = [tail for tail in pending if tail.final_status is None]
+                if len(pending) > 0:
+                    self._stopped.wait(max(0, min(tail.next_poll for tail in pending) - time.monotonic()))
+        finally:
+            self.events.put(None)
+
+    def statuses(self):
+        '''
+        The final status of each stack (None for those not finished)
+        '''
+        return collections.OrderedDict((tail.stack, tail.final_status) for tail in self.tails)
+
+def latest_event_id(stage, stack):
+    '''
+    The id of a stack's newest event (ex. before updating it, to follow only the events of the update)
+    '''
+    for page in awsclient.paginate(stage, 'cloudformation', 'describe_stack_events', quiet=True, StackName=stack):
+        for e in page['StackEvents']:
+            return e['EventId']
+    return None
+
+def format_event(event):
+    return '{0}  {1:<40} {2:<32} {3:<28} {4}'.format(event.timestamp.strftime('%H:%M:%S'), event.stack, event.resource, event.status, event.reason)
+
+def follow(stage, stacks, after=None):
+    '''
+    Print the events of the stacks as they come, and return their final statuses
+
+    after is the last event not to print, per stack (see latest_event_id); by default every event is printed.
+
+    Ctrl-C stops following (the stacks carry on); the statuses of unfinished stacks are then None.
+    '''
+    follower = StackFollower(stage, stacks, after).start()
+    print('Following the events of {0} (Ctrl-C to stop following) ...'.format(', '.join(stacks)))
+    try:
+        while True:
+            # a timeout, so Ctrl-C is noticed while waiting
+            try:
+                event = follower.events.get(timeout=1)
+            except Queue.Empty:
+                continue
+            if event is None: break
+            print(format_event(event))
+    except KeyboardInterrupt:
+        follower.stop()
+        print('Stopped following.')
+    for (stack, error) in sorted(follower.errors.items()):
+        print('{0}: {1}'.format(stack, error))
+    return follower.statuses()
+
+def wait(stage, stack, after=None):
+    '''
+    Print the events of one stack, from the calling thread, until it is done, and return its final status
+
+    Unlike follow(), several threads can each wait for their own stack (ex. see deployplan.py).
+    '''
+    tail = StackTail(stage, stack, after)
+    while tail.final_status is None:
+        time.sleep(max(0, tail.next_poll - time.monotonic()))
+        # one write per line, so the lines of stacks waited for at the same time do not mix
+        for event in tail.poll(): print(format_event(event) + '\n', end='')
+    return tail.final_status
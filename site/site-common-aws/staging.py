@@ -0,0 +1,110 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Staging templates in S3 by their content, for CloudFormation to read them from there.
+
+CloudFormation takes at most INLINE_LIMIT bytes of template in the request itself (TemplateBody),
+and sending the whole template with every create, update and change set is wasted anyway. Instead
+a template is minified (parsed, and written as compact JSON), uploaded once as
+templates/<sha256>.json and passed by URL (TemplateURL). The key is the hash of the content, so a
+template already in the bucket is never uploaded again, and every stack of a template shares it.
+
+The bucket is SITE_AWS_TEMPLATE_BUCKET, or else site-aws-templates-<account>-<region>, which is
+created when first needed. With SITE_AWS_ENDPOINT_URL the bucket is in the local AWS stand-in too.
+'''
+import os
+import json
+import threading
+
+import awsclient
+import templates
+
+# the most bytes of template CloudFormation takes in a TemplateBody
+INLINE_LIMIT = 51200
+
+KEY_PREFIX = 'templates/'
+
+_lock = threading.Lock()
+_buckets = dict()
+# (stage, key) of the templates already in the bucket
+_staged = set()
+
+def normalize(node):
+    '''
+    A parsed template as CloudFormation's JSON form has it (ex. the list form of Fn::GetAtt)
+    '''
+    if isinstance(node, list): return [normalize(value) for value in node]
+    if not isinstance(node, dict): return node
+    value = dict((key, normalize(value)) for (key, value) in node.items())
+    if isinstance(value.get('Fn::GetAtt'), str): value['Fn::GetAtt'] = value['Fn::GetAtt'].split('.', 1)
+    return value
+
+def minify(body):
+    '''
+    The template as compact JSON, made only if the template changed since last time
+    '''
+    return templates.cached(templates.content_hash(body), 'minified', lambda: json.dumps(normalize(templates.parse(body)), separators=(',', ':'), sort_keys=True))
+
+def bucket_name(stage):
+    '''
+    The bucket the templates of a stage go to
+    '''
+    if os.environ.get('SITE_AWS_TEMPLATE_BUCKET'): return os.environ['SITE_AWS_TEMPLATE_BUCKET']
+    if stage not in _buckets:
+        account = awsclient.call(stage, 'sts', 'get_caller_identity', quiet=True)['Account']
+        _buckets[stage] = 'site-aws-templates-{0}-{1}'.format(account, awsclient.client(stage, 's3').meta.region_name)
+    return _buckets[stage]
+
+def template_url(stage, bucket, key):
+    if awsclient.endpoint_url() is not None:
+        # the stand-in serves its buckets by path
+        return '{0}/{1}/{2}'.format(awsclient.endpoint_url().rstrip('/'), bucket, key)
+    return 'https://{0}.s3.{1}.amazonaws.com/{2}'.format(bucket, awsclient.client(stage, 's3').meta.region_name, key)
+
+def missing(e):
+    return e.response.get('Error', {}).get('Code') in ['404', 'NoSuchKey', 'NoSuchBucket', 'NotFound']
+
+def create_bucket(stage, bucket):
+    try:
+        awsclient.call(stage, 's3', 'head_bucket', quiet=True, Bucket=bucket)
+        return
+    except awsclient.ClientError as e:
+        if not missing(e): raise
+    region = awsclient.client(stage, 's3').meta.region_name
+    if region == 'us-east-1':
+        awsclient.call(stage, 's3', 'create_bucket', Bucket=bucket)
+    else:
+        awsclient.call(stage, 's3', 'create_bucket', Bucket=bucket, CreateBucketConfiguration={'LocationConstraint': region})
+
+def staged_url(stage, body):
+    '''
+    The URL of the minified template in the stage's bucket, uploading it only if it is not there yet
+    '''
+    minified = minify(body).encode('utf-8')
+    key = '{0}{1}.json'.format(KEY_PREFIX, templates.content_hash(minified))
+    # one upload even when several jobs deploy the same template at once
+    with _lock:
+        bucket = bucket_name(stage)
+        if (stage, key) not in _staged:
+            try:
+                awsclient.call(stage, 's3', 'head_object', quiet=True, Bucket=bucket, Key=key)
+            except awsclient.ClientError as e:
+                if not missing(e): raise
+                create_bucket(stage, bucket)
+                awsclient.call(stage, 's3', 'put_object', Bucket=bucket, Key=key, Body=minified, ContentType='application/json')
+            _staged.add((stage, key))
+    return template_url(stage, bucket, key)
+
+def template_params(stage, body):
+    '''
+    The create-stack parameters that give CloudFormation the template: TemplateURL
+
+    If the template cannot be staged (ex. no S3 permissions), TemplateBody with the minified
+    template instead, as long as it is small enough.
+    '''
+    try:
+        return {'TemplateURL': staged_url(stage, body)}
+    except awsclient.ClientError as e:
+        minified = minify(body)
+        if len(minified.encode('utf-8')) > INLINE_LIMIT: raise
+        print('Could not stage the template in S3, so it is sent inline: {0}'.format(e))
+        return {'TemplateBody': minified}
@@ -0,0 +1,125 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Reading the cloudformation-<stacktype>.yaml templates.
+
+Templates are parsed with libyaml (the C loader) when PyYAML was built with it, and understand the
+CloudFormation short forms (!Ref, !Sub, !Join, !GetAtt). The Parameters section, which is all that
+conf.py needs to start, is cached on disk by the hash of the template's content, so an unchanged
+template is not parsed again.
+
+The same hash, together with the parameters, tells whether a deployed stack is already up to date
+(see deployment_digest).
+'''
+import os
+import sys
+import json
+import hashlib
+import tempfile
+from os.path import expanduser
+
+# import a file configuration library
+try:
+    import yaml
+except ImportError as e:
+    print ("FATAL: %s. Please follow the installation instructions at http://pyyaml.org/wiki/PyYAML#DownloadandInstallation" % (e))
+    sys.exit(1)
+
+CACHE_DIR = expanduser('~/.cache/site-aws/templates')
+
+# the C loader is many times faster than the pure Python one
+try:
+    BaseLoader = yaml.CSafeLoader
+except AttributeError:
+    BaseLoader = yaml.SafeLoader
+
+class TemplateLoader(BaseLoader):
+    '''
+    A safe YAML loader for CloudFormation templates
+    '''
+
+# handle !Ref and other YAML constructors
+def ref_constructor(loader, node):
+    value = loader.construct_scalar(node)
+    return { 'Ref' : value }
+def sub_constructor(loader, node):
+    value = loader.construct_scalar(node)
+    return { 'Fn::Sub' : value }
+def join_constructor(loader, node):
+    value = loader.construct_sequence(node)
+    return { 'Fn::Join' : value }
+def getatt_constructor(loader, node):
+    value = loader.construct_scalar(node)
+    return { 'Fn::GetAtt' : value }
+TemplateLoader.add_constructor(u'!Ref', ref_constructor)
+TemplateLoader.add_constructor(u'!Sub', sub_constructor)
+TemplateLoader.add_constructor(u'!Join', join_constructor)
+TemplateLoader.add_constructor(u'!GetAtt', getatt_constructor)
+
+def template_filename(stacktype):
+    return 'cloudformation-{0}.yaml'.format(stacktype)
+
+def content_hash(body):
+    '''
+    The SHA-256 of a template's content (bytes or str)
+    '''
+    if not isinstance(body, bytes): body = body.encode('utf-8')
+    return hashlib.sha256(body).hexdigest()
+
+def deployment_digest(body, parameters, ignore=()):
+    '''
+    The SHA-256 of a template's content and its parameters (a list of {'ParameterKey': .., 'ParameterValue': ..})
+
+    Parameters named in ignore (ex. a timestamp that changes on every deploy) do not count, and
+    neither does the order of the parameters.
+    '''
+    h = hashlib.sha256(content_hash(body).encode('utf-8'))
+    for param in sorted(parameters, key=lambda param: param['ParameterKey']):
+        if param['ParameterKey'] in ignore: continue
+        h.update(json.dumps([param['ParameterKey'], param['ParameterValue']]).encode('utf-8'))
+        h.update(b'\n')
+    return h.hexdigest()
+
+def parse(body):
+    '''
+    The whole template as Python objects
+    '''
+    return yaml.load(body, Loader=TemplateLoader)
+
+def cached(digest, kind, compute):
+    '''
+    The JSON value cached as <digest>.<kind>.json, or compute() (which is then cached)
+    '''
+    cachefilename = os.path.join(CACHE_DIR, '{0}.{1}.json'.format(digest, kind))
+    try:
+        with open(cachefilename, 'r') as cachefile:
+            return json.load(cachefile)
+    except (OSError, ValueError):
+        pass
+    # the same (JSON) types whether or not the value came from the cache
+    value = json.loads(json.dumps(compute(), default=str))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # write then rename, so a concurrent conf.py never reads half a file; the temporary file is
+    # unique, since threads of one conf.py may fill the same entry at once
+    (fd, tmpfilename) = tempfile.mkstemp(dir=CACHE_DIR, prefix=os.path.basename(cachefilename) + '.')
+    try:
+        with os.fdopen(fd, 'w') as cachefile:
+            json.dump(value, cachefile)
+        os.replace(tmpfilename, cachefilename)
+    except:
+        os.remove(tmpfilename)
+        raise
+    return value
+
+def parameters(filename):
+    '''
+    The Parameters section of a template file, parsed only if the template changed since last time
+    '''
+    with open(filename, 'rb') as templatefile:
+        body = templatefile.read()
+    return body_parameters(body)
+
+def body_parameters(body):
+    '''
+    The Parameters section of a template's content, parsed only if the template changed since last time
+    '''
+    return cached(content_hash(body), 'parameters', lambda: parse(body).get('Parameters', dict()))
@@ -0,0 +1,230 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+A timeline of the external calls (AWS, ssh, drush) and operator prompts of one workflow (ex. a promote).
+
+start() makes a timeline active. While it is active, awsclient.py, sshpool.py and drushbatch.py add
+a span to it for every call they make, timed with a monotonic clock. The breakdown then tells how
+long the site was in maintenance (returning 503s) and which steps took that time.
+
+Set SITE_AWS_TRACE to a file name to also trace every external call of the whole conf.py session,
+whether a workflow is active or not. The trace is written when conf.py exits, in the Chrome trace
+event format: open it with chrome://tracing or https://ui.perfetto.dev .
+'''
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+import collections
+from os.path import expanduser
+
+# where every timeline is kept, one JSON line per workflow
+HISTORY_DIR = expanduser('~/.local/share/site-aws')
+
+# the drush steps that start and end the maintenance window
+MAINTENANCE_ON = 'drush sset system.maintenance_mode 1'
+MAINTENANCE_OFF = 'drush sset system.maintenance_mode 0'
+
+# One timed call. start and end are seconds since the timeline started; args are details like the exit code.
+Span = collections.namedtuple('Span', ['category', 'label', 'start', 'end', 'thread', 'args'])
+
+_lock = threading.Lock()
+_active = None
+_trace = None
+
+class Timeline:
+    '''
+    The spans of one workflow, in the order they started
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.origin = time.monotonic()
+        self.spans = []
+
+    def add(self, category, label, start, end, args=None):
+        span = Span(category, label, start - self.origin, end - self.origin, threading.current_thread().name, args or dict())
+        with _lock:
+            self.spans.append(span)
+
+    def find(self, label):
+        '''
+        The first span with the label, or None
+        '''
+        for span in self.spans:
+            if span.label == label: return span
+        return None
+
+    def window(self, begin=MAINTENANCE_ON, end=MAINTENANCE_OFF):
+        '''
+        (start, end) of the time between the end of the begin span and the end of the end span, or None
+        '''
+        b = self.find(begin)
+        e = self.find(end)
+        if b is None or e is None: return None
+        return (b.end, e.end)
+
+    def totals(self, start=None, end=None):
+        '''
+        The seconds spent per category, counting only the time between start and end
+        '''
+        totals = collections.OrderedDict()
+        for span in sorted(self.spans, key=lambda s: s.start):
+            s = span.start if start is None else max(span.start, start)
+            e = span.end if end is None else min(span.end, end)
+            if e <= s: continue
+            totals[span.category] = totals.get(span.category, 0) + (e - s)
+        return totals
+
+    def report(self):
+        '''
+        Print every span, the time per category, and the maintenance window
+        '''
+        window = self.window()
+        print('Timeline of {0}:'.format(self.name))
+        for span in sorted(self.spans, key=lambda s: s.start):
+            inside = '*' if window is not None and span.end > window[0] and span.start < window[1] else ' '
+            print('  {0} {1:8.1f}s {2:7.1f}s  {3:<9} {4}'.format(inside, span.start, span.end - span.start, span.category, span.label))
+        print('Total per category:')
+        for (category, secs) in self.totals().items():
+            print('  {0:7.1f}s  {1}'.format(secs, category))
+        if window is None:
+            print('The site was not put in maintenance')
+            return
+        print('The site was in maintenance (503) for {0:.1f}s (the spans marked *), spent on:'.format(window[1] - window[0]))
+        for (category, secs) in self.totals(window[0], window[1]).items():
+            print('  {0:7.1f}s  {1}'.format(secs, category))
+
+    def to_dict(self):
+        window = self.window()
+        return {
+            'name': self.name,
+            'started': self.started,
+            'maintenance_secs': None if window is None else window[1] - window[0],
+            'spans': [span._asdict() for span in self.spans],
+        }
+
+    def save(self, filename):
+        '''
+        Append the timeline as one JSON line to filename (ex. history_filename('buildbarbuda', 'prod'))
+        '''
+        dirname = os.path.dirname(filename)
+        if dirname: os.makedirs(dirname, exist_ok=True)
+        with open(filename, 'a') as f:
+            f.write(json.dumps(self.to_dict()) + '\n')
+
+    def chrome_trace(self):
+        '''
+        The spans as Chrome trace events (complete events, in microseconds), one track per thread
+        '''
+        tids = collections.OrderedDict()
+        events = []
+        for span in self.spans:
+            tid = tids.setdefault(span.thread, len(tids) + 1)
+            events.append({'name': span.label, 'cat': span.category, 'ph': 'X', 'pid': 1, 'tid': tid,
+                'ts': int(span.start * 1e6), 'dur': int((span.end - span.start) * 1e6), 'args': span.args})
+        for (thread, tid) in tids.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': thread}})
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': self.name}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'started': self.started}}
+
+    def save_chrome_trace(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+def history_filename(flavorlong, stage):
+    return os.path.join(HISTORY_DIR, '{0}.{1}.timelines.jsonl'.format(flavorlong, stage))
+
+def start(name):
+    '''
+    Make a new timeline the active one, and return it
+    '''
+    global _active
+    _active = Timeline(name)
+    return _active
+
+def stop():
+    '''
+    Stop recording, and return the timeline that was active (if any)
+    '''
+    global _active
+    (timeline, _active) = (_active, None)
+    return timeline
+
+def active():
+    return _active
+
+def start_trace(filename):
+    '''
+    Trace every span from now on, and write them to filename (Chrome trace format) when the process exits
+    '''
+    global _trace
+    _trace = Timeline(os.path.basename(sys.argv[0]) or 'python')
+    atexit.register(_trace.save_chrome_trace, filename)
+    return _trace
+
+def record(category, label, start, end, **args):
+    '''
+    Add a span (times from time.monotonic()) to the active timeline and to the trace, if any
+    '''
+    for t in (_active, _trace):
+        if t is not None: t.add(category, label, start, end, args)
+
+def trace(category, label, start, end, **args):
+    '''
+    Like record(), but only for the trace (ex. a span that contains spans already in the active timeline)
+    '''
+    if _trace is not None: _trace.add(category, label, start, end, args)
+
+class span:
+    '''
+    Record the time spent in a with block, if a timeline is active or tracing is on:
+
+        with timeline.span('aws', 'ecs describe-tasks', stage='dev') as s:
+            ...
+            s.args['bytes'] = 1234
+    '''
+
+    def __init__(self, category, label, **args):
+        self.category = category
+        self.label = label
+        self.args = args
+        # set to True in the with block to not record it after all
+        self.skip = False
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.skip or (_active is None and _trace is None): return
+        if exc_type is not None: self.args.setdefault('error', exc_type.__name__)
+        record(self.category, self.label, self.start, time.monotonic(), **self.args)
+
+def traced(function):
+    '''
+    Decorator tracing each call of a conf.py action (ex. update_stack) as one span, named after its arguments
+    '''
+    @functools.wraps(function)
+    def wrapper(self, *args):
+        label = ' '.join([function.__name__] + [str(a) for a in args if a is not None])
+        start = time.monotonic()
+        try:
+            return function(self, *args)
+        finally:
+            # the trace only: a workflow's timeline has just the calls made within it
+            trace('conf.py', label, start, time.monotonic())
+    return wrapper
+
+def prompt(message):
+    '''
+    input(message), with the time waiting for the operator recorded
+    '''
+    with span('operator', message.strip()):
+        return input(message)
+
+if os.environ.get('SITE_AWS_TRACE'):
+    start_trace(os.environ['SITE_AWS_TRACE'])
@@ -0,0 +1,116 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Read-only checks, on a new Drupal container, of what a promote would apply to the database.
+
+Before the old site is put into maintenance, one drush batch on a new container lists the pending
+database updates (hook_update_N and post updates), the entity and field definitions that do not
+match the database schema, and the requirements in error. Nothing is changed. If there is nothing
+to apply, the promote does not need the maintenance window at all; otherwise the past promotes (see
+timeline.history_filename) tell about how long the window will be.
+'''
+import io
+import json
+import shlex
+import collections
+
+import drushbatch
+
+# printed by the check before its JSON result
+MARKER = '##site-pending'
+
+# the pending updates and entity/field definition changes, as JSON, from a PHP one-liner for drush php-eval
+# (without single quotes, so it shell-quotes simply)
+PENDING_PHP = ' '.join([
+    'require_once DRUPAL_ROOT . "/core/includes/install.inc";',
+    'require_once DRUPAL_ROOT . "/core/includes/update.inc";',
+    'drupal_load_updates();',
+    '$updates = array();',
+    'foreach (update_get_update_list() as $module => $info) { foreach (array_keys(isset($info["pending"]) ? $info["pending"] : array()) as $n) { $updates[] = $module . " " . $n; } }',
+    '$post = \\Drupal::service("update.post_update_registry")->getPendingUpdateFunctions();',
+    '$entity = array();',
+    'foreach (\\Drupal::entityDefinitionUpdateManager()->getChangeSummary() as $type => $changes) { foreach ($changes as $change) { $entity[] = $type . ": " . strip_tags((string) $change); } }',
+    'echo "' + MARKER + ' " . json_encode(array("updates" => $updates, "post_updates" => array_values($post), "entity_changes" => $entity)) . "\\n";',
+])
+
+# the drush steps of the checks; the requirements are only shown, for the operator
+STEPS = ['php-eval {0}'.format(shlex.quote(PENDING_PHP)), 'core-requirements --severity=2']
+
+# What a promote would apply. Each is a list of strings (ex. 'system 8201', 'node: The Content entity type needs to be updated.').
+Pending = collections.namedtuple('Pending', ['updates', 'post_updates', 'entity_changes'])
+
+def parse(out):
+    '''
+    (the Pending in the output of the checks or None if the check did not finish, the other lines of the output)
+    '''
+    pending = None
+    others = []
+    for line in out.splitlines():
+        if line.strip().startswith(MARKER + ' '):
+            found = json.loads(line.strip()[len(MARKER) + 1:])
+            pending = Pending(found['updates'], found['post_updates'], found['entity_changes'])
+        else:
+            others.append(line)
+    return (pending, others)
+
+def nothing_to_apply(pending):
+    return pending is not None and len(pending.updates) + len(pending.post_updates) + len(pending.entity_changes) == 0
+
+def describe(pending):
+    '''
+    What is pending, as lines to print
+    '''
+    if pending is None: return ['The pending updates could not be listed; the promote goes into maintenance to be safe']
+    lines = []
+    for (title, items) in [('database update(s)', pending.updates), ('post update(s)', pending.post_updates), ('entity/field definition change(s)', pending.entity_changes)]:
+        lines.append('{0} pending {1}'.format(len(items), title))
+        lines.extend('  ' + item for item in items)
+    return lines
+
+def median(values):
+    values = sorted(values)
+    if len(values) == 0: return None
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 == 1 else (values[middle - 1] + values[middle]) / 2.0
+
+def estimate(historyfile):
+    '''
+    (median maintenance seconds, median seconds of drush updatedb, number of promotes) of the past promotes in a timeline history file
+    '''
+    windows = []
+    updatedbs = []
+    for line in historyfile:
+        if line.strip() == '': continue
+        record = json.loads(line)
+        if record.get('maintenance_secs') is None: continue
+        windows.append(record['maintenance_secs'])
+        updatedbs.extend(span['end'] - span['start'] for span in record['spans'] if span['label'] == 'drush updatedb')
+    return (median(windows), median(updatedbs), len(windows))
+
+def describe_estimate(historyfilename):
+    try:
+        with open(historyfilename, 'r') as historyfile:
+            (window, updatedb, count) = estimate(historyfile)
+    except FileNotFoundError:
+        count = 0
+    if count == 0: return 'There is no past promote to estimate the maintenance window from'
+    text = 'The past {0} promote(s) were in maintenance for a median of {1:.0f}s'.format(count, window)
+    if updatedb is not None: text += ', of which drush updatedb took a median of {0:.0f}s'.format(updatedb)
+    return text
+
+def run(ssh, container):
+    '''
+    Run the checks in a Drupal container, over ssh (ex. SshSession.ssh), show what they found, and return the Pending (or None)
+    '''
+    print('')
+    print('----')
+    cmd = drushbatch.remote_command(ssh, container, STEPS)
+    print('Checking what the promote would apply, without changing anything, on the _new_ ECS host:\n  {0}'.format(cmd))
+    out = io.StringIO()
+    results = drushbatch.run(cmd, STEPS, out=out)
+    (pending, others) = parse(out.getvalue())
+    for line in others: print(line)
+    print('')
+    drushbatch.report(results)
+    print('')
+    for line in describe(pending): print(line)
+    return pending
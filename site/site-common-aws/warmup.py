@@ -0,0 +1,177 @@
+# vim: autoindent smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python:
+'''
+Warming up the caches of new Drupal tasks before visitors reach them.
+
+A new Drupal has just run cache-rebuild, so its first visitors would wait for the page and render
+caches and the CSS/JS aggregates to be built. A warm-up requests a list of URLs from every new
+Drupal binding directly, from its own ECS host (curl to 127.0.0.1:<host port>, with the site's
+host name), so the load balancer is not involved.
+
+SITE_AWS_WARMUP chooses the URLs: a file with one URL (or path) per line, or 'sitemap' for the
+URLs in the site's /sitemap.xml. Without it there is no warm-up. Paths are on the host
+SITE_AWS_WARMUP_HOST (default: the flavor's, ex. buildbarbuda.org). Every binding is warmed up at
+once, each with at most SITE_AWS_WARMUP_CONCURRENCY (default 4) requests at a time, in one remote
+process (curl under xargs -P).
+'''
+import os
+import re
+import shlex
+import collections
+import urllib.parse
+import xml.etree.ElementTree
+
+import awsclient
+import sshpool
+
+DEFAULT_CONCURRENCY = 4
+
+# a request slower than this is given up on
+MAX_TIME_SECS = 60
+
+# at most this many URLs are taken from a sitemap
+MAX_SITEMAP_URLS = 200
+
+# what curl prints for each request
+WRITE_OUT = '%{http_code} %{time_total} %{url_effective}\\n'
+WRITE_OUT_PATTERN = re.compile(r'^([0-9]{3}) ([0-9.]+) (\S+)\s*$')
+
+# One warm-up request. status is the HTTP status code (0 if there was no response).
+Request = collections.namedtuple('Request', ['url', 'status', 'secs'])
+
+def enabled():
+    return os.environ.get('SITE_AWS_WARMUP', '') != ''
+
+def concurrency():
+    try:
+        return max(1, int(os.environ.get('SITE_AWS_WARMUP_CONCURRENCY', DEFAULT_CONCURRENCY)))
+    except ValueError:
+        raise Exception('SITE_AWS_WARMUP_CONCURRENCY must be a number of requests, not {0}'.format(os.environ['SITE_AWS_WARMUP_CONCURRENCY']))
+
+def site_url(line, host):
+    '''
+    The URL of a line of the URL list: a URL as is, or a path on host
+    '''
+    if '://' in line: return line
+    return 'https://{0}{1}'.format(host, line if line.startswith('/') else '/' + line)
+
+def read_urls(urlsfile, host):
+    '''
+    The URLs of a URL list, skipping empty lines and # comments
+    '''
+    lines = [line.strip() for line in urlsfile]
+    return [site_url(line, host) for line in lines if line != '' and not line.startswith('#')]
+
+def sitemap_locs(body):
+    '''
+    (is a sitemap index, the <loc> of each entry) of a sitemap.xml
+    '''
+    root = xml.etree.ElementTree.fromstring(body)
+    # the tags are in the sitemap namespace, ex. {http://www.sitemaps.org/schemas/sitemap/0.9}loc
+    locs = [element.text.strip() for element in root.iter() if element.tag.split('}')[-1] == 'loc' and element.text]
+    return (root.tag.split('}')[-1] == 'sitemapindex', locs)
+
+def binding_url(url, port):
+    '''
+    The URL as requested on the ECS host: the same scheme, host name and path, on the binding's host port
+    '''
+    parts = urllib.parse.urlsplit(url)
+    return urllib.parse.urlunsplit((parts.scheme, '{0}:{1}'.format(parts.hostname, port), parts.path or '/', parts.query, ''))
+
+def script(urls, port, concurrency):
+    '''
+    The shell script that requests the URLs from 127.0.0.1:port, concurrency at a time
+    '''
+    resolves = ['--resolve {0}'.format(shlex.quote('{0}:{1}:127.0.0.1'.format(host, port))) for host in sorted({urllib.parse.urlsplit(url).hostname for url in urls})]
+    return 'printf "%s\\n" {0} | xargs -n 1 -P {1} curl -sk -o /dev/null --max-time {2} {3} -w {4}'.format(
+        ' '.join(shlex.quote(binding_url(url, port)) for url in urls), concurrency, MAX_TIME_SECS, ' '.join(resolves), shlex.quote(WRITE_OUT))
+
+def remote_command(ssh, urls, port, concurrency):
+    '''
+    The local shell command that runs the warm-up script on the ECS host, over ssh (ex. SshSession.ssh)
+    '''
+    return '{0} {1}'.format(ssh, shlex.quote(script(urls, port, concurrency)))
+
+def parse(out):
+    '''
+    The Requests in what the warm-up script printed (other lines are left out)
+    '''
+    requests = []
+    for line in out.splitlines():
+        m = WRITE_OUT_PATTERN.match(line)
+        if m is None: continue
+        requests.append(Request(m.group(3), int(m.group(1)), float(m.group(2))))
+    return requests
+
+def binding_hosts(stage, binds, ci_ec2instance_map):
+    '''
+    The (public DNS name of the ECS host, host port) of each binding whose host is running
+    '''
+    instances = sorted({ci_ec2instance_map[ci] for (ci, port) in binds if ci in ci_ec2instance_map})
+    if len(instances) == 0: return []
+    output = awsclient.call(stage, 'ec2', 'describe_instances', InstanceIds=instances)
+    hostnames = {i['InstanceId']: i.get('PublicDnsName', '') for r in output['Reservations'] for i in r['Instances']}
+    return sorted((hostnames[ci_ec2instance_map[ci]], port) for (ci, port) in binds if hostnames.get(ci_ec2instance_map.get(ci), '') != '')
+
+def sitemap_urls(pool, hostname, port, host):
+    '''
+    The URLs in the sitemap of the Drupal bound to port on hostname (following a sitemap index), at most MAX_SITEMAP_URLS
+    '''
+    urls = []
+    sitemaps = ['https://{0}/sitemap.xml'.format(host)]
+    while len(sitemaps) > 0 and len(urls) < MAX_SITEMAP_URLS:
+        sitemap = sitemaps.pop(0)
+        cmd = '{0} {1}'.format(pool.session(hostname).ssh, shlex.quote('curl -sk --max-time {0} --resolve {1} {2}'.format(
+            MAX_TIME_SECS, shlex.quote('{0}:{1}:127.0.0.1'.format(urllib.parse.urlsplit(sitemap).hostname, port)), shlex.quote(binding_url(sitemap, port)))))
+        print('Reading the sitemap on the new ECS host:\n  {0}'.format(cmd))
+        try:
+            (index, locs) = sitemap_locs(sshpool.output(cmd, 'read {0}'.format(sitemap)))
+        except xml.etree.ElementTree.ParseError as e:
+            print('The sitemap {0} is not XML ({1}); leaving it out'.format(sitemap, e))
+            continue
+        if index: sitemaps.extend(locs)
+        else: urls.extend(locs)
+    return urls[:MAX_SITEMAP_URLS]
+
+def run(cmd, label):
+    '''
+    Run a warm-up command (see remote_command), and return its Requests
+    '''
+    return parse(sshpool.output(cmd, label))
+
+def report(results):
+    '''
+    Print how long the warm-up of each binding took, and its slowest requests
+    '''
+    print('Warm-up:')
+    for ((hostname, port), requests) in sorted(results.items()):
+        failed = [r for r in requests if r.status < 200 or r.status >= 400]
+        total = sum(r.secs for r in requests)
+        print('  {0}:{1}  {2} request(s), {3} failed, {4:.1f}s of requests'.format(hostname, port, len(requests), len(failed), total))
+        for r in sorted(requests, key=lambda r: r.secs, reverse=True)[:3]:
+            print('    {0:>6.2f}s  {1}  {2}'.format(r.secs, r.status, urllib.parse.urlsplit(r.url).path))
+
+def warm_up(stage, pool, plan, default_host):
+    '''
+    Request the URLs of SITE_AWS_WARMUP from every new Drupal binding of a promote.Plan, and report how it went
+    '''
+    if not enabled(): return None
+    hosts = binding_hosts(stage, plan.new_drupal_binds, plan.ci_ec2instance_map)
+    if len(hosts) == 0: return None
+    host = os.environ.get('SITE_AWS_WARMUP_HOST', default_host)
+    print('')
+    print('----')
+    if os.environ['SITE_AWS_WARMUP'] == 'sitemap':
+        urls = sitemap_urls(pool, hosts[0][0], hosts[0][1], host)
+    else:
+        with open(os.path.expanduser(os.environ['SITE_AWS_WARMUP']), 'r') as urlsfile:
+            urls = read_urls(urlsfile, host)
+    if len(urls) == 0:
+        print('No URLs to warm up the new Drupal services with')
+        return None
+    n = concurrency()
+    print('Warming up {0} new Drupal service(s) with {1} URL(s), {2} at a time each ...'.format(len(hosts), len(urls), n))
+    commands = [(remote_command(pool.session(hostname).ssh, urls, port, n), 'warm up {0}:{1}'.format(hostname, port)) for (hostname, port) in hosts]
+    results = dict(zip(hosts, awsclient.fan_out(run, commands)))
+    print('')
+    report(results)
+    return results
@@ -15,6 +15,144 @@ This simplifies upgrading the site.
 ./conf.py dev compute
 ```
 
+The list of stacks is cached for a few minutes (`SITE_AWS_STACKS_TTL` seconds), so opening `conf.py` again during a deploy is quick.
+Use `./conf.py dev compute --refresh`, or `Refresh the list of stacks` in the menu, to fetch it again.
+The list of stacks is only fetched when you open the Stacks menu, and the template's Parameters are cached
+(in `~/.cache/site-aws/templates`) until the template changes, so the main menu shows right away; it says how long that took.
+
+The Stacks menu shows 15 stacks at a time, one line per stack; select a stack for what can be done with it (changeset, update, ...).
+Use PgDn and PgUp (or `>` and `<`) for the other pages, and type `/` to filter the stacks as you type:
+every word must be in the stack's name, status or creation time (ex. `123-45 rollback`); press Enter when done.
+
+# Updating
+
+After creating or updating a stack, `conf.py` shows the stack's events as they happen and its final status.
+Press Ctrl-C to stop following them; the stack carries on.
+
+Before anything is sent to CloudFormation, `conf.py` checks the template and the parameters itself, and stops with a list of the problems, if any:
+every `Ref`, `Fn::GetAtt`, `Fn::Sub` variable, condition, mapping and `DependsOn` must name something in the template,
+and every parameter value must suit its `Type`, `AllowedValues`, `AllowedPattern`, length and range
+(a `CommaDelimitedList` is written with plain commas, not the `\,` of the AWS CLI shorthand).
+`conf.py <stage> deploy` checks every stack before deploying any.
+
+Templates are not sent with each request. `conf.py` uploads each template once, minified to compact JSON, to
+`s3://site-aws-templates-<account>-<region>/templates/<sha256>.json` (or the bucket named by `SITE_AWS_TEMPLATE_BUCKET`),
+and gives CloudFormation its URL; a template that is already there is not uploaded again.
+That also keeps the templates clear of CloudFormation's 51,200 byte limit for a template sent inline.
+
+Every stack is tagged with `<flavor>:content-digest`, a digest of its template and parameters (leaving out `ModificationTimestamp`).
+If you update a stack, or create a changeset for it, with the same template and parameters it was deployed with,
+`conf.py` says so and skips the update unless you type `yes`; otherwise the new `ModificationTimestamp` alone would replace its instances and tasks.
+
+Creating a changeset shows what it would change, one resource per line: `+` added, `~` modified, `-` removed,
+and `!` replaced (`?` maybe replaced) - a replacement usually means downtime, so those come first.
+Type `yes` to execute it and follow the stack's events, or press Enter to leave it for later.
+With more than one stack of a type, `Create changesets for all <type> stacks` creates them all concurrently,
+shows them together and executes them together; stacks already up to date are skipped.
+
+# Background jobs
+
+Set `Run stack creates and updates in the background` to `yes` in the main menu, and creating or updating a stack
+starts a background job instead of taking over the terminal: the menu stays usable, so several stacks can be created or updated at once.
+A background update of a stack that is already up to date does nothing (it does not ask).
+The menus show how many jobs are running, and `Background jobs` lists them, with their time and the last line they printed;
+select one to see the end of its log (each job's output is kept in `~/.local/share/site-aws/jobs`).
+Changesets, marking and promoting ask questions as they go, so they always run in the foreground.
+When you leave the menu, `conf.py` waits for the running jobs (Ctrl-C leaves them running in AWS).
+
+# Deploying without the menu
+
+`conf.py <stage> deploy` creates and updates stacks without the menu, each stack as soon as the stacks it uses are done:
+a database waits for its network, and a compute waits for its database and network, when those are deployed too.
+Everything else is deployed at the same time, so it takes as long as the longest network, database and compute chain.
+
+```
+# two new environments (network, database and compute each), side by side
+./conf.py dev deploy --environments 2
+# update some stacks; pc-network-123 first, then pc-database-123-456
+./conf.py dev deploy pc-network-123 pc-database-123-456 pc-compute-789-12-345
+# update every stack that can be updated; those already up to date are skipped
+./conf.py dev deploy all --yes
+```
+
+It shows the order it will deploy in and asks for `yes` (unless `--yes`), then shows the events of every stack, and a summary.
+A stack is skipped if a stack it uses failed; `conf.py` then exits with 1.
+
+# Every flavor and stage at once
+
+`../site-common-aws/fleet.py` runs one operation on the stacks of several flavors (`bb`, `pc`) and stages at the same time,
+each with its own preferences file, templates and AWS profile. Every line it prints starts with its flavor and stage (ex. `[bb/prod] `).
+
+```
+# the stacks of every flavor and stage
+../site-common-aws/fleet.py inventory
+# change sets for the stacks whose template or parameters changed (they are not executed)
+../site-common-aws/fleet.py --stages prod changesets
+# update the stacks whose template or parameters changed, in every flavor, asking once for yes
+../site-common-aws/fleet.py --refresh update all
+# what promoting the newest compute stack of each database would change
+../site-common-aws/fleet.py --flavors bb,pc --stages dev promote-plan
+```
+
+Since plainlychrist makes every AWS call in dev, `pc/prod` is left out when `pc/dev` is there too.
+
+# Promoting
+
+At the end of a promote, `conf.py` prints how long each AWS call, ssh command, drush step and operator prompt took,
+and how long the site was in maintenance (returning 503s). Every promote's timeline is also appended to
+`~/.local/share/site-aws/<flavor>.<stage>.timelines.jsonl`, so the maintenance window can be compared across releases.
+
+A release without database or entity schema changes can be promoted without maintenance, with
+"Promote compute stack without maintenance (shifting traffic)". The new Drupal and Redirect services are added to the
+load balancer alongside the old ones, then the old ones are removed in steps (`SITE_AWS_SHIFT_STEPS`, default 4), each
+step once the services it removed have finished their requests (the target group's deregistration delay). Each step
+prints the share of the requests the new services take. No `updatedb` or `entity-updates` is run, so use the usual
+promote whenever the release has updates to apply.
+
+Both promotes add the new services to the load balancer first, and only remove the old ones once every new service
+passes its health checks (the new Drupal only has to answer, since it returns the 503 of the maintenance in the usual
+promote). They print how long each new service took. If some are still not healthy after `SITE_AWS_HEALTHY_TIMEOUT`
+seconds (default 600), the new services are removed again and the old ones are left serving the site.
+
+Before the usual promote puts the site into maintenance, it checks on a new Drupal container, without changing
+anything, what the release would apply: the pending database and post updates, the entity and field definitions that
+differ from the database schema, and the requirements in error. When there is nothing to apply, the promote skips
+maintenance and continues like the promote without maintenance, in a single step. Otherwise it lists what is pending
+and estimates the maintenance window from the median of the past promotes' timelines. If the check itself fails, the
+promote goes into maintenance as before.
+
+To warm up the caches of the new Drupal services, set `SITE_AWS_WARMUP` to a file with one URL or path per line
+(paths are on `SITE_AWS_WARMUP_HOST`, by default the flavor's domain), or to `sitemap` to use the URLs of the
+site's `/sitemap.xml`. Each URL is requested from every new Drupal service directly, on its ECS host, at most
+`SITE_AWS_WARMUP_CONCURRENCY` (default 4) at a time per service, and the slowest requests are shown. The promote
+without maintenance (and the usual promote, when it has nothing to apply) rebuilds the caches and warms them up
+before the new services get any traffic. The usual promote with updates to apply does not warm up: the site stays in
+maintenance until the new services are the only ones left in the load balancer.
+
+```
+echo / > ~/warmup-urls.txt
+echo /about >> ~/warmup-urls.txt
+SITE_AWS_WARMUP=~/warmup-urls.txt ./conf.py dev compute
+```
+
+# Upgrading a cluster in place
+
+"Upgrade compute stack in place (replacing its Drupal tasks)" does the steps of `UPGRADING-CLUSTER.md`: it replaces
+the Drupal tasks of a compute stack `SITE_AWS_ROLLING_BATCH` at a time (default 1), waiting for each batch's
+replacements to be RUNNING, rebuilds the caches, runs `drush updatedb`, and drops the `site_phase*` tables.
+
+# Tracing
+
+To see where a whole session spends its time, set `SITE_AWS_TRACE` to a file name:
+
+```
+SITE_AWS_TRACE=/tmp/conf-trace.json ./conf.py dev compute
+```
+
+When `conf.py` exits, the file holds a span for every menu action, AWS call, ssh command and drush step,
+with its stage, stack, exit code (or AWS error code) and output size.
+Load it in `chrome://tracing` or [Perfetto](https://ui.perfetto.dev).
+
 # PuTTY notes
 
 You may have to run it with:
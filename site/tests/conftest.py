@@ -1,18 +1,33 @@
 # vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
 # vim: set syntax=python:
+import os
 import pytest
-import Queue
+try:
+    import queue as Queue # python3
+except ImportError:
+    import Queue # python2
+import requests
+import socket
 import subprocess
 import sys
 import threading
 import time
 
+# the deployment modules shared by every site-*-aws flavor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, 'site-common-aws'))
+
 EMPTY_A_BOOTSTRAP =       "setup/docker-compose-site-empty-a-bootstrap.yml"
 SHARED_A_B_BOOTSTRAP =    "setup/docker-compose-site-shared-a-and-b-bootstrap.yml"
 SEPARATED_A_B_BOOTSTRAP = "setup/docker-compose-site-separated-a-and-b-bootstrap.yml"
+AWS_STAND_IN =            "setup/docker-compose-aws-stand-in.yml"
+SSHD =                    "setup/docker-compose-sshd.yml"
 EMPTY_A_PROJECT =       "plainlychristtest_empty_a"
 SHARED_A_B_PROJECT =    "plainlychristtest_shared_a_b"
 SEPARATED_A_B_PROJECT = "plainlychristtest_separated_a_b"
+AWS_STAND_IN_PROJECT =  "plainlychristtest_aws_stand_in"
+AWS_STAND_IN_URL =      "http://localhost:15000"
+SSHD_PROJECT =          "plainlychristtest_sshd"
+SSHD_PORT =             12222
 READ_TIMEOUT_SECS = 120
 
 class TestError(Exception):
@@ -52,13 +67,110 @@ def two_sites_shared(request):
     start_docker_compose(request, SHARED_A_B_PROJECT, SHARED_A_B_BOOTSTRAP, 2)
     return [Site('https://localhost:12443'), Site('https://localhost:12543')]
 
+@pytest.fixture(scope="session")
+def aws_stand_in_url(request):
+    """
+    The URL of a moto server standing in for AWS, empty at the start of the session
+
+    If SITE_AWS_ENDPOINT_URL is already set, that (already running) stand-in is used instead.
+    """
+    url = os.environ.get('SITE_AWS_ENDPOINT_URL')
+    if url is None:
+        url = AWS_STAND_IN_URL
+        start_docker_compose_service(request, AWS_STAND_IN_PROJECT, AWS_STAND_IN, url)
+    # start from an empty AWS
+    requests.post(url + '/moto-api/reset')
+    return url
+
+@pytest.fixture
+def aws_stand_in(aws_stand_in_url, monkeypatch):
+    """
+    The moto server standing in for AWS, with site-common-aws/awsclient.py pointed at it for the length of the test
+    """
+    import awsclient
+    monkeypatch.setenv('SITE_AWS_ENDPOINT_URL', aws_stand_in_url)
+    # moto accepts any credentials
+    for (name, value) in [('AWS_ACCESS_KEY_ID', 'testing'), ('AWS_SECRET_ACCESS_KEY', 'testing'), ('AWS_DEFAULT_REGION', 'us-west-2')]:
+        if name not in os.environ: monkeypatch.setenv(name, value)
+    awsclient.reset()
+    yield aws_stand_in_url
+    # the next test does not reuse clients of the stand-in
+    awsclient.reset()
+
+class SshHost:
+    """
+    An SshHost is a running SSH server that accepts an identity (private key) for ec2-user
+    """
+
+    def __init__(self, hostname, port, identity):
+        self.hostname = hostname
+        self.port = port
+        self.identity = identity
+
+    def __str__(self):
+        return "hostname=%s port=%s" % (self.hostname, self.port)
+
+@pytest.fixture(scope="session")
+def sshd(request, tmpdir_factory):
+    """
+    An SSH server standing in for an ECS host, with a freshly generated key pair
+    """
+    identity = str(tmpdir_factory.mktemp("ssh").join("id_rsa"))
+    p_status = subprocess.call(["ssh-keygen", "-q", "-t", "rsa", "-N", "", "-f", identity])
+    if p_status != 0:
+        raise TestError("exit code = %s" % (p_status))
+    # for the compose file, until the end of the session
+    patch = pytest.MonkeyPatch()
+    request.addfinalizer(patch.undo)
+    with open(identity + ".pub") as f:
+        patch.setenv('SSHD_PUBLIC_KEY', f.read().strip())
+    start_docker_compose_service(request, SSHD_PROJECT, SSHD, None)
+
+    # ready once the server answers with its SSH banner
+    read_until = time.time() + READ_TIMEOUT_SECS
+    while time.time() < read_until:
+        try:
+            s = socket.create_connection(('localhost', SSHD_PORT), timeout=5)
+            try:
+                if s.recv(4).startswith(b'SSH-'):
+                    return SshHost('localhost', SSHD_PORT, identity)
+            finally:
+                s.close()
+        except (socket.error, socket.timeout): pass
+        time.sleep(0.5)
+    raise TestError("sshd did not answer within %s seconds" % (READ_TIMEOUT_SECS))
+
+def start_docker_compose_service(request, project_name, docker_compose_file, url):
+    """
+    Start a docker-compose service that is ready once 'url' answers (or right away, without a url)
+    """
+    subprocess.call(["docker-compose", "-p", project_name, "-f", docker_compose_file, "down"])
+    p_status = subprocess.call(["docker-compose", "-p", project_name, "-f", docker_compose_file, "up", "-d"])
+    if p_status != 0:
+        raise TestError("exit code = %s" % (p_status))
+
+    def fin():
+        sys.stderr.write("\n\nShutting down the container ...\n\n")
+        sys.stderr.flush()
+        subprocess.call(["docker-compose", "-p", project_name, "-f", docker_compose_file, "down"])
+    request.addfinalizer(fin)
+
+    if url is None: return
+    read_until = time.time() + READ_TIMEOUT_SECS
+    while time.time() < read_until:
+        try:
+            requests.get(url, timeout=5)
+            return
+        except requests.exceptions.ConnectionError: time.sleep(0.5)
+    raise TestError("%s did not answer within %s seconds" % (url, READ_TIMEOUT_SECS))
+
 def enqueue_output(out, queue):
     """
     Read every line from 'out' and place into 'queue'
 
     This blocks until 'out' has no more lines, and then this will close 'out'.
     """
-    for line in iter(out.readline, b''):
+    for line in iter(out.readline, ''):
         queue.put(line)
     out.close()
 
@@ -81,7 +193,7 @@ def start_docker_compose(request, project_name, docker_compose_file, expected_we
     request.addfinalizer(fin)
 
     # read the container logs in the background
-    p = subprocess.Popen(["docker-compose", "-p", project_name, "-f", docker_compose_file, "logs", "--follow", "--timestamps"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    p = subprocess.Popen(["docker-compose", "-p", project_name, "-f", docker_compose_file, "logs", "--follow", "--timestamps"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
     q = Queue.Queue()
     t = threading.Thread(target=enqueue_output, args=(p.stdout, q))
     t.daemon = True # when the program exits, this thread will exit
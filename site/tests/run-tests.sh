@@ -14,6 +14,11 @@ if ! python -c 'import bs4'; then
   sudo pip install beautifulsoup4 || exit 2
 fi
 
+if ! python -c 'import boto3'; then
+  set -x
+  sudo pip install boto3 || exit 2
+fi
+
 if ! which npm; then
   set -x
   if which yum; then
@@ -0,0 +1,55 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import pytest
+import awsclient
+
+TEMPLATE = """
+Resources:
+  Topic:
+    Type: AWS::SNS::Topic
+"""
+
+def test_clients_are_reused(aws_stand_in):
+    assert awsclient.client('dev', 'ecs') is awsclient.client('dev', 'ecs')
+    assert awsclient.client('dev', 'ecs') is not awsclient.client('dev', 'cloudformation')
+    assert awsclient.client('dev', 'ecs') is not awsclient.client('prod', 'ecs')
+
+def test_call_returns_parsed_response(aws_stand_in):
+    awsclient.call('dev', 'ecs', 'create_cluster', clusterName='bb-compute-1-2-3')
+    output = awsclient.call('dev', 'ecs', 'list_clusters')
+    assert any(arn.endswith('/bb-compute-1-2-3') for arn in output['clusterArns'])
+
+def test_call_lists_stacks(aws_stand_in):
+    awsclient.call('dev', 'cloudformation', 'create_stack', StackName='bb-network-12345', TemplateBody=TEMPLATE)
+    output = awsclient.call('dev', 'cloudformation', 'list_stacks', StackStatusFilter=['CREATE_COMPLETE'])
+    assert 'bb-network-12345' in [summ['StackName'] for summ in output['StackSummaries']]
+
+def test_call_raises_client_error(aws_stand_in):
+    with pytest.raises(awsclient.ClientError) as e:
+        awsclient.call('dev', 'cloudformation', 'describe_stacks', StackName='bb-network-does-not-exist')
+    assert 'does not exist' in str(e.value)
+
+def test_describe_args_hides_secrets(monkeypatch):
+    monkeypatch.setattr(awsclient, '_hidden_parameters', set())
+    awsclient.hide_parameters(['EmailLogin'])
+    params = [{'ParameterKey': 'DrupalDBPassword', 'ParameterValue': 'secretpassword1'}, {'ParameterKey': 'EmailLogin', 'ParameterValue': 'me'},
+        {'ParameterKey': 'DrupalHashSalt', 'ParameterValue': 'salt'}, {'ParameterKey': 'Size', 'ParameterValue': 'small'}]
+    described = awsclient.describe_args({'StackName': 'bb-compute-1', 'Parameters': params})
+    assert 'secretpassword1' not in described and "'me'" not in described and "'salt'" not in described
+    assert described.startswith(" --Parameters [{'ParameterKey': 'DrupalDBPassword', 'ParameterValue': '****'}")
+    assert awsclient.mask(params)[3] == params[3]
+
+def test_fan_out_keeps_order():
+    import time
+    results = awsclient.fan_out(lambda secs, val: time.sleep(secs) or val, [(0.2, 'a'), (0.0, 'b'), (0.1, 'c')])
+    assert results == ['a', 'b', 'c']
+
+def test_fan_out_raises_earliest_in_order():
+    import time
+    def fail(secs, message):
+        time.sleep(secs)
+        raise Exception(message)
+    # the second call raises first, but the first one in argslist is the one re-raised
+    with pytest.raises(Exception) as e:
+        awsclient.fan_out(fail, [(0.2, 'first'), (0.0, 'second')])
+    assert str(e.value) == 'first'
@@ -0,0 +1,28 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import awsclient
+import changesets
+
+TEMPLATE = '{"Resources": {"Topic": {"Type": "AWS::SNS::Topic"}}}'
+
+def test_create_and_wait(aws_stand_in):
+    awsclient.call('dev', 'cloudformation', 'create_stack', StackName='bb-network-11', TemplateBody=TEMPLATE)
+    cs = changesets.create_and_wait('dev', 'bb-network-11', 'cs-1', TemplateBody=TEMPLATE.replace('Topic', 'Topic2'))
+
+    assert cs.status == 'CREATE_COMPLETE'
+    assert [(c.action, c.resource) for c in cs.changes] == [('Add', 'Topic2')]
+    assert changesets.replacements(cs) == []
+    changesets.execute('dev', 'bb-network-11', 'cs-1')
+
+def test_render_replacements_first():
+    cs = changesets.ChangeSet('bb-compute-1', 'cs-1', 'CREATE_COMPLETE', '', [
+        changesets.ResourceChange('Add', 'Queue', 'AWS::SQS::Queue', '', []),
+        changesets.ResourceChange('Modify', 'Service', 'AWS::ECS::Service', 'False', ['DesiredCount']),
+        changesets.ResourceChange('Modify', 'Database', 'AWS::RDS::DBInstance', 'True', ['DBInstanceClass']),
+    ])
+    lines = changesets.render(cs)
+
+    assert lines[0] == 'bb-compute-1: 1 to add, 2 to modify, 0 to remove; REPLACES 1 resource(s), 0 more maybe (! and ?) - expect downtime'
+    assert [line.split()[0:2] for line in lines[1:]] == [['!', 'Database'], ['~', 'Service'], ['+', 'Queue']]
+    assert lines[1].endswith('(DBInstanceClass)')
+    assert [c.resource for c in changesets.replacements(cs)] == ['Database']
@@ -0,0 +1,63 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import threading
+import time
+
+import deployplan
+
+def job(stack):
+    (flavorshort, stacktype, network) = stack.split('-')[0:3]
+    database = stack.split('-')[3] if stacktype != 'network' else None
+    return deployplan.Job(stack, stacktype, network, database, 'update')
+
+def test_dependencies_only_on_planned_stacks():
+    jobs = [job('bb-compute-1-2-3'), job('bb-database-1-2'), job('bb-network-1'), job('bb-compute-4-5-6')]
+    deps = deployplan.dependencies('bb', jobs)
+    assert deps['bb-compute-1-2-3'] == ['bb-network-1', 'bb-database-1-2']
+    assert deps['bb-database-1-2'] == ['bb-network-1']
+    assert deps['bb-compute-4-5-6'] == []
+    assert [[j.stack for j in wave] for wave in deployplan.waves('bb', jobs)] == [['bb-network-1', 'bb-compute-4-5-6'], ['bb-database-1-2'], ['bb-compute-1-2-3']]
+
+def test_new_environments_do_not_reuse_names():
+    taken = set(['bb-network-00001'])
+    jobs = deployplan.new_environment('bb', taken) + deployplan.new_environment('bb', taken)
+    assert len(set(j.stack for j in jobs)) == 6
+    assert taken == set(['bb-network-00001'] + [j.stack for j in jobs])
+    (network, database, compute) = jobs[0:3]
+    assert database.stack == 'bb-database-{0}-{1}'.format(network.network, database.database)
+    assert deployplan.dependencies('bb', jobs)[compute.stack] == [network.stack, database.stack]
+
+def test_run_branches_concurrently_and_dependents_in_order():
+    jobs = [job('bb-network-1'), job('bb-database-1-2'), job('bb-compute-1-2-3'), job('bb-network-4'), job('bb-database-4-5')]
+    lock = threading.Lock()
+    started = []
+    def deploy(j):
+        with lock: started.append(j.stack)
+        time.sleep(0.2)
+        return 'UPDATE_COMPLETE'
+
+    results = deployplan.run('bb', jobs, deploy)
+    assert [r.status for r in results.values()] == ['UPDATE_COMPLETE'] * 5
+    assert set(started[0:2]) == set(['bb-network-1', 'bb-network-4'])
+    assert started[-1] == 'bb-compute-1-2-3'
+    for (stack, deps) in deployplan.dependencies('bb', jobs).items():
+        for dep in deps: assert results[stack].start >= results[dep].end
+    # three stacks in a row, not five
+    assert max(r.end for r in results.values()) < 0.2 * 4
+
+def test_run_skips_dependents_of_failures():
+    jobs = [job('bb-network-1'), job('bb-database-1-2'), job('bb-compute-1-2-3'), job('bb-compute-7-8-9')]
+    def deploy(j):
+        if j.stack == 'bb-network-1': return 'UPDATE_ROLLBACK_COMPLETE'
+        if j.stack == 'bb-compute-7-8-9': raise Exception('no such template')
+        return deployplan.UNCHANGED
+
+    results = deployplan.run('bb', jobs, deploy)
+    assert [r.status for r in results.values()] == ['UPDATE_ROLLBACK_COMPLETE', deployplan.SKIPPED, deployplan.SKIPPED, 'ERROR']
+    assert [r.stack for r in deployplan.failed(results)] == ['bb-network-1', 'bb-database-1-2', 'bb-compute-1-2-3', 'bb-compute-7-8-9']
+
+def test_parse_args():
+    assert deployplan.parse_args(['--environments', '2', '--refresh']) == (2, False, [])
+    assert deployplan.parse_args(['all', '--yes']) == (0, True, ['all'])
+    assert deployplan.parse_args(['--refresh']) is None
+    assert deployplan.parse_args(['--environments', 'two']) is None
@@ -0,0 +1,35 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import io
+import shlex
+import drushbatch
+
+def local_command(steps):
+    # 'command <step>' runs the step itself, so no Drupal is needed
+    return 'sh -c {0}'.format(shlex.quote(drushbatch.script(steps, drush='command')))
+
+def test_run_reports_each_step():
+    steps = ['true', 'false', 'echo hello']
+    out = io.StringIO()
+    results = drushbatch.run(local_command(steps), steps, out=out)
+
+    assert [r.step for r in results] == steps
+    assert [r.status for r in results] == [0, 1, 0]
+    assert all(r.secs is not None and r.secs >= 0 for r in results)
+    # the markers are not shown, the output of the steps is
+    assert out.getvalue() == 'hello\n'
+    assert [r.step for r in drushbatch.failed(results)] == ['false']
+
+def test_run_stopped_early():
+    steps = ['true', 'exit 3', 'true']
+    results = drushbatch.run(local_command(steps), steps, out=io.StringIO())
+    assert [r.status for r in results] == [0, None, None]
+    assert results[2].secs is None
+
+def test_remote_command_quoting():
+    cmd = drushbatch.remote_command('ssh host', 'abc123', ["sql-query '\"SHOW TABLES\"'"], interactive=True)
+    # what ssh sends to the remote shell
+    (ssh, host, remote) = shlex.split(cmd)
+    assert shlex.split(remote)[:8] == ['docker', 'exec', '-it', 'abc123', 'runuser', '-u', 'drupaladmin', '--']
+    assert shlex.split(remote)[8:10] == ['sh', '-c']
+    assert shlex.split(remote)[10] == drushbatch.script(["sql-query '\"SHOW TABLES\"'"])
@@ -0,0 +1,41 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import json
+import awsclient
+import ecs
+
+def register_container_instances(cluster, count):
+    awsclient.call('dev', 'ecs', 'create_cluster', clusterName=cluster)
+    output = awsclient.call('dev', 'ec2', 'run_instances', ImageId='ami-12c6146b', MinCount=count, MaxCount=count)
+    ci_ec2instance_map = dict()
+    for i in output['Instances']:
+        document = json.dumps({'instanceId': i['InstanceId']})
+        ci = awsclient.call('dev', 'ecs', 'register_container_instance', cluster=cluster, instanceIdentityDocument=document)['containerInstance']
+        ci_ec2instance_map[ci['containerInstanceArn']] = i['InstanceId']
+    return ci_ec2instance_map
+
+def test_resolve_container_instances_across_clusters_and_chunks(aws_stand_in, monkeypatch):
+    monkeypatch.setattr(ecs, 'MAX_CONTAINER_INSTANCES_PER_REQUEST', 2)
+    new = register_container_instances('bb-compute-1-2-3', 3)
+    old = register_container_instances('bb-compute-1-2-4', 2)
+    all_cis = dict()
+    for ci in new: all_cis[ci] = 'bb-compute-1-2-3'
+    for ci in old: all_cis[ci] = 'bb-compute-1-2-4'
+
+    (ci_ec2instance_map, failures) = ecs.resolve_container_instances('dev', all_cis)
+
+    expected = dict(new)
+    expected.update(old)
+    assert ci_ec2instance_map == expected
+    assert failures == dict()
+
+def test_resolve_container_instances_reports_missing(aws_stand_in):
+    new = register_container_instances('bb-compute-1-2-5', 1)
+    gone = 'arn:aws:ecs:us-west-2:123456789012:container-instance/00000000-0000-0000-0000-000000000000'
+    all_cis = {gone: 'bb-compute-1-2-5'}
+    for ci in new: all_cis[ci] = 'bb-compute-1-2-5'
+
+    (ci_ec2instance_map, failures) = ecs.resolve_container_instances('dev', all_cis)
+
+    assert ci_ec2instance_map == new
+    assert failures == {gone: 'MISSING'}
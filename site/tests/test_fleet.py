@@ -0,0 +1,91 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import io
+import sys
+import pytest
+import deployplan
+import fleet
+import flavors
+import inventory
+import templates
+
+TEMPLATE = '''
+Parameters:
+  ModificationTimestamp: {Type: String}
+  Size: {Type: String, Default: small}
+Resources:
+  Topic: {Type: AWS::SNS::Topic}
+'''
+
+@pytest.fixture
+def two_flavors(tmpdir, monkeypatch, aws_stand_in):
+    '''
+    Two flavors with a network template each, and their own empty stage caches
+    '''
+    monkeypatch.setenv('HOME', str(tmpdir))
+    monkeypatch.setattr(templates, 'CACHE_DIR', str(tmpdir.join('cache', 'templates')))
+    monkeypatch.setattr(inventory, 'CACHE_DIR', str(tmpdir.join('cache')))
+    # like plainlychrist, xb makes every AWS call in dev
+    xa = flavors.Flavor('xa', 'xalong', 'xa.org', str(tmpdir.join('site-xa-aws')), None, 'site-xa')
+    xb = flavors.Flavor('xb', 'xblong', 'xb.org', str(tmpdir.join('site-xb-aws')), 'dev', 'site-xb')
+    for flavor in [xa, xb]:
+        tmpdir.join(flavor.directory.split('/')[-1]).ensure(dir=True).join('cloudformation-network.yaml').write(TEMPLATE)
+    monkeypatch.setattr(flavors, 'FLAVORS', [xa, xb])
+    # what the targets print goes to the stdout of the test
+    monkeypatch.setattr(fleet, '_output', None)
+    # (fleet puts its own stdout in front of it, which goes when the test is done)
+    monkeypatch.setattr(sys, 'stdout', sys.stdout)
+    return (xa, xb)
+
+def test_parse_args():
+    assert fleet.parse_args(['inventory']) == (['bb', 'pc'], ['dev', 'prod'], False, False, 'inventory', ['all'])
+    assert fleet.parse_args(['--flavors', 'pc', '--stages', 'prod', '--yes', 'update', 'pc-network-1']) == (['pc'], ['prod'], True, False, 'update', ['pc-network-1'])
+    assert fleet.parse_args(['deploy']) is None
+    assert fleet.parse_args(['--force', 'update']) is None
+
+def test_targets_share_stacks_once(two_flavors, capsys):
+    thetargets = fleet.targets(['xa', 'xb'], ['dev', 'prod'])
+    assert [(target.label, target.awsstage) for target in thetargets] == [('xa/dev', 'dev'), ('xa/prod', 'prod'), ('xb/dev', 'dev')]
+    assert 'Leaving out xb/prod: its stacks are those of xb/dev' in capsys.readouterr().out
+
+    with pytest.raises(Exception):
+        fleet.targets(['zz'], ['dev'])
+
+def test_labeled_lines():
+    out = io.StringIO()
+    label = fleet.Label('bb/dev', out)
+    label.write('one\ntw')
+    label.write('o\n')
+    label.write('three')
+    label.close()
+    assert out.getvalue() == '[bb/dev] one\n[bb/dev] two\n[bb/dev] three\n'
+
+def test_update_only_what_changed(two_flavors, tmpdir, capsys):
+    (xa, xb) = two_flavors
+    (a, b) = fleet.targets(['xa', 'xb'], ['dev'])
+    for target in [a, b]:
+        job = deployplan.Job('{0}-network-70001'.format(target.flavor.short), 'network', '70001', None, 'create')
+        assert target.config('network').deploy_job(job) == 'CREATE_COMPLETE'
+
+    # a template change to one flavor only
+    tmpdir.join('site-xa-aws', 'cloudformation-network.yaml').write(TEMPLATE.replace('small', 'large'))
+    assert fleet.main(['--flavors', 'xa,xb', '--stages', 'dev', '--yes', '--refresh', 'update']) == 0
+    out = capsys.readouterr().out
+    assert '[xb/dev] xb-network-70001 is up to date' in out
+    assert '[xa/dev]   1. update xa-network-70001' in out
+    assert '[xa/dev]   xa-network-70001                         UPDATE_COMPLETE' in out
+
+    # nothing left to do
+    assert fleet.main(['--flavors', 'xa,xb', '--stages', 'dev', '--yes', '--refresh', 'update']) == 0
+    assert capsys.readouterr().out.endswith('Everything is up to date\n')
+
+def test_preflight_stops_every_target(two_flavors, tmpdir, capsys):
+    (a, b) = fleet.targets(['xa', 'xb'], ['dev'])
+    job = deployplan.Job('xa-network-70002', 'network', '70002', None, 'create')
+    assert a.config('network').deploy_job(job) == 'CREATE_COMPLETE'
+
+    tmpdir.join('site-xa-aws', 'cloudformation-network.yaml').write(TEMPLATE.replace('Topic: {', 'Topic: { DependsOn: Nothing, '))
+    assert fleet.main(['--flavors', 'xa,xb', '--stages', 'dev', '--yes', '--refresh', 'update', 'xa-network-70002']) == 1
+    out = capsys.readouterr().out
+    assert 'DependsOn resource "Nothing" is not in the template' in out
+    assert 'UPDATE_COMPLETE' not in out
@@ -0,0 +1,84 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import inventory
+
+def summary(name, status='CREATE_COMPLETE'):
+    return {'StackName': name, 'StackStatus': status, 'CreationTime': '2017-01-29T01:30:16.370623+00:00'}
+
+SUMMARIES = [
+    summary('bb-network-11111'),
+    summary('bb-database-11111-22222'),
+    summary('bb-compute-11111-22222-33333'),
+    summary('bb-compute-11111-22222-44444', 'DELETE_IN_PROGRESS'),
+    summary('bb-compute-11111-55555-66666'),
+    summary('pc-network-11111'),
+]
+
+def test_deconstruct_stack_name():
+    assert inventory.deconstruct_stack_name('bb', 'bb-compute-11111-22222-33333') == ('compute', '11111', '22222')
+    assert inventory.deconstruct_stack_name('bb', 'bb-network-11111') == ('network', '11111', None)
+    assert inventory.deconstruct_stack_name('bb', 'pc-network-11111') == (None, None, None)
+
+def test_topology_indexes_by_network_and_database():
+    topology = inventory.StackTopology('bb', SUMMARIES)
+    assert [info.name for info in topology.compute_stacks('11111', '22222')] == ['bb-compute-11111-22222-33333', 'bb-compute-11111-22222-44444']
+    assert [info.name for info in topology.compute_stacks('11111', '22222', ['CREATE_COMPLETE'])] == ['bb-compute-11111-22222-33333']
+    assert [info.name for info in topology.database_stacks('11111')] == ['bb-database-11111-22222']
+    assert topology.networks['11111'].name == 'bb-network-11111'
+    assert topology.get('pc-network-11111') is None
+    assert topology.compute_stacks('99999', '22222') == []
+
+def test_topology_search():
+    topology = inventory.StackTopology('bb', SUMMARIES)
+    assert [info.name for info in topology.search('compute', '')] == ['bb-compute-11111-22222-33333', 'bb-compute-11111-22222-44444', 'bb-compute-11111-55555-66666']
+    assert [info.name for info in topology.search('compute', '11111-2')] == ['bb-compute-11111-22222-33333', 'bb-compute-11111-22222-44444']
+    assert [info.name for info in topology.search('compute', '11111-2 delete')] == ['bb-compute-11111-22222-44444']
+    assert [info.name for info in topology.search('compute', '55555', ['DELETE_IN_PROGRESS'])] == []
+
+def test_inventory_is_cached_on_disk(aws_stand_in, tmpdir, monkeypatch):
+    monkeypatch.setattr(inventory, 'CACHE_DIR', str(tmpdir))
+    first = inventory.StackInventory('dev', 'bb', 'buildbarbuda')
+    first.summaries()
+    assert first.fetched is not None
+
+    # a second session within the TTL uses the cache instead of AWS
+    monkeypatch.setattr(inventory.StackInventory, 'refresh', lambda self: (_ for _ in ()).throw(AssertionError('fetched again')))
+    second = inventory.StackInventory('dev', 'bb', 'buildbarbuda')
+    assert second.summaries() == first.summaries()
+    assert second.fetched == first.fetched
+
+    # but not once it is too old
+    expired = inventory.StackInventory('dev', 'bb', 'buildbarbuda', ttl=-1)
+    assert not expired.load()
+
+TEMPLATE = """
+Resources:
+  Topic:
+    Type: AWS::SNS::Topic
+"""
+
+def test_iter_stack_summaries_skips_deleted_and_other_flavors(aws_stand_in):
+    import awsclient
+    for name in ['bb-network-70001', 'bb-network-70002', 'pc-network-70003']:
+        awsclient.call('dev', 'cloudformation', 'create_stack', StackName=name, TemplateBody=TEMPLATE)
+    awsclient.call('dev', 'cloudformation', 'delete_stack', StackName='bb-network-70002')
+
+    names = [summ['StackName'] for summ in inventory.iter_stack_summaries('dev', 'bb')]
+    assert 'bb-network-70001' in names
+    assert 'bb-network-70002' not in names
+    assert 'pc-network-70003' not in names
+
+    assert [summ['StackName'] for summ in inventory.iter_stack_summaries('dev', 'bb', names=['bb-network-70001'])] == ['bb-network-70001']
+
+def test_update_stacks_adds_and_drops(aws_stand_in, tmpdir, monkeypatch):
+    import awsclient
+    monkeypatch.setattr(inventory, 'CACHE_DIR', str(tmpdir))
+    awsclient.call('dev', 'cloudformation', 'create_stack', StackName='bb-network-80001', TemplateBody=TEMPLATE)
+    stacks = inventory.StackInventory('dev', 'bb', 'buildbarbuda')
+    assert stacks.topology().get('bb-network-80001') is not None
+
+    awsclient.call('dev', 'cloudformation', 'create_stack', StackName='bb-network-80002', TemplateBody=TEMPLATE)
+    awsclient.call('dev', 'cloudformation', 'delete_stack', StackName='bb-network-80001')
+    stacks.update_stacks(['bb-network-80001', 'bb-network-80002'])
+    assert stacks.topology().get('bb-network-80001') is None
+    assert stacks.topology().get('bb-network-80002') is not None
@@ -0,0 +1,51 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import os
+import sys
+import time
+
+import jobs
+
+def wait_for(manager):
+    while len(manager.running()) > 0: time.sleep(0.05)
+
+def test_job_output_goes_to_its_log(tmpdir, monkeypatch, capsys):
+    monkeypatch.setattr(jobs, 'JOBS_DIR', str(tmpdir))
+    stdout = sys.stdout
+    manager = jobs.JobManager('buildbarbuda.dev')
+    try:
+        def work(stack):
+            print('aws --profile site-dev cloudformation create-stack --StackName {0}'.format(stack))
+            print('The stack {0} is done: CREATE_COMPLETE'.format(stack))
+            return 'CREATE_COMPLETE'
+        job = manager.submit('create bb-network-1', work, 'bb-network-1')
+        print('printed by the menu')
+        wait_for(manager)
+    finally:
+        sys.stdout = stdout
+
+    assert (job.status, job.result) == ('done', 'CREATE_COMPLETE')
+    assert job.last_line == 'The stack bb-network-1 is done: CREATE_COMPLETE'
+    with open(job.logfilename) as logfile:
+        assert logfile.read().count('bb-network-1') == 2
+    # the stacks' parameters are in it, so only the operator can read it
+    assert os.stat(job.logfilename).st_mode & 0o777 == 0o600
+    # only what the job printed went to its log
+    assert capsys.readouterr().out == 'printed by the menu\n'
+
+def test_failed_job(tmpdir, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOBS_DIR', str(tmpdir))
+    stdout = sys.stdout
+    manager = jobs.JobManager('buildbarbuda.dev')
+    try:
+        def fail():
+            raise Exception('The stack bb-network-2 ended with ROLLBACK_COMPLETE')
+        manager.submit('create bb-network-2', fail)
+        manager.submit('update bb-network-3', time.sleep, 0.5)
+        wait_for(manager)
+    finally:
+        sys.stdout = stdout
+
+    assert manager.summary() == '1 done, 1 failed'
+    assert manager.ended == 2
+    assert manager.jobs[0].last_line == 'Exception: The stack bb-network-2 ended with ROLLBACK_COMPLETE'
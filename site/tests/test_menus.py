@@ -0,0 +1,34 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+from cursesmenu.items import MenuItem
+
+import menus
+
+def test_set_items_keeps_exit_and_highlight():
+    menu = menus.LiveMenu('Background jobs')
+    menus.set_items(menu, [MenuItem('job 1'), MenuItem('job 2'), MenuItem('job 3')])
+    menu.add_exit()
+    menu.current_option = 2
+
+    menus.set_items(menu, [MenuItem('job 1'), MenuItem('job 2'), MenuItem('job 3'), MenuItem('job 4')])
+    assert [item.text for item in menu.items[:-1]] == ['job 1', 'job 2', 'job 3', 'job 4']
+    assert menu.items[-1] is menu.exit_item
+    assert menu.current_option == 2
+    assert all(item.menu is menu for item in menu.items)
+
+    menus.set_items(menu, [MenuItem('job 1')])
+    assert [item.text for item in menu.items] == ['job 1', menu.exit_item.text]
+    assert menu.current_option == 1
+
+def test_paged_menu_pages():
+    menu = menus.PagedMenu('AWS CloudFormation Stacks', page_size=3)
+    stacks = ['bb-network-{0}'.format(n) for n in range(7)]
+    assert menu.page_of(stacks) == stacks[0:3]
+    assert (menu.pages, menu.total) == (3, 7)
+    menu.page = 2
+    assert menu.page_of(stacks) == stacks[6:7]
+    # fewer entries (ex. filtered): back to the last page there is
+    assert menu.page_of(stacks[0:4]) == stacks[3:4]
+    assert menu.page == 1
+    assert menu.page_of([]) == []
+    assert menu.page == 0
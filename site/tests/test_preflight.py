@@ -0,0 +1,103 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import glob
+import os
+import pytest
+import preflight
+import templates
+
+TEMPLATE = '''
+Parameters:
+  KeyName:
+    Type: AWS::EC2::KeyPair::KeyName
+  Subnets:
+    Type: CommaDelimitedList
+    Default: a,b
+Conditions:
+  HasKey: { "Fn::Not": [ { "Fn::Equals": [ !Ref KeyName, "" ] } ] }
+Mappings:
+  Sizes:
+    dev: { Instance: t2.micro }
+Resources:
+  Cluster:
+    Type: AWS::ECS::Cluster
+    Condition: HasKey
+    Properties:
+      Name: !Sub '${AWS::StackName}-${KeyName}-${!Literal}'
+      Size: { "Fn::FindInMap": [ Sizes, dev, Instance ] }
+  Service:
+    Type: AWS::ECS::Service
+    DependsOn: Cluster
+    Properties:
+      Cluster: !Ref Cluster
+      Role: !GetAtt Cluster.Arn
+      Name: { "Fn::Sub": [ '${Prefix}-${Cluster.Arn}', { Prefix: !Ref Subnets } ] }
+      Key: { "Fn::If": [ HasKey, !Ref KeyName, !Ref "AWS::NoValue" ] }
+'''
+
+BROKEN = TEMPLATE.replace('!Ref Cluster', '!Ref Clustr').replace('!GetAtt Cluster.Arn', '!GetAtt Other.Arn') \
+    .replace('${KeyName}', '${KeyNam}').replace('Condition: HasKey', 'Condition: HasNoKey') \
+    .replace('DependsOn: Cluster', 'DependsOn: [ Cluster, Db ]').replace('[ Sizes,', '[ Size,')
+
+def test_template_names():
+    assert preflight.template_problems(templates.parse(TEMPLATE)) == []
+    assert preflight.template_problems(templates.parse(BROKEN)) == [
+        'Resources.Cluster: condition "HasNoKey" is not in the template',
+        'Resources.Cluster.Properties.Name: Fn::Sub variable "KeyNam" is not in the template',
+        'Resources.Cluster.Properties.Size: mapping "Size" is not in the template',
+        'Resources.Service: DependsOn resource "Db" is not in the template',
+        'Resources.Service.Properties.Cluster: Ref to "Clustr" is not in the template',
+        'Resources.Service.Properties.Role: Fn::GetAtt of resource "Other" is not in the template',
+    ]
+
+@pytest.mark.parametrize('filename', sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'site-*-aws', 'cloudformation-*.yaml'))))
+def test_our_templates_pass(filename):
+    with open(filename) as f:
+        assert preflight.template_problems(templates.parse(f.read())) == []
+
+def test_template_problems_are_cached_by_content(tmpdir, monkeypatch):
+    monkeypatch.setattr(templates, 'CACHE_DIR', str(tmpdir.join('cache')))
+    with pytest.raises(preflight.PreflightError) as e:
+        preflight.check_template(BROKEN)
+    assert len(e.value.problems) == 6
+    assert 'nothing was sent to CloudFormation' in str(e.value)
+
+    # an unchanged template is not parsed again
+    def parse(body): raise AssertionError('parsed again')
+    monkeypatch.setattr(templates, 'parse', parse)
+    with pytest.raises(preflight.PreflightError):
+        preflight.check_template(BROKEN)
+
+DEFINITIONS = {
+    'Name': {'Type': 'String', 'MinLength': '1', 'MaxLength': 5, 'AllowedPattern': '[a-z]+'},
+    'Size': {'Type': 'String', 'AllowedValues': ['t2.micro', 't2.small'], 'Default': 't2.micro'},
+    'Count': {'Type': 'Number', 'MinValue': 1, 'MaxValue': 3, 'Default': 1},
+    'Subnets': {'Type': 'CommaDelimitedList', 'Default': 'a,b'},
+    'KeyName': {'Type': 'AWS::EC2::KeyPair::KeyName'},
+}
+
+def params(**values):
+    return [{'ParameterKey': key, 'ParameterValue': value} for (key, value) in sorted(values.items())]
+
+def test_parameters():
+    preflight.check_parameters(DEFINITIONS, params(Name='abc', KeyName='key', Count='2', Subnets='a,b,c'))
+
+    with pytest.raises(preflight.PreflightError) as e:
+        preflight.check_parameters(DEFINITIONS, params(Name='abcdef1', Size='m5', Count='4', Subnets='a\\,b', KeyName='', Extra='x'))
+    assert e.value.problems == [
+        'Parameter Count: 4 is more than 3',
+        'Parameter KeyName: is empty',
+        'Parameter Name: is longer than 5 characters',
+        'Parameter Name: does not match [a-z]+',
+        'Parameter Size: "m5" is not one of t2.micro, t2.small',
+        'Parameter Subnets: "a\\\\,b" is written for the AWS CLI shorthand; use \',\' instead of \'\\,\'',
+        'Parameter Extra: is not in the template',
+    ]
+
+    with pytest.raises(preflight.PreflightError) as e:
+        preflight.check_parameters(DEFINITIONS, params(Count='many'))
+    assert e.value.problems == [
+        'Parameter Count: "many" is not a number',
+        'Parameter KeyName: has no value and no Default',
+        'Parameter Name: has no value and no Default',
+    ]
@@ -0,0 +1,171 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import pytest
+import awsclient
+import ecs
+import inventory
+import promote
+
+NETWORK = '''
+Resources:
+  Topic: {Type: AWS::SNS::Topic}
+Outputs:
+  EcsLoadBalancerRedirectHttpTargetGroup: {Value: redirect-tg}
+  EcsLoadBalancerDrupalHttpsTargetGroup: {Value: drupal-tg}
+'''
+
+def run_host(stack):
+    tags = [{'Key': 'buildbarbuda:database-id', 'Value': 'bb-database-60001-2'}, {'Key': 'aws:cloudformation:stack-name', 'Value': stack}]
+    awsclient.call('dev', 'ec2', 'run_instances', ImageId='ami-12c6146b', MinCount=1, MaxCount=1, TagSpecifications=[{'ResourceType': 'instance', 'Tags': tags}])
+
+def test_plan(aws_stand_in, monkeypatch):
+    awsclient.call('dev', 'cloudformation', 'create_stack', StackName='bb-network-60001', TemplateBody=NETWORK)
+    run_host('bb-compute-60001-2-3')
+    run_host('bb-compute-60001-2-4')
+    topology = inventory.StackTopology('bb', [
+        {'StackName': name, 'StackStatus': 'CREATE_COMPLETE', 'CreationTime': '2017-01-01T00:00:00'}
+        for name in ['bb-network-60001', 'bb-database-60001-2', 'bb-compute-60001-2-3', 'bb-compute-60001-2-4']])
+
+    # the stand-in has no network bindings for tasks
+    bindings = {
+        ('bb-compute-60001-2-4', 'Redirect'): {('ci-new', 8080)}, ('bb-compute-60001-2-4', 'Drupal'): {('ci-new', 8443), ('ci-new', 8444)},
+        ('bb-compute-60001-2-3', 'Redirect'): {('ci-old', 8080)}, ('bb-compute-60001-2-3', 'Drupal'): {('ci-old', 8443), ('ci-gone', 8443)},
+    }
+    def acquire_all_compute_bindings(stage, lookups, all_cis):
+        for lookup in lookups:
+            for (ci, port) in bindings[lookup]: all_cis[ci] = lookup[0]
+        return dict((lookup, bindings[lookup]) for lookup in lookups)
+    monkeypatch.setattr(ecs, 'acquire_all_compute_bindings', acquire_all_compute_bindings)
+    monkeypatch.setattr(ecs, 'resolve_container_instances', lambda stage, all_cis: ({'ci-new': 'i-new', 'ci-old': 'i-old'}, {'ci-gone': 'MISSING'}))
+
+    plan = promote.plan('dev', 'bb', 'buildbarbuda', topology, 'bb-compute-60001-2-4', '60001', '2')
+
+    assert plan.old_stacks == {'bb-compute-60001-2-3'}
+    assert (plan.redirect_targetgroup, plan.drupal_targetgroup) == ('redirect-tg', 'drupal-tg')
+    assert (len(plan.old_hostnames), len(plan.new_hostnames)) == (1, 1)
+    assert promote.targets(plan.new_drupal_binds, plan.ci_ec2instance_map) == [{'Id': 'i-new', 'Port': 8443}, {'Id': 'i-new', 'Port': 8444}]
+    # the missing container instance has no target to deregister
+    assert promote.targets(plan.old_drupal_binds, plan.ci_ec2instance_map) == [{'Id': 'i-old', 'Port': 8443}]
+    lines = promote.describe(plan)
+    assert '  register 2 new target(s), deregister 1 old target(s)' in lines
+    assert 'Container instance ci-gone of bb-compute-60001-2-3: MISSING' in lines
+
+def test_batches():
+    assert promote.batches([1, 2, 3], 4) == [[1], [2], [3], []]
+    assert promote.batches([1, 2, 3, 4, 5], 2) == [[1, 2, 3], [4, 5]]
+    assert promote.batches([], 2) == [[], []]
+
+def test_shift_steps(monkeypatch):
+    monkeypatch.delenv('SITE_AWS_SHIFT_STEPS', raising=False)
+    assert promote.shift_steps() == promote.DEFAULT_SHIFT_STEPS
+    monkeypatch.setenv('SITE_AWS_SHIFT_STEPS', '0')
+    assert promote.shift_steps() == 1
+    monkeypatch.setenv('SITE_AWS_SHIFT_STEPS', 'many')
+    with pytest.raises(Exception):
+        promote.shift_steps()
+
+def load_balancer(names):
+    vpc = awsclient.call('dev', 'ec2', 'create_vpc', CidrBlock='10.1.0.0/16')['Vpc']['VpcId']
+    return [awsclient.call('dev', 'elbv2', 'create_target_group', Name=name, Protocol='HTTP', Port=80, VpcId=vpc)['TargetGroups'][0]['TargetGroupArn'] for name in names]
+
+def registered(targetgroup):
+    output = awsclient.call('dev', 'elbv2', 'describe_target_health', TargetGroupArn=targetgroup)
+    return sorted((d['Target']['Id'], d['Target']['Port']) for d in output['TargetHealthDescriptions'])
+
+def test_shift_traffic(aws_stand_in, capsys):
+    (redirect_tg, drupal_tg) = load_balancer(['shift-redirect', 'shift-drupal'])
+    # (the stand-in keeps one target per instance, whatever its port)
+    (old1, old2, old3, new) = [i['InstanceId'] for i in awsclient.call('dev', 'ec2', 'run_instances', ImageId='ami-12c6146b', MinCount=4, MaxCount=4)['Instances']]
+    awsclient.call('dev', 'elbv2', 'register_targets', TargetGroupArn=redirect_tg, Targets=[{'Id': old1, 'Port': 8080}])
+    awsclient.call('dev', 'elbv2', 'register_targets', TargetGroupArn=drupal_tg, Targets=[{'Id': old, 'Port': 8443} for old in [old1, old2, old3]])
+    plan = promote.Plan('bb-compute-1-2-4', {'bb-compute-1-2-3'}, redirect_tg, drupal_tg, ['old.example.com'], ['new.example.com'],
+        {('ci-old1', 8080)}, {('ci-new', 9080)}, {('ci-old1', 8443), ('ci-old2', 8443), ('ci-old3', 8443)}, {('ci-new', 9443)},
+        {'ci-old1': 'bb-compute-1-2-3', 'ci-old2': 'bb-compute-1-2-3', 'ci-old3': 'bb-compute-1-2-3', 'ci-new': 'bb-compute-1-2-4'},
+        {'ci-old1': old1, 'ci-old2': old2, 'ci-old3': old3, 'ci-new': new}, dict())
+
+    promote.shift_traffic('dev', plan, 5, 60)
+
+    assert registered(redirect_tg) == [(new, 9080)]
+    assert registered(drupal_tg) == [(new, 9443)]
+    out = capsys.readouterr().out
+    # no more steps than there are old Drupal targets
+    assert 'Step 3/3: deregistering old targets' in out
+    assert 'Time to healthy:' in out
+    assert '  Drupal: the new targets take 25% of the requests (1 new, 3 old)' in out
+    assert '  Drupal: the new targets take 50% of the requests (1 new, 1 old)' in out
+    assert '  Redirect: the new targets take 100% of the requests (1 new, 0 old)' in out
+
+def test_shift_traffic_needs_every_new_instance(aws_stand_in):
+    (redirect_tg, drupal_tg) = load_balancer(['shift-redirect-2', 'shift-drupal-2'])
+    plan = promote.Plan('bb-compute-1-2-4', set(), redirect_tg, drupal_tg, [], ['new.example.com'],
+        set(), {('ci-new', 9080)}, set(), {('ci-new', 9443)}, {'ci-new': 'bb-compute-1-2-4'}, dict(), {'ci-new': 'MISSING'})
+    with pytest.raises(Exception) as e:
+        promote.shift_traffic('dev', plan, 2, 60)
+    assert 'ci-new that is reported MISSING' in str(e.value)
+    assert registered(drupal_tg) == []
+
+def test_shift_traffic_needs_new_targets_in_every_group(aws_stand_in):
+    (redirect_tg, drupal_tg) = load_balancer(['shift-redirect-3', 'shift-drupal-3'])
+    (old, new) = [i['InstanceId'] for i in awsclient.call('dev', 'ec2', 'run_instances', ImageId='ami-12c6146b', MinCount=2, MaxCount=2)['Instances']]
+    awsclient.call('dev', 'elbv2', 'register_targets', TargetGroupArn=drupal_tg, Targets=[{'Id': old, 'Port': 8443}])
+    # the new stack has a Redirect task but no Drupal task (ex. the promote of a release with nothing to apply, in one step)
+    plan = promote.Plan('bb-compute-1-2-4', {'bb-compute-1-2-3'}, redirect_tg, drupal_tg, ['old.example.com'], ['new.example.com'],
+        set(), {('ci-new', 9080)}, {('ci-old', 8443)}, set(), {'ci-old': 'bb-compute-1-2-3', 'ci-new': 'bb-compute-1-2-4'},
+        {'ci-old': old, 'ci-new': new}, dict())
+    with pytest.raises(Exception) as e:
+        promote.shift_traffic('dev', plan, 1, 60)
+    assert 'The Drupal target group has 1 old target(s) and no new ones' in str(e.value)
+    # nothing was registered or deregistered
+    assert registered(drupal_tg) == [(old, 8443)]
+    assert registered(redirect_tg) == []
+
+def test_check_container_instances():
+    plan = promote.Plan('bb-compute-1-2-4', {'bb-compute-1-2-3'}, 'redirect-tg', 'drupal-tg', [], ['new.example.com'],
+        set(), {('ci-new', 9080)}, {('ci-old', 8443)}, {('ci-new', 9443)}, {'ci-old': 'bb-compute-1-2-3', 'ci-new': 'bb-compute-1-2-4'},
+        {'ci-new': 'i-new'}, {'ci-old': 'MISSING'})
+    # the container instance of an old task may be gone already
+    promote.check_container_instances(plan)
+
+    with pytest.raises(Exception) as e:
+        promote.check_container_instances(plan._replace(ci_ec2instance_map={'ci-old': 'i-old'}, failures={'ci-new': 'MISSING'}))
+    assert 'ci-new that is reported MISSING' in str(e.value)
+    with pytest.raises(Exception) as e:
+        promote.check_container_instances(plan._replace(failures={'ci-old': 'INACTIVE'}))
+    assert 'Saw 1 reported and 0 old missing container instances, but we asked for 2 in total' in str(e.value)
+
+def test_ready():
+    def description(state, reason=None):
+        health = {'State': state}
+        if reason is not None: health['Reason'] = reason
+        return {'Target': {'Id': 'i-1', 'Port': 80}, 'TargetHealth': health}
+    assert promote.ready(description('healthy'), False)
+    assert not promote.ready(description('initial', 'Elb.RegistrationInProgress'), True)
+    # a Drupal in maintenance answers with a 503
+    assert promote.ready(description('unhealthy', 'Target.ResponseCodeMismatch'), True)
+    assert not promote.ready(description('unhealthy', 'Target.ResponseCodeMismatch'), False)
+    assert not promote.ready(description('unhealthy', 'Target.Timeout'), True)
+
+def test_register_when_healthy_rolls_back(aws_stand_in, monkeypatch, capsys):
+    monkeypatch.setattr(promote, 'MIN_POLL_SECS', 0.1)
+    (redirect_tg, drupal_tg) = load_balancer(['health-redirect', 'health-drupal'])
+    (old, new, broken) = [i['InstanceId'] for i in awsclient.call('dev', 'ec2', 'run_instances', ImageId='ami-12c6146b', MinCount=3, MaxCount=3)['Instances']]
+    awsclient.call('dev', 'elbv2', 'register_targets', TargetGroupArn=drupal_tg, Targets=[{'Id': old, 'Port': 8443}])
+
+    took = promote.register_when_healthy('dev', [(redirect_tg, [{'Id': new, 'Port': 9080}], False), (drupal_tg, [], True)], 60)
+    assert list(took) == [(redirect_tg, new, 9080)]
+    assert took[(redirect_tg, new, 9080)] < 60
+
+    # the stand-in says a stopped instance is not in use: stop one once it is registered
+    wait_healthy = promote.wait_healthy
+    def stop_then_wait(stage, groups, timeout):
+        awsclient.call('dev', 'ec2', 'stop_instances', InstanceIds=[broken])
+        return wait_healthy(stage, groups, timeout)
+    monkeypatch.setattr(promote, 'wait_healthy', stop_then_wait)
+    with pytest.raises(promote.NotHealthy) as e:
+        promote.register_when_healthy('dev', [(drupal_tg, [{'Id': new, 'Port': 9443}, {'Id': broken, 'Port': 9443}], False)], 1)
+    assert list(e.value.states) == [(drupal_tg, broken, 9443)]
+    assert 'health-drupal {0}:9443 unused Target.InvalidState'.format(broken) in str(e.value)
+    # every new target is gone again, and the old one is left
+    assert registered(drupal_tg) == [(old, 8443)]
+    out = capsys.readouterr().out
+    assert 'health-drupal                    {0}:9443     NOT READY'.format(broken) in out
@@ -0,0 +1,79 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import json
+import pytest
+import requests
+import awsclient
+import flavors
+import rolling
+import timeline
+
+STACK = 'bb-compute-70001-2-3'
+
+@pytest.fixture
+def cluster(aws_stand_in, monkeypatch):
+    '''
+    A compute stack's cluster with one ECS host and three Drupal tasks, whose ECS service replaces every task stopped
+    '''
+    # the stand-in's tasks stay RUNNING however often they are described
+    requests.post(aws_stand_in + '/moto-api/state-manager/set-transition', data=json.dumps({'model_name': 'ecs::task', 'transition': {'progression': 'manual', 'times': 1000000}}))
+    monkeypatch.setattr(rolling, 'MIN_POLL_SECS', 0.1)
+    instance = awsclient.call('dev', 'ec2', 'run_instances', ImageId='ami-12c6146b', MinCount=1, MaxCount=1)['Instances'][0]
+    awsclient.call('dev', 'ecs', 'create_cluster', clusterName=STACK)
+    awsclient.call('dev', 'ecs', 'register_container_instance', cluster=STACK, instanceIdentityDocument=json.dumps({'instanceId': instance['InstanceId'], 'region': 'us-west-2', 'availabilityZone': 'us-west-2a', 'privateIp': '10.0.0.1', 'instanceType': 't2.micro', 'imageId': 'ami-12c6146b', 'architecture': 'x86_64'}))
+    awsclient.call('dev', 'ecs', 'register_task_definition', family=STACK + '-Drupal', containerDefinitions=[{'name': 'site-buildbarbuda', 'image': 'site', 'memory': 64}])
+    awsclient.call('dev', 'ecs', 'run_task', cluster=STACK, taskDefinition=STACK + '-Drupal', count=3)
+
+    stopped = []
+    call = awsclient.call
+    def service(stage, service, operation, quiet=False, **kwargs):
+        output = call(stage, service, operation, quiet=quiet, **kwargs)
+        if operation == 'stop_task':
+            stopped.append(kwargs['task'])
+            if not replacing[0]: return output
+            call(stage, 'ecs', 'run_task', cluster=STACK, taskDefinition=STACK + '-Drupal', count=1)
+        return output
+    replacing = [True]
+    monkeypatch.setattr(awsclient, 'call', service)
+    yield (instance, stopped, replacing)
+    requests.post(aws_stand_in + '/moto-api/state-manager/unset-transition', data=json.dumps({'model_name': 'ecs::task'}))
+
+def test_replace_in_batches(cluster, capsys):
+    (instance, stopped, replacing) = cluster
+    tasks = rolling.running_tasks('dev', STACK, 'Drupal')
+    assert len(tasks) == 3
+
+    running = rolling.replace('dev', STACK, 'Drupal', tasks, 2, 60)
+
+    assert sorted(stopped) == tasks
+    assert len(running) == 3 and set(running).isdisjoint(tasks)
+    assert sorted(running) == rolling.running_tasks('dev', STACK, 'Drupal')
+    out = capsys.readouterr().out
+    assert 'Batch 1/2: stopping 2 Drupal task(s)' in out
+    assert 'Batch 2/2: replaced in' in out
+    assert 'Replaced 3 Drupal task(s) of {0} in'.format(STACK) in out
+    assert rolling.task_hostname('dev', STACK, running[0]) == instance['PublicDnsName']
+
+def test_replace_stops_when_not_replaced(cluster):
+    (instance, stopped, replacing) = cluster
+    replacing[0] = False
+    tasks = rolling.running_tasks('dev', STACK, 'Drupal')
+    with pytest.raises(Exception) as e:
+        rolling.replace('dev', STACK, 'Drupal', tasks, 1, 1)
+    assert 'Only 0 of 1 new Drupal task(s)' in str(e.value)
+    # the other tasks were left running
+    assert stopped == tasks[:1]
+
+def test_settings(monkeypatch):
+    monkeypatch.delenv('SITE_AWS_ROLLING_BATCH', raising=False)
+    assert rolling.batch_size() == rolling.DEFAULT_BATCH
+    monkeypatch.setenv('SITE_AWS_ROLLING_TIMEOUT', '30')
+    assert rolling.timeout() == 30
+
+def test_upgrade_without_tasks(aws_stand_in, monkeypatch, capsys):
+    awsclient.call('dev', 'ecs', 'create_cluster', clusterName='bb-compute-70001-2-4')
+    prompts = []
+    monkeypatch.setattr(timeline, 'prompt', prompts.append)
+    rolling.upgrade(flavors.BUILDBARBUDA, 'dev', 'bb-compute-70001-2-4')
+    assert 'We did not find a running Drupal task in the compute stack' in capsys.readouterr().out
+    assert prompts == ['Press Enter to leave ... ']
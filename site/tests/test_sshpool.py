@@ -0,0 +1,39 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import os
+import subprocess
+import sshpool
+
+# the test server's host key is new every time
+SSH_OPTIONS = ['StrictHostKeyChecking=no', 'UserKnownHostsFile=/dev/null', 'LogLevel=ERROR']
+
+def new_pool(sshd):
+    return sshpool.SshPool(sshd.identity, user='ec2-user', port=sshd.port, options=SSH_OPTIONS)
+
+def test_session_runs_commands(sshd):
+    with new_pool(sshd) as pool:
+        session = pool.session(sshd.hostname)
+        assert session.opened
+        assert session.output('echo hello') == 'hello'
+        assert session.call('true') == 0
+        assert session.call('false') != 0
+
+def test_session_is_reused(sshd):
+    with new_pool(sshd) as pool:
+        session = pool.session(sshd.hostname)
+        assert pool.session(sshd.hostname) is session
+        # the master connection is up, and the commands go over it
+        check = ['ssh', '-o', 'ControlPath={0}'.format(session.controlpath), '-O', 'check'] + pool.ssh_args() + [sshd.hostname]
+        assert subprocess.call(check) == 0
+        assert session.output('echo $SSH_CONNECTION') == session.output('echo $SSH_CONNECTION')
+
+def test_close_stops_the_master(sshd):
+    pool = new_pool(sshd)
+    session = pool.session(sshd.hostname)
+    pool.close()
+    assert not session.opened
+    assert not os.path.exists(pool.controldir)
+
+def test_ecs_login_identity():
+    assert sshpool.ecs_login_identity('prod') == os.path.expanduser('~/.ssh/ecs-login-prod-id_rsa')
+    assert sshpool.ecs_login_identity() == os.path.expanduser('~/.ssh/ecs-login-id_rsa')
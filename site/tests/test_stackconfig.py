@@ -0,0 +1,54 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import pytest
+import awsclient
+import flavors
+import preflight
+import stackconfig
+import staging
+import templates
+
+TEMPLATE = '''
+Parameters:
+  ModificationTimestamp: {Type: String}
+  Size: {Type: String, Default: small}
+  Password: {Type: String}
+Resources:
+  Topic: {Type: AWS::SNS::Topic}
+'''
+
+@pytest.fixture
+def config(tmpdir, monkeypatch):
+    '''
+    The network StackConfig of a flavor, whose AWS calls are recorded rather than made
+    '''
+    monkeypatch.setattr(templates, 'CACHE_DIR', str(tmpdir.join('cache')))
+    tmpdir.join('cloudformation-network.yaml').write(TEMPLATE)
+    calls = []
+    monkeypatch.setattr(awsclient, 'call', lambda stage, service, operation, **kwargs: calls.append(operation))
+    flavor = flavors.Flavor('xa', 'xalong', 'xa.org', str(tmpdir), None, 'site-xa')
+    prefs = {'Parameters': {'Password': 'secret'}, 'Types': dict()}
+    return (stackconfig.StackConfig(flavor, 'dev', 'network', prefs, templates.parameters(str(tmpdir.join('cloudformation-network.yaml'))), str(tmpdir)), calls)
+
+def test_check_makes_no_aws_calls(config):
+    (theconfig, calls) = config
+    params = theconfig.check(None, None)
+    assert sorted(param['ParameterKey'] for param in params) == ['ModificationTimestamp', 'Password', 'Size']
+
+    del theconfig.prefs['Parameters']['Password']
+    with pytest.raises(preflight.PreflightError) as e:
+        theconfig.check(None, None)
+    assert 'Parameter Password: has no value and no Default' in str(e.value)
+    assert calls == []
+
+def test_template_staged_only_when_sent(aws_stand_in, config, monkeypatch):
+    (theconfig, calls) = config
+    monkeypatch.setenv('SITE_AWS_TEMPLATE_BUCKET', 'templates-bucket')
+    monkeypatch.setattr(staging, '_staged', set())
+    stack_params = theconfig.common_stack_params(None, None)
+    assert sorted(stack_params) == ['Parameters', 'Tags']
+    assert calls == []
+
+    # the stand-in call finds the template already in the bucket
+    assert list(theconfig.template_params()) == ['TemplateURL']
+    assert calls == ['head_object']
@@ -0,0 +1,48 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import awsclient
+import stackevents
+
+TEMPLATE = '{"Resources": {"Topic": {"Type": "AWS::SNS::Topic"}}}'
+
+def test_poll_only_returns_new_events(aws_stand_in):
+    awsclient.call('dev', 'cloudformation', 'create_stack', StackName='bb-network-1', TemplateBody=TEMPLATE)
+    tail = stackevents.StackTail('dev', 'bb-network-1')
+
+    events = tail.poll()
+    assert [e.status for e in events if e.is_stack] == ['CREATE_IN_PROGRESS', 'CREATE_COMPLETE']
+    assert tail.final_status == 'CREATE_COMPLETE'
+    assert tail.interval == stackevents.MIN_POLL_SECS
+
+    # nothing new, so the next poll is further away
+    assert tail.poll() == []
+    assert tail.interval == stackevents.MIN_POLL_SECS * stackevents.BACKOFF
+
+def test_follow_several_stacks(aws_stand_in, monkeypatch):
+    monkeypatch.setattr(stackevents, 'MIN_POLL_SECS', 0.1)
+    awsclient.call('dev', 'cloudformation', 'create_stack', StackName='bb-network-2', TemplateBody=TEMPLATE)
+    awsclient.call('dev', 'cloudformation', 'create_stack', StackName='bb-network-3', TemplateBody=TEMPLATE)
+    # only the events of the update of bb-network-3
+    after = {'bb-network-3': stackevents.latest_event_id('dev', 'bb-network-3')}
+    awsclient.call('dev', 'cloudformation', 'update_stack', StackName='bb-network-3', TemplateBody=TEMPLATE.replace('Topic', 'Topic2'))
+
+    follower = stackevents.StackFollower('dev', ['bb-network-2', 'bb-network-3'], after).start()
+    events = []
+    while True:
+        event = follower.events.get(timeout=30)
+        if event is None: break
+        events.append(event)
+
+    assert dict(follower.statuses()) == {'bb-network-2': 'CREATE_COMPLETE', 'bb-network-3': 'UPDATE_COMPLETE'}
+    assert [e.status for e in events if e.stack == 'bb-network-3' and e.is_stack] == ['UPDATE_IN_PROGRESS', 'UPDATE_COMPLETE']
+
+def test_follow_missing_stack(aws_stand_in):
+    statuses = stackevents.follow('dev', ['bb-network-404'])
+    assert dict(statuses) == {'bb-network-404': 'UNKNOWN'}
+
+def test_wait_for_update(aws_stand_in, monkeypatch):
+    monkeypatch.setattr(stackevents, 'MIN_POLL_SECS', 0.1)
+    awsclient.call('dev', 'cloudformation', 'create_stack', StackName='bb-network-5', TemplateBody=TEMPLATE)
+    after = stackevents.latest_event_id('dev', 'bb-network-5')
+    awsclient.call('dev', 'cloudformation', 'update_stack', StackName='bb-network-5', TemplateBody=TEMPLATE.replace('Topic', 'Topic2'))
+    assert stackevents.wait('dev', 'bb-network-5', after) == 'UPDATE_COMPLETE'
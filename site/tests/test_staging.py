@@ -0,0 +1,81 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import glob
+import json
+import os
+import pytest
+import awsclient
+import staging
+import templates
+
+TEMPLATE = '''
+Resources:
+  # a comment, which the minified template leaves out
+  Topic:
+    Type: AWS::SNS::Topic
+    Properties:
+      TopicName: !Sub '${AWS::StackName}-topic'
+Outputs:
+  TopicName:
+    Value: !GetAtt Topic.TopicName
+'''
+
+@pytest.fixture
+def fresh(tmpdir, monkeypatch, aws_stand_in):
+    monkeypatch.setattr(templates, 'CACHE_DIR', str(tmpdir.join('cache')))
+    monkeypatch.setattr(staging, '_staged', set())
+    monkeypatch.setattr(staging, '_buckets', dict())
+
+def test_minify():
+    minified = staging.minify(TEMPLATE)
+    assert json.loads(minified) == {
+        'Outputs': {'TopicName': {'Value': {'Fn::GetAtt': ['Topic', 'TopicName']}}},
+        'Resources': {'Topic': {'Type': 'AWS::SNS::Topic', 'Properties': {'TopicName': {'Fn::Sub': '${AWS::StackName}-topic'}}}},
+    }
+    assert ' ' not in minified.replace('AWS::SNS::Topic', '')
+
+@pytest.mark.parametrize('filename', sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'site-*-aws', 'cloudformation-*.yaml'))))
+def test_our_templates_minify(filename):
+    with open(filename) as f:
+        body = f.read()
+    minified = staging.minify(body)
+    assert len(minified) < len(body)
+    assert json.loads(minified)['AWSTemplateFormatVersion'] == '2010-09-09'
+
+def test_staged_once_by_content(fresh, monkeypatch):
+    url = staging.staged_url('dev', TEMPLATE)
+    assert url.endswith('/templates/{0}.json'.format(templates.content_hash(staging.minify(TEMPLATE))))
+
+    # CloudFormation reads the template from the URL
+    awsclient.call('dev', 'cloudformation', 'create_stack', StackName='bb-network-90001', TemplateURL=url)
+    resources = awsclient.call('dev', 'cloudformation', 'describe_stack_resources', StackName='bb-network-90001')['StackResources']
+    assert [r['LogicalResourceId'] for r in resources] == ['Topic']
+
+    # another conf.py finds the template already there, and does not upload it again
+    monkeypatch.setattr(staging, '_staged', set())
+    calls = []
+    original = awsclient.call
+    def call(stage, service, operation, **kwargs):
+        calls.append(operation)
+        return original(stage, service, operation, **kwargs)
+    monkeypatch.setattr(awsclient, 'call', call)
+    assert staging.staged_url('dev', TEMPLATE) == url
+    assert calls == ['head_object']
+
+    # and this one does not even look
+    assert staging.staged_url('dev', TEMPLATE) == url
+    assert calls == ['head_object']
+
+    # the same template written differently is the same object
+    assert staging.staged_url('dev', TEMPLATE.replace('  # a comment, which the minified template leaves out\n', '')) == url
+
+def test_inline_when_staging_fails(fresh, monkeypatch):
+    def staged_url(stage, body):
+        raise awsclient.ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'PutObject')
+    monkeypatch.setattr(staging, 'staged_url', staged_url)
+    assert staging.template_params('dev', TEMPLATE) == {'TemplateBody': staging.minify(TEMPLATE)}
+
+    # a template too big for a TemplateBody still fails
+    monkeypatch.setattr(staging, 'INLINE_LIMIT', 10)
+    with pytest.raises(awsclient.ClientError):
+        staging.template_params('dev', TEMPLATE)
@@ -0,0 +1,86 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import glob
+import os
+import pytest
+import templates
+
+TEMPLATE = '''
+Parameters:
+  KeyName:
+    Type: AWS::EC2::KeyPair::KeyName
+  Subnets:
+    Type: CommaDelimitedList
+    Default: a,b
+Resources:
+  Cluster:
+    Type: AWS::ECS::Cluster
+    Properties:
+      Name: !Sub '${AWS::StackName}-cluster'
+      Tags: !Join [ '', [ !Ref KeyName, !GetAtt Other.Arn ] ]
+'''
+
+def test_parse_short_forms():
+    template = templates.parse(TEMPLATE)
+    properties = template['Resources']['Cluster']['Properties']
+    assert properties['Name'] == {'Fn::Sub': '${AWS::StackName}-cluster'}
+    assert properties['Tags'] == {'Fn::Join': ['', [{'Ref': 'KeyName'}, {'Fn::GetAtt': 'Other.Arn'}]]}
+
+def test_parameters_are_cached_by_content(tmpdir, monkeypatch):
+    monkeypatch.setattr(templates, 'CACHE_DIR', str(tmpdir.join('cache')))
+    filename = str(tmpdir.join('cloudformation-compute.yaml'))
+    with open(filename, 'w') as f: f.write(TEMPLATE)
+
+    expected = {'KeyName': {'Type': 'AWS::EC2::KeyPair::KeyName'}, 'Subnets': {'Type': 'CommaDelimitedList', 'Default': 'a,b'}}
+    assert templates.parameters(filename) == expected
+
+    # an unchanged template is not parsed again
+    def parse(body): raise AssertionError('parsed again')
+    monkeypatch.setattr(templates, 'parse', parse)
+    assert templates.parameters(filename) == expected
+
+    # a changed one is
+    with open(filename, 'a') as f: f.write('# changed\n')
+    with pytest.raises(AssertionError):
+        templates.parameters(filename)
+
+def test_repository_templates_parse():
+    here = os.path.dirname(os.path.realpath(__file__))
+    filenames = glob.glob(os.path.join(here, os.pardir, 'site-*-aws', 'cloudformation-*.yaml'))
+    assert len(filenames) > 0
+    for filename in filenames:
+        with open(filename, 'rb') as f:
+            assert 'Parameters' in templates.parse(f.read())
+
+def test_deployment_digest():
+    params = [{'ParameterKey': 'KeyName', 'ParameterValue': 'ecs'}, {'ParameterKey': 'ModificationTimestamp', 'ParameterValue': '20170129T013016370623'}]
+    digest = templates.deployment_digest(TEMPLATE, params, ignore=['ModificationTimestamp'])
+
+    # neither the order of the parameters nor the ignored ones matter
+    later = [{'ParameterKey': 'ModificationTimestamp', 'ParameterValue': '20180101T000000000000'}, {'ParameterKey': 'KeyName', 'ParameterValue': 'ecs'}]
+    assert templates.deployment_digest(TEMPLATE, later, ignore=['ModificationTimestamp']) == digest
+
+    # the template and the other parameters do
+    assert templates.deployment_digest(TEMPLATE + '# changed\n', params, ignore=['ModificationTimestamp']) != digest
+    changed = [{'ParameterKey': 'KeyName', 'ParameterValue': 'ecs2'}]
+    assert templates.deployment_digest(TEMPLATE, changed, ignore=['ModificationTimestamp']) != digest
+
+def test_cached_by_threads_at_once(tmpdir, monkeypatch):
+    import threading
+    monkeypatch.setattr(templates, 'CACHE_DIR', str(tmpdir.join('cache')))
+    # every thread finds the entry missing, then writes it
+    barrier = threading.Barrier(8)
+    def compute():
+        barrier.wait()
+        return {'value': 1}
+    errors = []
+    def fill():
+        try:
+            assert templates.cached('abc', 'parameters', compute) == {'value': 1}
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=fill) for n in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert errors == []
+    assert os.listdir(str(tmpdir.join('cache'))) == ['abc.parameters.json']
@@ -0,0 +1,87 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import io
+import json
+import shlex
+import drushbatch
+import timeline
+
+def test_spans_only_recorded_while_active():
+    with timeline.span('aws', 'before'): pass
+    t = timeline.start('test')
+    try:
+        with timeline.span('aws', 'during'): pass
+    finally:
+        assert timeline.stop() is t
+    with timeline.span('aws', 'after'): pass
+    assert [span.label for span in t.spans] == ['during']
+    assert t.spans[0].end >= t.spans[0].start >= 0
+
+def test_maintenance_window():
+    t = timeline.Timeline('test')
+    o = t.origin
+    t.add('drush', timeline.MAINTENANCE_ON, o + 1, o + 2)
+    t.add('operator', 'Press Enter', o + 3, o + 10)
+    t.add('aws', 'elbv2 register-targets', o + 10, o + 11)
+    t.add('drush', timeline.MAINTENANCE_OFF, o + 11, o + 12)
+    t.add('drush', 'drush cache-rebuild', o + 12, o + 20)
+
+    assert t.window() == (2, 12)
+    assert dict(t.totals(2, 12)) == {'operator': 7, 'aws': 1, 'drush': 1}
+    assert t.to_dict()['maintenance_secs'] == 10
+
+def test_no_maintenance_window():
+    t = timeline.Timeline('test')
+    t.add('drush', 'drush updatedb', t.origin, t.origin + 1)
+    assert t.window() is None
+    assert t.to_dict()['maintenance_secs'] is None
+
+def test_drush_steps_are_recorded():
+    steps = ['true', 'false']
+    t = timeline.start('test')
+    try:
+        drushbatch.run('sh -c {0}'.format(shlex.quote(drushbatch.script(steps, drush='command'))), steps, out=io.StringIO())
+    finally:
+        timeline.stop()
+    assert [(span.category, span.label) for span in t.spans] == [('drush', 'drush true'), ('drush', 'drush false')]
+
+def test_save_appends(tmpdir):
+    filename = str(tmpdir.join('history', 'timelines.jsonl'))
+    for name in ['first', 'second']:
+        t = timeline.Timeline(name)
+        t.add('aws', 'ecs describe-tasks', t.origin, t.origin + 1)
+        t.save(filename)
+    with open(filename) as f:
+        saved = [json.loads(line) for line in f]
+    assert [s['name'] for s in saved] == ['first', 'second']
+    assert saved[0]['spans'][0]['label'] == 'ecs describe-tasks'
+
+def test_chrome_trace():
+    t = timeline.Timeline('conf.py')
+    t.add('aws', 'cloudformation describe-stacks', t.origin + 1, t.origin + 1.5, {'stage': 'dev', 'stack': 'bb-network-1'})
+    t.add('ssh', 'uptime on the new host', t.origin + 2, t.origin + 3, {'exit_code': 0})
+    events = json.loads(json.dumps(t.chrome_trace()))['traceEvents']
+
+    complete = [e for e in events if e['ph'] == 'X']
+    assert [(e['name'], e['cat'], e['ts'], e['dur']) for e in complete] == [
+        ('cloudformation describe-stacks', 'aws', 1000000, 500000),
+        ('uptime on the new host', 'ssh', 2000000, 1000000)]
+    assert complete[0]['args'] == {'stage': 'dev', 'stack': 'bb-network-1'}
+    assert 'thread_name' in [e['name'] for e in events if e['ph'] == 'M']
+
+def test_aws_calls_are_recorded(aws_stand_in):
+    import awsclient
+    t = timeline.start('test')
+    try:
+        awsclient.call('dev', 'ecs', 'create_cluster', clusterName='bb-compute-1-2-3')
+        try:
+            awsclient.call('dev', 'cloudformation', 'describe_stacks', StackName='bb-network-404')
+        except awsclient.ClientError:
+            pass
+    finally:
+        timeline.stop()
+    (created, described) = t.spans
+    assert (created.category, created.label) == ('aws', 'ecs create-cluster')
+    assert created.args['stage'] == 'dev'
+    assert described.args['stack'] == 'bb-network-404'
+    assert described.args['error'] == 'ValidationError'
@@ -0,0 +1,42 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import io
+import json
+import shlex
+import drushbatch
+import updatecheck
+
+def test_parse_drush_output():
+    # what the checks print through a drush batch, with a stand-in for drush php-eval
+    found = json.dumps({'updates': ['system 8201'], 'post_updates': [], 'entity_changes': ['node: The Content entity type needs to be updated.']})
+    steps = ['echo {0}'.format(shlex.quote(updatecheck.MARKER + ' ' + found)), 'echo "REQUIREMENTS OK"']
+    out = io.StringIO()
+    drushbatch.run('sh -c {0}'.format(shlex.quote(drushbatch.script(steps, drush='command'))), steps, out=out)
+
+    (pending, others) = updatecheck.parse(out.getvalue())
+    assert pending == updatecheck.Pending(['system 8201'], [], ['node: The Content entity type needs to be updated.'])
+    assert others == ['REQUIREMENTS OK']
+    assert not updatecheck.nothing_to_apply(pending)
+    assert updatecheck.describe(pending) == [
+        '1 pending database update(s)', '  system 8201',
+        '0 pending post update(s)',
+        '1 pending entity/field definition change(s)', '  node: The Content entity type needs to be updated.']
+
+def test_nothing_to_apply():
+    assert updatecheck.nothing_to_apply(updatecheck.Pending([], [], []))
+    # a check that did not finish is not nothing
+    (pending, others) = updatecheck.parse('PHP Fatal error: the site is not installed\n')
+    assert pending is None and others == ['PHP Fatal error: the site is not installed']
+    assert not updatecheck.nothing_to_apply(pending)
+
+def test_estimate(tmpdir):
+    def promote(maintenance_secs, updatedb_secs):
+        spans = [{'category': 'drush', 'label': 'drush updatedb', 'start': 5.0, 'end': 5.0 + updatedb_secs, 'thread': 'MainThread', 'args': {}}]
+        return json.dumps({'name': 'promote', 'started': 0, 'maintenance_secs': maintenance_secs, 'spans': spans})
+    history = '\n'.join([promote(40.0, 10.0), promote(None, 0.0), promote(60.0, 20.0), promote(100.0, 30.0), '']) + '\n'
+    assert updatecheck.estimate(io.StringIO(history)) == (60.0, 20.0, 3)
+
+    historyfile = tmpdir.join('promote.jsonl')
+    assert updatecheck.describe_estimate(str(historyfile)) == 'There is no past promote to estimate the maintenance window from'
+    historyfile.write(history)
+    assert updatecheck.describe_estimate(str(historyfile)) == 'The past 3 promote(s) were in maintenance for a median of 60s, of which drush updatedb took a median of 20s'
@@ -0,0 +1,77 @@
+# vim: smarttab tabstop=4 shiftwidth=4 expandtab softtabstop=4 filetype=python
+# vim: set syntax=python:
+import io
+import shlex
+import threading
+import functools
+import http.server
+import pytest
+import awsclient
+import warmup
+
+SITEMAP_INDEX = '''<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://example.org/sitemap.xml?page=1</loc></sitemap>
+</sitemapindex>
+'''
+
+SITEMAP = '''<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>https://example.org/</loc></url>
+  <url><loc> https://example.org/node/1 </loc><lastmod>2017-01-01</lastmod></url>
+</urlset>
+'''
+
+@pytest.fixture
+def web(tmpdir):
+    '''
+    A plain HTTP server on 127.0.0.1, serving tmpdir, like a Drupal binding on its ECS host
+    '''
+    tmpdir.join('index.html').write('home')
+    tmpdir.join('about').write('about')
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(tmpdir)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+
+def test_read_urls():
+    urlsfile = io.StringIO('# the front page\n/\n\nabout\nhttps://other.example.org/x?y=1\n')
+    assert warmup.read_urls(urlsfile, 'example.org') == ['https://example.org/', 'https://example.org/about', 'https://other.example.org/x?y=1']
+
+def test_sitemap_locs():
+    assert warmup.sitemap_locs(SITEMAP_INDEX) == (True, ['https://example.org/sitemap.xml?page=1'])
+    assert warmup.sitemap_locs(SITEMAP) == (False, ['https://example.org/', 'https://example.org/node/1'])
+
+def test_binding_url():
+    assert warmup.binding_url('https://example.org/node/1?a=b#top', 32768) == 'https://example.org:32768/node/1?a=b'
+    assert warmup.binding_url('https://example.org', 8443) == 'https://example.org:8443/'
+
+def test_script_requests_the_binding(web):
+    # the URLs are on the site's host name, but go to the binding on 127.0.0.1
+    urls = ['http://example.org/', 'http://example.org/about', 'http://example.org/missing']
+    requests = warmup.run('sh -c {0}'.format(shlex.quote(warmup.script(urls, web, 2))), 'warm up')
+    assert sorted((r.url, r.status) for r in requests) == [
+        ('http://example.org:{0}/'.format(web), 200), ('http://example.org:{0}/about'.format(web), 200), ('http://example.org:{0}/missing'.format(web), 404)]
+    assert all(r.secs >= 0 for r in requests)
+
+def test_parse_and_report(capsys):
+    requests = warmup.parse('Warning: Permanently added the host\n200 0.250 https://example.org:8443/\n503 1.500 https://example.org:8443/node/1\n')
+    assert requests == [warmup.Request('https://example.org:8443/', 200, 0.25), warmup.Request('https://example.org:8443/node/1', 503, 1.5)]
+    warmup.report({('host-1', 8443): requests})
+    assert capsys.readouterr().out == 'Warm-up:\n  host-1:8443  2 request(s), 1 failed, 1.8s of requests\n      1.50s  503  /node/1\n      0.25s  200  /\n'
+
+def test_binding_hosts(aws_stand_in):
+    instances = awsclient.call('dev', 'ec2', 'run_instances', ImageId='ami-12c6146b', MinCount=2, MaxCount=2)['Instances']
+    (one, two) = [i['InstanceId'] for i in instances]
+    hostnames = dict((i['InstanceId'], i['PublicDnsName']) for i in instances)
+    binds = {('ci-1', 8443), ('ci-1', 8444), ('ci-2', 8443), ('ci-gone', 8443)}
+    assert warmup.binding_hosts('dev', binds, {'ci-1': one, 'ci-2': two}) == sorted([(hostnames[one], 8443), (hostnames[one], 8444), (hostnames[two], 8443)])
+    assert warmup.binding_hosts('dev', set(), dict()) == []
+
+def test_disabled(monkeypatch):
+    monkeypatch.delenv('SITE_AWS_WARMUP', raising=False)
+    assert not warmup.enabled()
+    assert warmup.warm_up('dev', None, None, 'example.org') is None
+    monkeypatch.setenv('SITE_AWS_WARMUP_CONCURRENCY', 'lots')
+    with pytest.raises(Exception):
+        warmup.concurrency()